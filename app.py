@@ -18,6 +18,9 @@ load_dotenv()
 # Local application imports
 from app.models.user import User
 from app.services.database import Database
+from app.services import db_instrumentation, migrations, counters, ratings, session_store, search_index
+from app.utils.decorators import current_user
+from app.services.password_hasher import HashingOverloaded
 from config.config import Config
 from app.controllers.auth_controller import auth_bp
 from app.controllers.admin_controller import admin_bp
@@ -50,6 +53,12 @@ def create_app():
 
     # Initialize extensions
     db = Database()
+    db.init_app(app)
+    db_instrumentation.init_app(app)
+    migrations.init_app(app)
+    counters.init_app(app)
+    ratings.init_app(app)
+    session_store.init_app(app)
     csrf = CSRFProtect(app)
     socketio = SocketIO(app, cors_allowed_origins="*")
 
@@ -79,6 +88,7 @@ def create_app():
     # Create tables when the application starts
     with app.app_context():
         db.create_tables()
+    search_index.init_app(app)
 
     @app.after_request
     def add_cache_headers(response):
@@ -91,7 +101,8 @@ def create_app():
     def inject_user():
         """Inject current user into all templates"""
         if 'user_id' in session:
-            user = User.get_by_id(session['user_id'])
+            # Same request-memoised row the decorators and views use
+            user = current_user()
             return dict(current_user=user, csrf_token_value=generate_csrf())
         return dict(current_user=None, csrf_token_value=generate_csrf())
     
@@ -149,6 +160,14 @@ def create_app():
     def server_error(error):
         return render_template('errors/500.html'), 500
 
+    @app.errorhandler(HashingOverloaded)
+    def hashing_overloaded(error):
+        app.logger.warning(f"Shedding request: {error}")
+        headers = {'Retry-After': str(error.retry_after)}
+        if request.is_json:
+            return {'error': 'Service busy, please retry shortly'}, 503, headers
+        return render_template('errors/503.html'), 503, headers
+
     return app
 
 app = create_app()
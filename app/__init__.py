@@ -71,6 +71,12 @@ def create_app(config_name='default'):
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
+    
+    # Per-request query counts and Server-Timing for the SQLAlchemy engine
+    from app.services import db_instrumentation
+    db_instrumentation.init_app(app)
+    with app.app_context():
+        db_instrumentation.instrument_sqlalchemy(db.engine)
     sess.init_app(app)
     csrf.init_app(app)
     
@@ -1,11 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 from app.utils.decorators import login_required, admin_required
 from app.models.user import User
 from app.models.seller_request import SellerRequest
 from app.models.product import Product
 from app.models.order import Order
 from app.services.database import Database
+from app.services.cache import cache_stats
+from app.services.rate_limiter import limiter_stats
+from app.services.password_hasher import hasher_stats
+from app.services.otp_store import otp_stats
+from app.services.session_store import session_stats
+from app.services.search_index import index_stats, categories_changed
+from app.services.counters import counter_stats
 from app.forms import AdminNotesForm, RejectNotesForm, CategoryForm, SystemSettingsForm
+import csv
+import io
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -115,28 +124,16 @@ def manage_users():
     """Manage users"""
     role_filter = request.args.get('role')
     status_filter = request.args.get('status')
-    page = int(request.args.get('page', 1))
     per_page = 20
-    offset = (page - 1) * per_page
     
-    users = User.get_all_users(
+    # Keyset page: the cursor carries the last row's (created_at, id)
+    users = User.get_users_page(
         role=role_filter if role_filter != 'all' else None,
         status=status_filter if status_filter != 'all' else None,
-        limit=per_page,
-        offset=offset
+        cursor=request.args.get('cursor'),
+        limit=per_page
     )
     
-    # Get total count for pagination
-    total = User.get_users_count(
-        role=role_filter if role_filter != 'all' else None,
-        status=status_filter if status_filter != 'all' else None
-    )
-    
-    # Calculate pagination
-    total_pages = (total + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page < total_pages
-    
     # Get statistics for the stats cards
     total_users = User.get_users_count()
     active_users = User.get_users_count(status='active')
@@ -150,12 +147,10 @@ def manage_users():
                          users=users,
                          current_role=role_filter,
                          current_status=status_filter,
-                         current_page=page,
-                         total_pages=total_pages,
-                         has_prev=has_prev,
-                         has_next=has_next,
-                         prev_page=page-1 if has_prev else None,
-                         next_page=page+1 if has_next else None,
+                         has_prev=users.has_prev,
+                         has_next=users.has_next,
+                         prev_cursor=users.prev_cursor,
+                         next_cursor=users.next_cursor,
                          total_users=total_users,
                          active_users=active_users,
                          inactive_users=inactive_users,
@@ -239,15 +234,15 @@ def manage_products():
     """Manage all products"""
     category_filter = request.args.get('category')
     status_filter = request.args.get('status')
-    page = int(request.args.get('page', 1))
+    sort_by = request.args.get('sort', 'newest')
     per_page = 20
-    offset = (page - 1) * per_page
 
-    products = Product.list(
+    products = Product.list_page(
         category_id=int(category_filter) if category_filter else None,
         status=status_filter if status_filter != 'all' else None,
-        limit=per_page,
-        offset=offset
+        sort=sort_by,
+        cursor=request.args.get('cursor'),
+        limit=per_page
     )
 
     # Get categories for filter
@@ -258,7 +253,12 @@ def manage_products():
                          products=products,
                          categories=categories,
                          current_category=int(category_filter) if category_filter else None,
-                         current_status=status_filter)
+                         current_status=status_filter,
+                         current_sort=products.sort,
+                         has_prev=products.has_prev,
+                         has_next=products.has_next,
+                         prev_cursor=products.prev_cursor,
+                         next_cursor=products.next_cursor)
 
 @admin_bp.route('/products/<int:product_id>/toggle-status', methods=['POST'])
 @login_required
@@ -311,33 +311,22 @@ def remove_product(product_id):
 def manage_orders():
     """View all orders"""
     status_filter = request.args.get('status')
-    page = int(request.args.get('page', 1))
     per_page = 20
-    offset = (page - 1) * per_page
-
-    # Get orders with seller and user info
-    db = Database()
-    query = '''
-        SELECT o.*, u.username as customer_username, s.username as seller_username
-        FROM orders o
-        JOIN users u ON o.user_id = u.id
-        JOIN users s ON o.seller_id = s.id
-        WHERE 1=1
-    '''
-    params = []
 
-    if status_filter and status_filter != 'all':
-        query += " AND o.status = %s"
-        params.append(status_filter)
-
-    query += " ORDER BY o.created_at DESC LIMIT %s OFFSET %s"
-    params.extend([per_page, offset])
-
-    orders = db.execute_query(query, params, fetch=True)
+    # Newest first, one keyset page at a time, with seller and customer usernames
+    orders = Order.list_page(
+        status=status_filter if status_filter != 'all' else None,
+        cursor=request.args.get('cursor'),
+        limit=per_page
+    )
 
     return render_template('admin/orders.html',
                          orders=orders,
-                         current_status=status_filter)
+                         current_status=status_filter,
+                         has_prev=orders.has_prev,
+                         has_next=orders.has_next,
+                         prev_cursor=orders.prev_cursor,
+                         next_cursor=orders.next_cursor)
 
 @admin_bp.route('/orders/<int:order_id>/force-cancel', methods=['POST'])
 @login_required
@@ -364,8 +353,7 @@ def force_cancel_order(order_id):
         order_items = db.execute_query("SELECT * FROM order_items WHERE order_id = %s", (order_id,), fetch=True)
         for item in order_items:
             # Restore stock
-            db.execute_query("UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-                           (item['quantity'], item['product_id']))
+            Product.adjust_stock(item['product_id'], item['quantity'], db)
 
         flash('Order has been force cancelled successfully.', 'success')
 
@@ -399,8 +387,7 @@ def restore_order(order_id):
         order_items = db.execute_query("SELECT * FROM order_items WHERE order_id = %s", (order_id,), fetch=True)
         for item in order_items:
             # Deduct stock again
-            db.execute_query("UPDATE products SET stock_quantity = stock_quantity - %s WHERE id = %s",
-                           (item['quantity'], item['product_id']))
+            Product.adjust_stock(item['product_id'], -item['quantity'], db)
 
         flash('Order has been restored successfully.', 'success')
 
@@ -442,20 +429,23 @@ def analytics():
     previous_count = previous_month_result['count'] if previous_month_result else 1  # Avoid division by zero
     analytics['growth_rate'] = ((current_count - previous_count) / previous_count) * 100 if previous_count > 0 else 0.0
 
-    # Average rating (simplified - from order reviews if available, else default)
-    analytics['avg_rating'] = 4.2  # Placeholder - would need review system
+    # Average rating across all reviews, from the per-product aggregates
+    avg_rating_result = db.execute_query("""
+        SELECT SUM(rating_sum) * 1.0 / NULLIF(SUM(review_count), 0) as avg_rating
+        FROM products
+    """, fetch=True, fetchone=True)
+    analytics['avg_rating'] = round(float(avg_rating_result['avg_rating']), 1) if avg_rating_result and avg_rating_result['avg_rating'] else 0.0
 
     # Top products
     top_products_result = db.execute_query("""
         SELECT p.name, p.price, c.name as category,
                COUNT(oi.id) as sales_count,
                SUM(oi.price_at_time * oi.quantity) as revenue,
-               AVG(r.rating) as rating
+               p.avg_rating as rating
         FROM products p
         LEFT JOIN categories c ON p.category_id = c.id
         LEFT JOIN order_items oi ON p.id = oi.product_id
-        LEFT JOIN reviews r ON p.id = r.product_id
-        GROUP BY p.id, p.name, p.price, c.name
+        GROUP BY p.id, p.name, p.price, p.avg_rating, c.name
         ORDER BY sales_count DESC
         LIMIT 5
     """, fetch=True)
@@ -552,6 +542,22 @@ def system_settings():
                          categories=categories,
                          form=form)
 
+@admin_bp.route('/system/db-pool')
+@login_required
+@admin_required
+def db_pool_stats():
+    """Connection pool and cache statistics, used to size DB_POOL_* and caches per worker"""
+    return jsonify({
+        'pools': Database.pool_stats(),
+        'caches': cache_stats(),
+        'rate_limits': limiter_stats(),
+        'password_hashing': hasher_stats(),
+        'otp': otp_stats(),
+        'sessions': session_stats(),
+        'search_index': index_stats(),
+        'counters': counter_stats()
+    })
+
 @admin_bp.route('/bulk-actions', methods=['POST'])
 @login_required
 @admin_required
@@ -670,6 +676,53 @@ def reports():
                          product_performance=product_performance,
                          order_status_stats=order_status_stats)
 
+def _csv_response(filename, columns, rows, chunk_rows=500):
+    """Stream rows as a CSV download without holding them in memory"""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([row[column] for column in columns])
+            if count % chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@admin_bp.route('/reports/export/orders.csv')
+@login_required
+@admin_required
+def export_orders():
+    """Export every order as CSV"""
+    db = Database()
+    columns = ['id', 'user_id', 'seller_id', 'total_amount', 'status',
+               'payment_method', 'payment_status', 'created_at', 'updated_at']
+    rows = db.iter_query(f"SELECT {', '.join(columns)} FROM orders ORDER BY id")
+    return _csv_response('orders.csv', columns, rows)
+
+@admin_bp.route('/reports/export/order-items.csv')
+@login_required
+@admin_required
+def export_order_items():
+    """Export every order line as CSV"""
+    db = Database()
+    columns = ['id', 'order_id', 'product_id', 'product_name', 'quantity', 'price_at_time']
+    rows = db.iter_query("""
+        SELECT oi.id, oi.order_id, oi.product_id, p.name as product_name,
+               oi.quantity, oi.price_at_time
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        ORDER BY oi.id
+    """)
+    return _csv_response('order_items.csv', columns, rows)
+
 @admin_bp.route('/categories/add', methods=['POST'])
 @login_required
 @admin_required
@@ -684,6 +737,7 @@ def add_category():
         try:
             db.execute_query("INSERT INTO categories (name, description) VALUES (%s, %s)",
                             (name, description))
+            categories_changed()
             flash('Category added successfully!', 'success')
         except Exception as e:
             flash('Failed to add category. Name may already exist.', 'error')
@@ -706,6 +760,7 @@ def toggle_category(category_id):
             new_status = not current['is_active']
             db.execute_query("UPDATE categories SET is_active = %s WHERE id = %s",
                            (new_status, category_id))
+            categories_changed()
             status_text = "activated" if new_status else "deactivated"
             flash(f'Category {status_text} successfully!', 'success')
         else:
@@ -832,8 +887,7 @@ def user_details(user_id):
         # Get user products if seller
         products_count = 0
         if user.role == 'seller':
-            products_count_result = db.execute_query("SELECT COUNT(*) as count FROM products WHERE seller_id = %s", (user_id,), fetch=True, fetchone=True)
-            products_count = products_count_result['count'] if products_count_result else 0
+            products_count = Product.count(seller_id=user_id, status=None)
 
         created_at_str = user.created_at.strftime('%B %d, %Y') if user.created_at else 'Unknown'
         last_login_str = user.last_login.strftime('%B %d, %Y') if user.last_login else 'Never'
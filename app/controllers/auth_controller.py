@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
 from app.models.user import User
-from app.utils.decorators import anonymous_required, login_required
+from app.utils.decorators import anonymous_required, login_required, current_user, remember_user
 from app.forms import LoginForm, SignupForm, OTPVerificationForm, PasswordResetRequestForm, PasswordResetForm, ChangePasswordForm
 from app.services.email_service import EmailService
+from app.services import otp_store
+from app.services.otp_store import get_otp_store
+from app.services.session_store import regenerate_session
 import secrets
 import hashlib
 from datetime import datetime, timedelta
@@ -23,8 +26,10 @@ def login():
                 flash('Your account has been deactivated. Please contact support.', 'error')
                 return render_template('auth/login.html', form=form)
             
+            # New session id on login so a planted one is never authenticated
+            regenerate_session(session)
             session['user_id'] = user['id']
-            session['user_role'] = user['role']
+            remember_user(user)
             session.permanent = True
             
             # Redirect based on role
@@ -65,9 +70,8 @@ def signup():
             flash('An account with this email already exists.', 'error')
             return render_template('auth/signup_multi_step.html', form=form)
 
-        # Generate OTP and store in session
-        import random
-        otp_code = str(random.randint(100000, 999999))
+        # Generate OTP (kept server-side; the session cookie is readable by the client)
+        otp_code = get_otp_store().issue(email)
         session['signup_data'] = {
             'email': email,
             'password': password,
@@ -76,8 +80,7 @@ def signup():
             'phone': phone,
             'address': address,
             'country': country,
-            'city': city,
-            'otp_code': otp_code
+            'city': city
         }
 
         # Handle file upload for ID picture
@@ -165,16 +168,13 @@ def verify_otp(email):
     if form.validate_on_submit():
         otp_code = form.otp_code.data
         
-        # Debug logging
         current_app.logger.info(f"OTP verification attempt for {email}")
-        current_app.logger.info(f"Entered OTP: {otp_code}")
-        current_app.logger.info(f"Session signup_data exists: {'signup_data' in session}")
-        if 'signup_data' in session:
-            current_app.logger.info(f"Stored OTP: {session['signup_data'].get('otp_code')}")
-            current_app.logger.info(f"Email match: {session['signup_data'].get('email') == email}")
         
         # Check if OTP matches
-        if 'signup_data' in session and session['signup_data'].get('otp_code') == otp_code:
+        result = None
+        if 'signup_data' in session:
+            result = get_otp_store().verify(session['signup_data']['email'], otp_code)
+        if result == otp_store.VALID:
             # Create user account
             signup_data = session['signup_data']
             
@@ -212,6 +212,10 @@ def verify_otp(email):
                     flash('Failed to create account. Please try again.', 'error')
             except Exception as e:
                 flash('An error occurred while creating your account.', 'error')
+        elif result == otp_store.LOCKED:
+            flash('Too many incorrect attempts. Please request a new code.', 'error')
+        elif result == otp_store.EXPIRED:
+            flash('This code has expired. Please request a new code.', 'error')
         else:
             flash('Invalid OTP code. Please try again.', 'error')
     
@@ -221,12 +225,11 @@ def verify_otp(email):
 @anonymous_required
 def resend_otp():
     if 'signup_data' in session:
-        import random
-        otp_code = str(random.randint(100000, 999999))
-        session['signup_data']['otp_code'] = otp_code
+        # Replaces the previous code and resets its attempt counter
+        email = session['signup_data']['email']
+        otp_code = get_otp_store().issue(email)
         
         # Send OTP email via Email Service
-        email = session['signup_data']['email']
         if EmailService.send_otp_email(email, otp_code):
             return jsonify({'success': True})
         else:
@@ -345,7 +348,7 @@ def logout():
 @login_required
 def profile():
     """User profile management"""
-    user = User.get_by_id(session['user_id'])
+    user = current_user()
     if not user:
         flash('User not found.', 'error')
         return redirect(url_for('auth.login'))
@@ -377,7 +380,7 @@ def change_password():
     """Change user password"""
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        user = User.get_by_id(session['user_id'])
+        user = current_user()
         if not user:
             flash('User not found.', 'error')
             return redirect(url_for('auth.login'))
@@ -155,8 +155,9 @@ def checkout():
         return redirect(url_for('cart.view_cart'))
     
     # Check stock availability for all items
+    products = Product.get_many([item['product_id'] for item in cart_items])
     for item in cart_items:
-        product = Product.get_by_id(item['product_id'])
+        product = products.get(item['product_id'])
         if not product or product['status'] != 'active':
             flash(f'Product "{item["name"]}" is no longer available.', 'error')
             return redirect(url_for('cart.view_cart'))
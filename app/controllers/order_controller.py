@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from app.models.order import Order
 from app.models.user import User
 from app.models.review import Review
-from app.utils.decorators import login_required
+from app.models.product import Product
+from app.utils.decorators import login_required, current_user
 from datetime import datetime, timedelta
 
 order_bp = Blueprint('order', __name__)
@@ -51,13 +52,8 @@ def cancel_order(order_id):
         Order.update_status(order_id, 'cancelled')
         
         # Restore stock quantities
-        from app.services.database import Database
-        db = Database()
         for item in order['items']:
-            db.execute_query(
-                "UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-                (item['quantity'], item['product_id'])
-            )
+            Product.adjust_stock(item['product_id'], item['quantity'])
         
         flash('Order cancelled successfully. Stock quantities have been restored.', 'success')
     except Exception as e:
@@ -265,7 +261,7 @@ def bulk_order_action():
 @login_required 
 def order_analytics():
     """Order analytics (admin only)"""
-    user = User.get_by_id(session['user_id'])
+    user = current_user()
     if user['role'] != 'admin':
         flash('Unauthorized.', 'error')
         return redirect(url_for('user.dashboard'))
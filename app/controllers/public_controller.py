@@ -23,31 +23,19 @@ def landing():
 @public_bp.route('/products')
 def browse_products():
     """Browse all products with filtering and pagination"""
-    page = int(request.args.get('page', 1))
     category_id = request.args.get('category')
     search = request.args.get('search', '').strip()
     per_page = Config.PRODUCTS_PER_PAGE
-    offset = (page - 1) * per_page
     
-    # Get products
-    products = Product.list(
+    # Get products (a keyset page; the cursor marks where the last page ended) and their total
+    products = Product.list_page(
         category_id=int(category_id) if category_id else None,
         search=search if search else None,
+        cursor=request.args.get('cursor'),
         limit=per_page,
-        offset=offset
+        with_total=True
     )
     
-    # Get total count for pagination
-    total = Product.count(
-        category_id=int(category_id) if category_id else None,
-        search=search if search else None
-    )
-    
-    # Calculate pagination info
-    total_pages = (total + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page < total_pages
-    
     # Get categories for filter
     db = Database()
     categories = db.execute_query("SELECT * FROM categories WHERE is_active = 1", fetch=True)
@@ -55,15 +43,13 @@ def browse_products():
     return render_template('public/products.html',
                          products=products,
                          categories=categories,
-                         current_page=page,
-                         total_pages=total_pages,
-                         has_prev=has_prev,
-                         has_next=has_next,
-                         prev_page=page-1 if has_prev else None,
-                         next_page=page+1 if has_next else None,
+                         has_prev=products.has_prev,
+                         has_next=products.has_next,
+                         prev_cursor=products.prev_cursor,
+                         next_cursor=products.next_cursor,
                          category_id=int(category_id) if category_id else None,
                          search=search,
-                         total_products=total)
+                         total_products=products.total)
 
 @public_bp.route('/product/<int:product_id>')
 def product_detail(product_id):
@@ -91,10 +77,8 @@ def product_detail(product_id):
 @public_bp.route('/category/<int:category_id>')
 def category_products(category_id):
     """Products in a specific category"""
-    page = int(request.args.get('page', 1))
     search = request.args.get('search', '').strip()
     per_page = Config.PRODUCTS_PER_PAGE
-    offset = (page - 1) * per_page
     
     # Get category info
     db = Database()
@@ -103,36 +87,24 @@ def category_products(category_id):
     if not category:
         return render_template('public/404.html'), 404
     
-    # Get products in this category
-    products = Product.list(
+    # Get products in this category, with the total for the header
+    products = Product.list_page(
         category_id=category_id,
         search=search if search else None,
+        cursor=request.args.get('cursor'),
         limit=per_page,
-        offset=offset
+        with_total=True
     )
     
-    # Get total count for pagination
-    total = Product.count(
-        category_id=category_id,
-        search=search if search else None
-    )
-    
-    # Calculate pagination info
-    total_pages = (total + per_page - 1) // per_page
-    has_prev = page > 1
-    has_next = page < total_pages
-    
     return render_template('public/category_products.html',
                          products=products,
                          category=category,
-                         current_page=page,
-                         total_pages=total_pages,
-                         has_prev=has_prev,
-                         has_next=has_next,
-                         prev_page=page-1 if has_prev else None,
-                         next_page=page+1 if has_next else None,
+                         has_prev=products.has_prev,
+                         has_next=products.has_next,
+                         prev_cursor=products.prev_cursor,
+                         next_cursor=products.next_cursor,
                          search=search,
-                         total_products=total)
+                         total_products=products.total)
 
 @public_bp.route('/about')
 def about():
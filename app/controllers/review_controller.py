@@ -348,11 +348,10 @@ def review_analytics():
     
     # Most reviewed products
     most_reviewed = db.execute_query("""
-        SELECT p.name, p.id, COUNT(r.id) as review_count, AVG(r.rating) as avg_rating
+        SELECT p.name, p.id, p.review_count, p.avg_rating
         FROM products p
-        JOIN reviews r ON p.id = r.product_id
-        GROUP BY p.id
-        ORDER BY review_count DESC
+        WHERE p.review_count > 0
+        ORDER BY p.review_count DESC, p.id DESC
         LIMIT 10
     """, fetch=True)
     
@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from app.utils.decorators import login_required, seller_required
+from app.utils.decorators import login_required, seller_required, current_user
 from app.models.user import User
 from app.models.product import Product
 from app.models.order import Order
@@ -376,15 +376,11 @@ def orders():
     seller_id = session['user_id']
     status = request.args.get('status')
     orders = Order.list_for_seller(seller_id, status=status)
-    # Add rider info to orders
-    db = Database()
+    # Add rider info to orders, loading all riders in one query
+    riders = User.get_many([order['rider_id'] for order in orders])
     for order in orders:
         if order['rider_id']:
-            rider = db.execute_query(
-                "SELECT first_name, last_name, phone FROM users WHERE id = %s",
-                (order['rider_id'],),
-                fetch=True, fetchone=True
-            )
+            rider = riders.get(order['rider_id'])
             if rider:
                 order['rider_name'] = f"{rider['first_name']} {rider['last_name']}"
                 order['rider_phone'] = rider['phone'] or ''
@@ -513,7 +509,7 @@ def order_details(order_id):
 @login_required
 def apply():
     """Apply to become a seller"""
-    user = User.get_by_id(session['user_id'])
+    user = current_user()
     
     # Check if user is already a seller
     if user['role'] == 'seller':
@@ -571,11 +567,9 @@ def analytics():
                COUNT(oi.id) as times_ordered,
                SUM(oi.quantity) as total_sold,
                SUM(oi.quantity * oi.price_at_time) as total_revenue,
-               AVG(r.rating) as avg_rating,
-               COUNT(r.id) as review_count
+               p.avg_rating, p.review_count
         FROM products p
         LEFT JOIN order_items oi ON p.id = oi.product_id
-        LEFT JOIN reviews r ON p.id = r.product_id
         WHERE p.seller_id = %s
         GROUP BY p.id
         ORDER BY total_revenue DESC
@@ -4,7 +4,7 @@ from app.models.cart import Cart
 from app.models.order import Order
 from app.models.seller_request import SellerRequest
 from app.models.review import Review
-from app.utils.decorators import login_required
+from app.utils.decorators import login_required, current_user
 from app.forms import BecomeSellerForm, CheckoutForm, ReviewForm, CartUpdateForm, CartAddForm, ProfileUpdateForm, ChangePasswordForm
 from werkzeug.utils import secure_filename
 import os
@@ -16,7 +16,7 @@ user_bp = Blueprint('user', __name__)
 @login_required
 def dashboard():
     """User dashboard"""
-    user = User.get_by_id(session['user_id'])
+    user = current_user()
     if user['role'] != 'user':
         return redirect(url_for('public.landing'))
     
@@ -62,7 +62,7 @@ class Cart:
             JOIN products p ON c.product_id = p.id
             WHERE c.user_id = %s
         '''
-        return db.execute_query(query, (user_id,), fetch=True)
+        return db.execute_query(query, (user_id,), fetch=True, prepared=True)
 
     @classmethod
     def get_total(cls, user_id):
@@ -1,4 +1,6 @@
 from app.services.database import Database
+from app.models.user import User
+from app.models.order import Order
 
 class Delivery:
     @staticmethod
@@ -6,23 +8,18 @@ class Delivery:
         """Create a new delivery assignment"""
         db = Database()
         try:
-            # Insert delivery with initial status and timestamp
-            db.execute_query(
-                """
-                INSERT INTO deliveries (order_id, rider_id, status, delivery_notes, assigned_at)
-                VALUES (%s, %s, 'assigned', %s, CURRENT_TIMESTAMP)
-                """,
-                (order_id, rider_id, delivery_notes)
-            )
-            # Update order with rider_id and status to shipped
-            db.execute_query(
-                """
-                UPDATE orders
-                SET rider_id = %s, status = 'shipped'
-                WHERE id = %s
-                """,
-                (rider_id, order_id)
-            )
+            # Delivery row and order update commit together
+            with db.transaction():
+                # Insert delivery with initial status and timestamp
+                db.execute_query(
+                    """
+                    INSERT INTO deliveries (order_id, rider_id, status, delivery_notes, assigned_at)
+                    VALUES (%s, %s, 'assigned', %s, CURRENT_TIMESTAMP)
+                    """,
+                    (order_id, rider_id, delivery_notes)
+                )
+                # Update order with rider_id and status to shipped
+                Order.update_status(order_id, 'shipped', 'rider_id = %s', (rider_id,))
             return True
         except Exception as e:
             print(f"Error creating delivery: {e}")
@@ -110,14 +107,10 @@ class Delivery:
         query += " ORDER BY d.assigned_at DESC"
         
         results = db.execute_query(query, tuple(params), fetch=True)
+        # Add customer details, loading all customers in one query
+        customers = User.get_many([delivery['user_id'] for delivery in results])
         for delivery in results:
-            # Add customer details
-            customer = db.execute_query(
-                "SELECT first_name, last_name, phone FROM users WHERE id = %s",
-                (delivery['user_id'],),
-                fetch=True,
-                fetchone=True
-            )
+            customer = customers.get(delivery['user_id'])
             if customer:
                 delivery['customer_name'] = f"{customer['first_name']} {customer['last_name']}"
                 delivery['customer_phone'] = customer['phone'] or ''
@@ -131,96 +124,81 @@ class Delivery:
         """Update delivery status (picked_up, on_the_way, delivered, failed)"""
         db = Database()
         try:
-            # Update delivery with status and optional notes/timestamp
-            timestamp_field = None
-            if status == 'picked_up':
-                timestamp_field = 'picked_up_at = CURRENT_TIMESTAMP'
-            elif status == 'on_the_way':
-                timestamp_field = 'on_the_way_at = CURRENT_TIMESTAMP'
-            elif status == 'delivered':
-                timestamp_field = 'delivered_at = CURRENT_TIMESTAMP'
+            # Delivery and order status change commit together
+            with db.transaction():
+                # Update delivery with status and optional notes/timestamp
+                timestamp_field = None
+                if status == 'picked_up':
+                    timestamp_field = 'picked_up_at = CURRENT_TIMESTAMP'
+                elif status == 'on_the_way':
+                    timestamp_field = 'on_the_way_at = CURRENT_TIMESTAMP'
+                elif status == 'delivered':
+                    timestamp_field = 'delivered_at = CURRENT_TIMESTAMP'
 
-            if notes:
-                if timestamp_field:
-                    db.execute_query(
-                        f"""
-                        UPDATE deliveries
-                        SET status = %s, delivery_notes = %s, {timestamp_field}
-                        WHERE id = %s
-                        """,
-                        (status, notes, delivery_id)
-                    )
+                if notes:
+                    if timestamp_field:
+                        db.execute_query(
+                            f"""
+                            UPDATE deliveries
+                            SET status = %s, delivery_notes = %s, {timestamp_field}
+                            WHERE id = %s
+                            """,
+                            (status, notes, delivery_id)
+                        )
+                    else:
+                        db.execute_query(
+                            """
+                            UPDATE deliveries
+                            SET status = %s, delivery_notes = %s
+                            WHERE id = %s
+                            """,
+                            (status, notes, delivery_id)
+                        )
                 else:
-                    db.execute_query(
-                        """
-                        UPDATE deliveries
-                        SET status = %s, delivery_notes = %s
-                        WHERE id = %s
-                        """,
-                        (status, notes, delivery_id)
-                    )
-            else:
-                if timestamp_field:
-                    db.execute_query(
-                        f"""
-                        UPDATE deliveries
-                        SET status = %s, {timestamp_field}
-                        WHERE id = %s
-                        """,
-                        (status, delivery_id)
-                    )
-                else:
-                    db.execute_query(
-                        """
-                        UPDATE deliveries
-                        SET status = %s
-                        WHERE id = %s
-                        """,
-                        (status, delivery_id)
-                    )
+                    if timestamp_field:
+                        db.execute_query(
+                            f"""
+                            UPDATE deliveries
+                            SET status = %s, {timestamp_field}
+                            WHERE id = %s
+                            """,
+                            (status, delivery_id)
+                        )
+                    else:
+                        db.execute_query(
+                            """
+                            UPDATE deliveries
+                            SET status = %s
+                            WHERE id = %s
+                            """,
+                            (status, delivery_id)
+                        )
 
-            # Update order status accordingly
-            delivery = db.execute_query(
-                "SELECT order_id FROM deliveries WHERE id = %s",
-                (delivery_id,),
-                fetch=True,
-                fetchone=True
-            )
-            if delivery:
-                order_id = delivery['order_id']
-                order_status_map = {
-                    'picked_up': 'picked_up',
-                    'on_the_way': 'on_the_way',
-                    'delivered': 'delivered',
-                    'failed': 'cancelled'
-                }
-                new_order_status = order_status_map.get(status, 'shipped')
+                # Update order status accordingly
+                delivery = db.execute_query(
+                    "SELECT order_id FROM deliveries WHERE id = %s",
+                    (delivery_id,),
+                    fetch=True,
+                    fetchone=True
+                )
+                if delivery:
+                    order_id = delivery['order_id']
+                    order_status_map = {
+                        'picked_up': 'picked_up',
+                        'on_the_way': 'on_the_way',
+                        'delivered': 'delivered',
+                        'failed': 'cancelled'
+                    }
+                    new_order_status = order_status_map.get(status, 'shipped')
 
-                # Set order timestamp if applicable
-                order_timestamp_field = None
-                if status == 'picked_up':
-                    order_timestamp_field = 'picked_up_at = CURRENT_TIMESTAMP'
-                elif status == 'delivered':
-                    order_timestamp_field = 'delivered_at = CURRENT_TIMESTAMP'
+                    # Set order timestamp if applicable
+                    order_timestamp_field = None
+                    if status == 'picked_up':
+                        order_timestamp_field = 'picked_up_at = CURRENT_TIMESTAMP'
+                    elif status == 'delivered':
+                        order_timestamp_field = 'delivered_at = CURRENT_TIMESTAMP'
 
-                if order_timestamp_field:
-                    db.execute_query(
-                        f"""
-                        UPDATE orders
-                        SET status = %s, {order_timestamp_field}
-                        WHERE id = %s
-                        """,
-                        (new_order_status, order_id)
-                    )
-                else:
-                    db.execute_query(
-                        """
-                        UPDATE orders
-                        SET status = %s
-                        WHERE id = %s
-                        """,
-                        (new_order_status, order_id)
-                    )
+                    Order.update_status(order_id, new_order_status, order_timestamp_field or '')
 
             return True
         except Exception as e:
@@ -232,33 +210,33 @@ class Delivery:
         """Assign or change rider for an order"""
         db = Database()
         try:
-            # Check if delivery exists
-            existing = db.execute_query("SELECT id FROM deliveries WHERE order_id = %s", (order_id,), fetch=True, fetchone=True)
-            if existing:
-                # Update existing delivery
-                db.execute_query(
-                    "UPDATE deliveries SET rider_id = %s, delivery_notes = %s WHERE order_id = %s",
-                    (rider_id, delivery_notes, order_id)
-                )
-            else:
-                # Create new delivery
-                db.execute_query(
-                    """
-                    INSERT INTO deliveries (order_id, rider_id, status, delivery_notes, assigned_at)
-                    VALUES (%s, %s, 'assigned', %s, CURRENT_TIMESTAMP)
-                    """,
-                    (order_id, rider_id, delivery_notes)
-                )
+            # Delivery upsert and order update commit together
+            with db.transaction():
+                # Check if delivery exists
+                existing = db.execute_query("SELECT id FROM deliveries WHERE order_id = %s", (order_id,), fetch=True, fetchone=True)
+                if existing:
+                    # Update existing delivery
+                    db.execute_query(
+                        "UPDATE deliveries SET rider_id = %s, delivery_notes = %s WHERE order_id = %s",
+                        (rider_id, delivery_notes, order_id)
+                    )
+                else:
+                    # Create new delivery
+                    db.execute_query(
+                        """
+                        INSERT INTO deliveries (order_id, rider_id, status, delivery_notes, assigned_at)
+                        VALUES (%s, %s, 'assigned', %s, CURRENT_TIMESTAMP)
+                        """,
+                        (order_id, rider_id, delivery_notes)
+                    )
 
-            # Update order with rider_id, set status to shipped if not already shipped or later
-            db.execute_query(
-                """
-                UPDATE orders
-                SET rider_id = %s, status = CASE WHEN status NOT IN ('shipped', 'on_the_way', 'delivered') THEN 'shipped' ELSE status END
-                WHERE id = %s
-                """,
-                (rider_id, order_id)
-            )
+                # Update order with rider_id, set status to shipped if not already shipped or later
+                order = db.execute_query(
+                    "SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,), fetch=True, fetchone=True
+                )
+                if order:
+                    status = order['status'] if order['status'] in ('shipped', 'on_the_way', 'delivered') else 'shipped'
+                    Order.update_status(order_id, status, 'rider_id = %s', (rider_id,))
             return True
         except Exception as e:
             print(f"Error assigning rider: {e}")
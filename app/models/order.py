@@ -1,5 +1,28 @@
 from app.services.database import Database
+from app.services.loaders import BatchLoader, in_clause
 from app.models.cart import Cart
+from app.models.product import Product
+from app.services import search_index, counters, listing
+
+def _fetch_order_items(order_ids):
+    db = Database()
+    rows = db.execute_query(
+        f"""
+        SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, oi.price_at_time,
+               p.name, p.image_url FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN ({in_clause(order_ids)})
+        ORDER BY oi.order_id, oi.id
+        """,
+        order_ids,
+        fetch=True,
+    )
+    items_by_order = {order_id: [] for order_id in order_ids}
+    for row in rows:
+        items_by_order[row['order_id']].append(row)
+    return items_by_order
+
+_order_items_loader = BatchLoader('order_items', _fetch_order_items)
 
 class Order:
     """Order model to handle order creation and management"""
@@ -7,39 +30,45 @@ class Order:
     @classmethod
     def create_from_cart(cls, user_id, shipping_address, payment_method='cod', notes=None):
         db = Database()
-        items = Cart.get_user_cart(user_id)
-        if not items:
-            return None
-        # Group by seller - create one order per seller like Shopee
-        orders_created = []
-        items_by_seller = {}
-        for item in items:
-            items_by_seller.setdefault(item['seller_id'], []).append(item)
-        for seller_id, s_items in items_by_seller.items():
-            total = sum(float(i['price']) * i['quantity'] for i in s_items)
-            order_id = db.execute_query(
-                """
-                INSERT INTO orders (user_id, seller_id, total_amount, shipping_address, payment_method, notes)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (user_id, seller_id, total, shipping_address, payment_method, notes),
-            )
-            for i in s_items:
-                db.execute_query(
+        # One unit of work: all orders, items, stock updates and the cart
+        # clear commit together or not at all
+        with db.transaction():
+            items = Cart.get_user_cart(user_id)
+            if not items:
+                return None
+            # Group by seller - create one order per seller like Shopee
+            orders_created = []
+            items_by_seller = {}
+            for item in items:
+                items_by_seller.setdefault(item['seller_id'], []).append(item)
+            for seller_id, s_items in items_by_seller.items():
+                total = sum(float(i['price']) * i['quantity'] for i in s_items)
+                order_id = db.execute_query(
+                    """
+                    INSERT INTO orders (user_id, seller_id, total_amount, shipping_address, payment_method, notes)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    (user_id, seller_id, total, shipping_address, payment_method, notes),
+                )
+                db.execute_many(
                     """
                     INSERT INTO order_items (order_id, product_id, quantity, price_at_time)
                     VALUES (%s, %s, %s, %s)
                     """,
-                    (order_id, i['product_id'], i['quantity'], i['price']),
+                    [(order_id, i['product_id'], i['quantity'], i['price']) for i in s_items],
                 )
-                # reduce stock
-                db.execute_query(
-                    "UPDATE products SET stock_quantity = stock_quantity - %s WHERE id = %s",
-                    (i['quantity'], i['product_id']),
-                )
-            orders_created.append(order_id)
-        # clear cart
-        Cart.clear_cart(user_id)
+                for i in s_items:
+                    # reduce stock
+                    Product.adjust_stock(i['product_id'], -i['quantity'], db)
+                orders_created.append(order_id)
+            # One adjust for every order: a call per seller would pick a
+            # slot each, and two multi-seller checkouts could deadlock
+            counters.adjust(db, 'orders', added=[{'status': 'pending'}] * len(orders_created))
+            # clear cart
+            Cart.clear_cart(user_id)
+        # After commit, so a rolled back checkout never weights suggestions
+        for item in items:
+            search_index.product_sold(item['product_id'], item['quantity'])
         return orders_created
 
     @classmethod
@@ -93,25 +122,37 @@ class Order:
             query += " LIMIT %s OFFSET %s"
             params.extend([limit, offset])
         orders = db.execute_query(query, params, fetch=True)
-        # Add items for each order
+        # Add items for all orders with one query
+        items_by_order = cls.get_items_for_orders([order['id'] for order in orders])
         for order in orders:
-            items = db.execute_query(
-                """
-                SELECT oi.id, oi.order_id, oi.product_id, oi.quantity, oi.price_at_time,
-                       p.name, p.image_url FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-                """,
-                (order['id'],),
-                fetch=True,
-            )
-            order['items'] = items
+            order['items'] = items_by_order.get(order['id'], [])
         return orders
 
     @classmethod
-    def update_status(cls, order_id, status):
+    def list_page(cls, status=None, user_id=None, seller_id=None, sort='newest', cursor=None, limit=20):
+        """One keyset page of orders with customer and seller usernames"""
+        return listing.ORDERS.page(sort, cursor, limit, status=status, user_id=user_id, seller_id=seller_id)
+
+    @classmethod
+    def get_items_for_orders(cls, order_ids):
+        """Get order items for many orders in one query, as a dict keyed by order ID"""
+        return _order_items_loader.load_many(order_ids)
+
+    @classmethod
+    def update_status(cls, order_id, status, assignments='', params=()):
+        """Set an order's status, keeping the status counters in step
+
+        ``assignments``/``params`` set further columns in the same UPDATE
+        (e.g. ``"rider_id = %s"``).
+        """
         db = Database()
-        db.execute_query("UPDATE orders SET status = %s WHERE id = %s", (status, order_id))
+        extra = f", {assignments}" if assignments else ''
+        with db.transaction():
+            before = counters.current(db, 'orders', order_id)
+            db.execute_query(f"UPDATE orders SET status = %s{extra} WHERE id = %s",
+                             (status, *params, order_id))
+            if before:
+                counters.adjust(db, 'orders', removed=[before], added=[{'status': status}])
         return True
 
     @classmethod
@@ -122,12 +163,5 @@ class Order:
 
     @classmethod
     def count(cls, status=None):
-        db = Database()
-        query = "SELECT COUNT(*) as count FROM orders WHERE 1=1"
-        params = []
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        res = db.execute_query(query, params, fetch=True, fetchone=True)
-        return res['count'] if res else 0
+        return listing.ORDERS.count(status=status)
 
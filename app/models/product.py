@@ -1,4 +1,145 @@
+from config.config import Config
 from app.services.database import Database
+from app.services.loaders import BatchLoader, in_clause
+from app.services.cache import TaggedCache
+from app.services import search_index, counters, listing
+from app.services.facets import facet_counts
+from app.services.migrations import register_hot_query
+from app.utils.pagination import KEYSETS, Page, fetch_page, decode_cursor, encode_cursor, encode_offset, decode_offset
+
+# InnoDB ignores words shorter than innodb_ft_min_token_size (default 3)
+FULLTEXT_MIN_TERM = 3
+
+SEARCH_SORTS = {
+    'price_low': "p.price ASC, p.id ASC",
+    'price_high': "p.price DESC, p.id DESC",
+    'rating': "p.avg_rating DESC, p.review_count DESC, p.id DESC",
+    'newest': "p.created_at DESC, p.id DESC",
+    'name': "p.name ASC, p.id ASC",
+    'relevance': "relevance_score DESC, p.created_at DESC, p.id DESC",
+}
+
+def _prefix_like(column, word):
+    """(sql, params) true when some word of ``column`` starts with ``word``"""
+    # Words start the text or follow a space or hyphen ("grain-free")
+    return (f"({column} LIKE %s OR {column} LIKE %s OR {column} LIKE %s)",
+            [f"{word}%", f"% {word}%", f"%-{word}%"])
+
+def _category_ids(db, words):
+    """For each query word, the ids of categories with a name word starting with it"""
+    names = [(row['id'], search_index.tokenize(row['name']))
+             for row in db.execute_query("SELECT id, name FROM categories", fetch=True)]
+    return [[category_id for category_id, tokens in names if any(token.startswith(word) for token in tokens)]
+            for word in words]
+
+def _text_match(db, query):
+    """(score, score params, source, source params, condition, condition params) for a search query
+
+    The same rule as the in-process index: every query word must start a word
+    of the name, description or category name. ``source`` replaces
+    ``products p`` in the FROM clause.
+    """
+    words = search_index.tokenize(query)
+    if not words:
+        return "0", [], "products p", [], None, []
+    return _text_search(words, _category_ids(db, words), db.dialect.supports_fulltext)
+
+def _text_search(words, category_ids, fulltext):
+    """``_text_match`` for tokenized ``words`` and the categories each word matches
+
+    With FULLTEXT, words of FULLTEXT_MIN_TERM letters or more are matched
+    with MATCH() and ranked by its score. The candidate rows come from a
+    UNION of the FULLTEXT index and, when every such word names a category,
+    those categories' products. An OR of the two in the WHERE clause would
+    keep MySQL from reading the FULLTEXT index and scan ``products``. Other
+    words, and every word without FULLTEXT, go through prefix LIKEs scored
+    like the index: name 3, description 2, category 1.
+    """
+    conditions, params = [], []
+    scores, score_params = [], []
+    indexed = []
+    for word, categories in zip(words, category_ids):
+        category = f"p.category_id IN ({in_clause(categories)})" if categories else None
+        if fulltext and len(word) >= FULLTEXT_MIN_TERM:
+            indexed.append((word, categories))
+            condition, condition_params = "MATCH(p.name, p.description) AGAINST (%s IN BOOLEAN MODE)", [f"+{word}*"]
+        else:
+            name, name_params = _prefix_like('p.name', word)
+            description, description_params = _prefix_like('p.description', word)
+            condition, condition_params = f"{name} OR {description}", name_params + description_params
+            scores.append(f"CASE WHEN {name} THEN 3 WHEN {description} THEN 2"
+                          f"{f' WHEN {category} THEN 1' if category else ''} ELSE 0 END")
+            score_params += condition_params + categories
+        if category:
+            condition, condition_params = f"{condition} OR {category}", condition_params + categories
+        conditions.append(f"({condition})")
+        params += condition_params
+    source, source_params = "products p", []
+    if indexed:
+        required = [f"+{word}*" for word, categories in indexed if not categories]
+        optional = [f"{word}*" for word, categories in indexed if categories]
+        terms = ' '.join(required + optional)
+        branches = ["SELECT id FROM products WHERE MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)"]
+        source_params.append(terms)
+        if not required:
+            # Matching every FULLTEXT word through the category name alone
+            shared = sorted(set.intersection(*(set(categories) for word, categories in indexed)))
+            if shared:
+                branches.append(f"SELECT id FROM products WHERE category_id IN ({in_clause(shared)})")
+                source_params += shared
+        source = f"({' UNION '.join(branches)}) m JOIN products p ON p.id = m.id"
+        scores.insert(0, "MATCH(p.name, p.description) AGAINST (%s IN BOOLEAN MODE)")
+        score_params.insert(0, ' '.join(f"{word}*" for word, categories in indexed))
+    return ' + '.join(scores), score_params, source, source_params, ' AND '.join(conditions), params
+
+def _ranked_sql(score, source, where):
+    """Ids and relevance of matching products in result order, with the match count"""
+    return f'''
+        SELECT p.id,
+               {score} as relevance_score,
+               COUNT(*) OVER () as total_count
+        FROM {source}
+        WHERE {' AND '.join(where)}
+    '''
+
+def _register_search_query():
+    """The FULLTEXT search as search_ranked runs it, for ``flask schema explain``"""
+    score, score_params, source, source_params, match, match_params = _text_search(['dog'], [[1]], True)
+    sql = _ranked_sql(score, source, ["p.status = 'active'", match])
+    register_hot_query(
+        'product_search', f"{sql} ORDER BY {SEARCH_SORTS['relevance']} LIMIT 1000",
+        score_params + source_params + match_params,
+        # The materialized candidate ids are read in full by design
+        allow_scan=('<derived2>', '<union2,3>'), fulltext=True)
+
+_register_search_query()
+
+def _fetch_products(product_ids):
+    db = Database()
+    query = f'''
+        SELECT p.*, c.name as category_name, u.username as seller_username
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        JOIN users u ON p.seller_id = u.id
+        WHERE p.id IN ({in_clause(product_ids)})
+    '''
+    return {row['id']: row for row in db.execute_query(query, product_ids, fetch=True)}
+
+_products_loader = BatchLoader('products', _fetch_products)
+
+# Normalised query + filters -> (ranked (id, relevance) pairs, total). Tagged
+# 'products' or 'products:category:<id>', plus 'reviews' when ratings matter
+_search_cache = TaggedCache('search', maxsize=Config.SEARCH_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL)
+
+def _search_tags(category_id, min_rating, sort_by):
+    tags = [f"products:category:{category_id}" if category_id else 'products']
+    if min_rating is not None or sort_by == 'rating':
+        tags.append('reviews')
+    return tags
+
+def _products_changed(*category_ids):
+    """Drop cached searches that a product in these categories could appear in"""
+    _search_cache.invalidate('products', *{f"products:category:{c}" for c in category_ids if c})
 
 class Product:
     """Product model for product operations"""
@@ -10,7 +151,12 @@ class Product:
             INSERT INTO products (seller_id, category_id, name, description, price, stock_quantity, image_url)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         '''
-        product_id = db.execute_query(query, (seller_id, category_id, name, description, price, stock_quantity, image_url))
+        with db.transaction():
+            product_id = db.execute_query(query, (seller_id, category_id, name, description, price, stock_quantity, image_url))
+            # New products start out active (column default)
+            counters.adjust(db, 'products', added=[{'category_id': category_id, 'seller_id': seller_id, 'status': 'active'}])
+        search_index.product_saved(product_id)
+        _products_changed(category_id)
         return cls.get_by_id(product_id)
     
     @classmethod
@@ -23,7 +169,12 @@ class Product:
             JOIN users u ON p.seller_id = u.id
             WHERE p.id = %s
         '''
-        return db.execute_query(query, (product_id,), fetch=True, fetchone=True)
+        return db.execute_query(query, (product_id,), fetch=True, fetchone=True, prepared=True)
+    
+    @classmethod
+    def get_many(cls, product_ids):
+        """Get products by ID in one query, as a dict keyed by ID"""
+        return _products_loader.load_many(product_ids)
     
     @classmethod
     def update(cls, product_id, **kwargs):
@@ -37,66 +188,198 @@ class Product:
                 values.append(v)
         if not fields:
             return False
+        searchable = any(k in search_index.INDEXED_FIELDS for k in kwargs)
+        # A category move must also invalidate searches in the old category
+        before = _products_loader.load(product_id) if searchable else None
         values.append(product_id)
         query = f"UPDATE products SET {', '.join(fields)} WHERE id = %s"
-        db.execute_query(query, values)
+        if 'category_id' in kwargs or 'status' in kwargs:
+            with db.transaction():
+                counted = counters.current(db, 'products', product_id)
+                db.execute_query(query, values)
+                if counted:
+                    moved = {k: kwargs[k] for k in ('category_id', 'status') if k in kwargs}
+                    counters.adjust(db, 'products', removed=[counted], added=[dict(counted, **moved)])
+        else:
+            db.execute_query(query, values)
+        _products_loader.clear(product_id)
+        search_index.product_saved(product_id, kwargs)
+        if searchable:
+            _products_changed(before['category_id'] if before else None, kwargs.get('category_id'))
         return True
     
+    @classmethod
+    def adjust_stock(cls, product_id, quantity, db=None):
+        """Add ``quantity`` (negative to take stock away) to a product's stock"""
+        db = db or Database()
+        db.execute_query("UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
+                         (quantity, product_id))
+        _products_loader.clear(product_id)
+    
     @classmethod
     def delete(cls, product_id):
         db = Database()
+        before = _products_loader.load(product_id)
         query = "DELETE FROM products WHERE id = %s"
-        db.execute_query(query, (product_id,))
+        with db.transaction():
+            counted = counters.current(db, 'products', product_id)
+            db.execute_query(query, (product_id,))
+            counters.adjust(db, 'products', removed=[counted])
+        _products_loader.clear(product_id)
+        search_index.product_deleted(product_id)
+        _products_changed(before['category_id'] if before else None)
         return True
     
+    @classmethod
+    def deleted_elsewhere(cls, products):
+        """Hook for products removed by a cascade: drop ``products`` (id, category_id rows) from caches and the index"""
+        for product in products:
+            _products_loader.clear(product['id'])
+            search_index.product_deleted(product['id'])
+        if products:
+            _products_changed(*{product['category_id'] for product in products})
+
+    @classmethod
+    def ratings_changed(cls):
+        """Hook for review writes: drop cached searches filtered or sorted by rating"""
+        _search_cache.invalidate('reviews')
+    
     @classmethod
     def list(cls, category_id=None, search=None, seller_id=None, status='active', limit=None, offset=0):
+        return listing.PRODUCTS.fetch('newest', limit, offset, category_id=category_id, search=search,
+                                      seller_id=seller_id, status=status)
+
+    @classmethod
+    def list_page(cls, category_id=None, search=None, seller_id=None, status='active',
+                  sort='newest', cursor=None, limit=20, min_price=None, max_price=None, with_total=False):
+        """One keyset page of ``list`` in ``sort`` order (see app.services.listing)"""
+        return listing.PRODUCTS.page(sort, cursor, limit, with_total=with_total, category_id=category_id,
+                                     search=search, seller_id=seller_id, status=status,
+                                     min_price=min_price, max_price=max_price)
+    
+    @classmethod
+    def price_range(cls, category_id=None, search=None, status='active'):
+        """Lowest and highest price among the matching products"""
+        return listing.PRODUCTS.aggregate("MIN(p.price) as min_price, MAX(p.price) as max_price",
+                                          category_id=category_id, search=search, status=status)
+    
+    @classmethod
+    def _search_filters(cls, db, query, category_id, min_price, max_price, min_rating):
+        """(score, score params, source, conditions, params of the source and conditions)"""
+        where = ["p.status = 'active'"]
+        score, params, source, source_params, match, match_params = _text_match(db, query)
+        where_params = source_params + match_params
+        if match:
+            where.append(match)
+        if category_id:
+            where.append("p.category_id = %s")
+            where_params.append(category_id)
+        if min_price is not None:
+            where.append("p.price >= %s")
+            where_params.append(min_price)
+        if max_price is not None:
+            where.append("p.price <= %s")
+            where_params.append(max_price)
+        if min_rating is not None:
+            # Maintained on the product row (see app.services.ratings)
+            where.append("p.avg_rating >= %s")
+            where_params.append(min_rating)
+        return score, params, source, where, where_params
+
+    @classmethod
+    def search_ranked(cls, query='', category_id=None, min_price=None, max_price=None, min_rating=None,
+                      sort_by='relevance', limit=1000):
+        """The first ``limit`` matching ids with their relevance, in result order, plus the total"""
+        index = search_index.ready_index()
+        if index is not None and min_rating is None and sort_by != 'rating':
+            return index.search(query, category_id=category_id, min_price=min_price,
+                                max_price=max_price, sort_by=sort_by, limit=limit)
         db = Database()
-        query = '''
-            SELECT p.*, c.name as category_name, u.username as seller_username
-            FROM products p
+        score, params, source, where, where_params = cls._search_filters(
+            db, query, category_id, min_price, max_price, min_rating)
+        sql = _ranked_sql(score, source, where)
+        sql += f" ORDER BY {SEARCH_SORTS.get(sort_by, SEARCH_SORTS['relevance'])} LIMIT %s"
+        rows = db.execute_query(sql, params + where_params + [limit], fetch=True)
+        total = rows[0]['total_count'] if rows else 0
+        return [(row['id'], row['relevance_score']) for row in rows], total
+
+    @classmethod
+    def search_cached(cls, query='', category_id=None, min_price=None, max_price=None, min_rating=None,
+                      sort_by='relevance', limit=20, cursor=None):
+        """A Page of search results through the result cache
+
+        Pages within the cached ranking are slices of it. Past its end, sorts
+        with a keyset (newest, price, name) go on as keyset pages from the
+        database; relevance and rating results stop at SEARCH_CACHE_MAX_IDS.
+        """
+        query = ' '.join(query.lower().split())
+        if sort_by in KEYSETS and decode_cursor(cursor, sort_by) is not None:
+            return cls._search_keyset(query, category_id, min_price, max_price, min_rating, sort_by, limit, cursor)
+        key = (query, category_id, min_price, max_price, min_rating, sort_by)
+        cached = _search_cache.get(key)
+        if cached is None:
+            tags = _search_tags(category_id, min_rating, sort_by)
+            versions = _search_cache.tag_versions(tags)
+            # Checked after the tag versions: writes bump the index first, so
+            # a ranking from an index still catching up is never stored under
+            # tags that look fresh
+            current = search_index.is_current()
+            ranked, total = cls.search_ranked(query, category_id, min_price, max_price, min_rating,
+                                              sort_by, limit=Config.SEARCH_CACHE_MAX_IDS)
+            cached = (tuple(ranked), total)
+            if current:
+                _search_cache.set(key, cached, tags, versions)
+        ranked, total = cached
+        offset = decode_offset(cursor, sort_by)
+        page = ranked[offset:offset + limit]
+        found = cls.get_many([product_id for product_id, score in page])
+        rows = [dict(found[product_id], relevance_score=score) for product_id, score in page if product_id in found]
+        next_cursor = None
+        if offset + limit < len(ranked):
+            next_cursor = encode_offset(sort_by, offset + limit)
+        elif len(ranked) < total and sort_by in KEYSETS and rows:
+            # Deeper than the cached ranking reaches
+            next_cursor = encode_cursor(sort_by, rows[-1])
+        prev_cursor = encode_offset(sort_by, max(offset - limit, 0)) if offset else None
+        return Page(rows, next_cursor, prev_cursor, total, sort_by)
+
+    @classmethod
+    def _search_keyset(cls, query, category_id, min_price, max_price, min_rating, sort_by, limit, cursor):
+        db = Database()
+        score, params, source, where, where_params = cls._search_filters(
+            db, query, category_id, min_price, max_price, min_rating)
+        sql = f'''
+            SELECT p.*, c.name as category_name, u.username as seller_username,
+                   {score} as relevance_score
+            FROM {source}
             JOIN categories c ON p.category_id = c.id
             JOIN users u ON p.seller_id = u.id
-            WHERE 1=1
+            WHERE {' AND '.join(where)}
         '''
-        params = []
-        if status:
-            query += " AND p.status = %s"
-            params.append(status)
-        if category_id:
-            query += " AND p.category_id = %s"
-            params.append(category_id)
-        if seller_id:
-            query += " AND p.seller_id = %s"
-            params.append(seller_id)
-        if search:
-            query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-            like = f"%{search}%"
-            params.extend([like, like])
-        query += " ORDER BY p.created_at DESC"
-        if limit:
-            query += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
-        return db.execute_query(query, params, fetch=True)
-    
+        cached = _search_cache.get((query, category_id, min_price, max_price, min_rating, sort_by))
+        total = cached[1] if cached else cls._search_count(db, source, where, where_params)
+        return fetch_page(db, sql, params + where_params, sort_by, cursor, limit, alias='p.', total=total)
+
     @classmethod
-    def count(cls, category_id=None, search=None, seller_id=None, status='active'):
+    def facets(cls, query='', category_id=None, min_price=None, max_price=None, min_rating=None):
+        """Sidebar counts for a search (see app.services.facets), in one query"""
         db = Database()
-        query = "SELECT COUNT(*) as count FROM products p WHERE 1=1"
-        params = []
-        if status:
-            query += " AND p.status = %s"
-            params.append(status)
-        if category_id:
-            query += " AND p.category_id = %s"
-            params.append(category_id)
-        if seller_id:
-            query += " AND p.seller_id = %s"
-            params.append(seller_id)
-        if search:
-            query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-            like = f"%{search}%"
-            params.extend([like, like])
-        result = db.execute_query(query, params, fetch=True, fetchone=True)
-        return result['count'] if result else 0
+        score, score_params, source, source_params, match, match_params = _text_match(db, query)
+        return facet_counts(db, match, match_params, category_id=category_id, min_price=min_price,
+                            max_price=max_price, min_rating=min_rating, source=source, source_params=source_params)
+
+    @classmethod
+    def _search_count(cls, db, source, where, where_params):
+        sql = f'''
+            SELECT COUNT(*) as total
+            FROM {source}
+            WHERE {' AND '.join(where)}
+        '''
+        result = db.execute_query(sql, where_params, fetch=True, fetchone=True)
+        return result['total'] if result else 0
+
+    @classmethod
+    def count(cls, category_id=None, search=None, seller_id=None, status='active'):
+        # From the maintained counters unless a search is given (see app.services.counters)
+        return listing.PRODUCTS.count(category_id=category_id, search=search, seller_id=seller_id, status=status)
 
@@ -1,4 +1,6 @@
 from app.services.database import Database
+from app.models.product import Product
+from app.services import ratings
 
 class Review:
     """Review model for product feedback"""
@@ -11,7 +13,10 @@ class Review:
         if existing:
             return cls.update(existing['id'], rating, comment)
         query = "INSERT INTO reviews (user_id, product_id, rating, comment) VALUES (%s, %s, %s, %s)"
-        review_id = db.execute_query(query, (user_id, product_id, rating, comment))
+        with db.transaction():
+            review_id = db.execute_query(query, (user_id, product_id, rating, comment))
+            ratings.adjust(db, product_id, added=[rating])
+        Product.ratings_changed()
         return cls.get_by_id(review_id)
 
     @classmethod
@@ -47,20 +52,37 @@ class Review:
     def update(cls, review_id, rating, comment=None):
         db = Database()
         query = "UPDATE reviews SET rating = %s, comment = %s WHERE id = %s"
-        db.execute_query(query, (rating, comment, review_id))
+        with db.transaction():
+            before = cls._locked(db, review_id)
+            db.execute_query(query, (rating, comment, review_id))
+            if before:
+                ratings.adjust(db, before['product_id'], removed=[before['rating']], added=[rating])
+        Product.ratings_changed()
         return cls.get_by_id(review_id)
 
     @classmethod
     def delete(cls, review_id):
         db = Database()
         query = "DELETE FROM reviews WHERE id = %s"
-        db.execute_query(query, (review_id,))
+        with db.transaction():
+            before = cls._locked(db, review_id)
+            db.execute_query(query, (review_id,))
+            if before:
+                ratings.adjust(db, before['product_id'], removed=[before['rating']])
+        Product.ratings_changed()
         return True
 
+    @classmethod
+    def _locked(cls, db, review_id):
+        """A review's product and rating, locked until the surrounding transaction ends"""
+        return db.execute_query("SELECT product_id, rating FROM reviews WHERE id = %s FOR UPDATE",
+                                (review_id,), fetch=True, fetchone=True)
+
     @classmethod
     def get_product_average_rating(cls, product_id):
         db = Database()
-        query = "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM reviews WHERE product_id = %s"
+        # Maintained on the product row by the write methods above
+        query = "SELECT avg_rating, review_count as count FROM products WHERE id = %s"
         result = db.execute_query(query, (product_id,), fetch=True, fetchone=True)
         if result and result['avg_rating']:
             return {'average': round(float(result['avg_rating']), 1), 'count': result['count']}
@@ -1,4 +1,5 @@
 from app.services.database import Database
+from app.services import counters
 from datetime import datetime
 
 class SellerRequest:
@@ -22,7 +23,9 @@ class SellerRequest:
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         '''
 
-        request_id = db.execute_query(query, (user_id, business_name, business_description, business_address, business_phone, tax_id, business_permit))
+        with db.transaction():
+            request_id = db.execute_query(query, (user_id, business_name, business_description, business_address, business_phone, tax_id, business_permit))
+            counters.adjust(db, 'seller_requests', added=[{'status': 'pending'}])
         return cls.get_by_id(request_id)
     
     @classmethod
@@ -90,12 +93,17 @@ class SellerRequest:
             SET status = 'approved', admin_notes = %s, reviewed_at = NOW()
             WHERE id = %s
         '''
-        db.execute_query(query, (admin_notes, request_id))
-        
-        # Update the user role to seller
         from app.models.user import User
-        User.update_role(request['user_id'], 'seller')
+        with db.transaction():
+            before = counters.current(db, 'seller_requests', request_id)
+            db.execute_query(query, (admin_notes, request_id))
+            if before:
+                counters.adjust(db, 'seller_requests', removed=[before], added=[{'status': 'approved'}])
         
+        # Update the user role to seller. After the commit: update_role drops
+        # the cached user, and inside the block another worker could re-cache
+        # the old role before the new one is visible
+        User.update_role(request['user_id'], 'seller')
         return True
     
     @classmethod
@@ -108,28 +116,25 @@ class SellerRequest:
             SET status = 'rejected', admin_notes = %s, reviewed_at = NOW()
             WHERE id = %s
         '''
-        db.execute_query(query, (admin_notes, request_id))
+        with db.transaction():
+            before = counters.current(db, 'seller_requests', request_id)
+            db.execute_query(query, (admin_notes, request_id))
+            if before:
+                counters.adjust(db, 'seller_requests', removed=[before], added=[{'status': 'rejected'}])
         return True
     
     @classmethod
     def get_requests_count(cls, status=None):
         """Get count of seller requests with optional filter"""
-        db = Database()
-        
-        query = "SELECT COUNT(*) as count FROM seller_requests WHERE 1=1"
-        params = []
-        
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        
-        result = db.execute_query(query, params, fetch=True, fetchone=True)
-        return result['count'] if result else 0
+        return counters.get('seller_requests', status=status)
     
     @classmethod
     def delete(cls, request_id):
         """Delete a seller request"""
         db = Database()
         query = "DELETE FROM seller_requests WHERE id = %s"
-        db.execute_query(query, (request_id,))
+        with db.transaction():
+            before = counters.current(db, 'seller_requests', request_id)
+            db.execute_query(query, (request_id,))
+            counters.adjust(db, 'seller_requests', removed=[before])
         return True
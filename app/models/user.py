@@ -1,5 +1,52 @@
 from app.services.database import Database
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.services.loaders import BatchLoader, in_clause
+from app.services.cache import RecordCache
+from app.services import counters, listing, ratings
+from config.config import Config
+from app.services.password_hasher import get_hasher
+
+# Shared across requests; every write below goes through _forget()
+_user_cache = RecordCache('users', secondary=('email', 'username'),
+                          maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+def _fetch_users(user_ids):
+    users = {}
+    missing = []
+    for user_id in user_ids:
+        user = _user_cache.get(user_id)
+        if user:
+            users[user_id] = user
+        else:
+            missing.append(user_id)
+    if missing:
+        versions = {user_id: _user_cache.version(user_id) for user_id in missing}
+        db = Database()
+        query = f"SELECT * FROM users WHERE id IN ({in_clause(missing)})"
+        for row in db.execute_query(query, missing, fetch=True):
+            _user_cache.put(row, versions.get(row['id']))
+            users[row['id']] = row
+    return users
+
+_users_loader = BatchLoader('users', _fetch_users)
+
+def _lookup_user(field, value):
+    """Get a user by a unique column, through the shared cache"""
+    user = _user_cache.get_by(field, value)
+    if user is None:
+        db = Database()
+        # Resolve the id first: the cache version must be read before the row
+        # is (see RecordCache), or a write in between caches the old row
+        query = f"SELECT id FROM users WHERE {field} = %s"
+        found = db.execute_query(query, (value,), fetch=True, fetchone=True, prepared=True)
+        if found is None:
+            return None
+        user = User.get_by_id(found['id'])
+    return user
+
+def _forget(user_id):
+    """Invalidate a user in this request and in every worker's cache"""
+    _users_loader.clear(user_id)
+    _user_cache.invalidate(user_id)
 
 class User:
     """User model for handling user operations"""
@@ -16,42 +63,60 @@ class User:
         if cls.get_by_email(email) or cls.get_by_username(username):
             return None
 
-        password_hash = generate_password_hash(password)
+        password_hash = get_hasher().hash(password)
 
         query = '''
             INSERT INTO users (username, email, password_hash, first_name, last_name, phone, address, country, city, id_picture, profile_image, role)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         '''
 
-        user_id = db.execute_query(query, (username, email, password_hash, first_name, last_name, phone, address, country, city, id_picture, profile_image, role))
+        with db.transaction():
+            user_id = db.execute_query(query, (username, email, password_hash, first_name, last_name, phone, address, country, city, id_picture, profile_image, role))
+            # New users start out active (column default)
+            counters.adjust(db, 'users', added=[{'role': role, 'status': 'active'}])
         return cls.get_by_id(user_id)
     
     @classmethod
     def get_by_id(cls, user_id):
         """Get user by ID"""
-        db = Database()
-        query = "SELECT * FROM users WHERE id = %s"
-        return db.execute_query(query, (user_id,), fetch=True, fetchone=True)
+        user = _user_cache.get(user_id)
+        if user is None:
+            version = _user_cache.version(user_id)
+            db = Database()
+            query = "SELECT * FROM users WHERE id = %s"
+            user = db.execute_query(query, (user_id,), fetch=True, fetchone=True, prepared=True)
+            _user_cache.put(user, version)
+        return user
+    
+    @classmethod
+    def get_cached(cls, user_id):
+        """Get user by ID, memoised for the rest of the request"""
+        return _users_loader.load(user_id)
+    
+    @classmethod
+    def get_many(cls, user_ids):
+        """Get users by ID in one query, as a dict keyed by ID"""
+        return _users_loader.load_many(user_ids)
     
     @classmethod
     def get_by_email(cls, email):
         """Get user by email"""
-        db = Database()
-        query = "SELECT * FROM users WHERE email = %s"
-        return db.execute_query(query, (email,), fetch=True, fetchone=True)
+        return _lookup_user('email', email)
     
     @classmethod
     def get_by_username(cls, username):
         """Get user by username"""
-        db = Database()
-        query = "SELECT * FROM users WHERE username = %s"
-        return db.execute_query(query, (username,), fetch=True, fetchone=True)
+        return _lookup_user('username', username)
     
     @classmethod
     def authenticate(cls, email, password):
         """Authenticate user by email and password"""
         user = cls.get_by_email(email)
-        if user and check_password_hash(user['password_hash'], password):
+        hasher = get_hasher()
+        if user and hasher.verify(user['password_hash'], password):
+            # Move old hashes to the configured cost on the next successful login
+            if hasher.needs_rehash(user['password_hash']):
+                cls.update_password(user['id'], password)
             return user
         return None
     
@@ -77,15 +142,17 @@ class User:
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
 
         db.execute_query(query, values)
+        _forget(user_id)
         return True
     
     @classmethod
     def update_password(cls, user_id, new_password):
         """Update user password"""
         db = Database()
-        password_hash = generate_password_hash(new_password)
+        password_hash = get_hasher().hash(new_password)
         query = "UPDATE users SET password_hash = %s WHERE id = %s"
         db.execute_query(query, (password_hash, user_id))
+        _forget(user_id)
         return True
     
     @classmethod
@@ -93,7 +160,12 @@ class User:
         """Update user role (admin function)"""
         db = Database()
         query = "UPDATE users SET role = %s WHERE id = %s"
-        db.execute_query(query, (new_role, user_id))
+        with db.transaction():
+            before = counters.current(db, 'users', user_id)
+            db.execute_query(query, (new_role, user_id))
+            if before:
+                counters.adjust(db, 'users', removed=[before], added=[dict(before, role=new_role)])
+        _forget(user_id)
         return True
     
     @classmethod
@@ -101,58 +173,60 @@ class User:
         """Update user status (admin function)"""
         db = Database()
         query = "UPDATE users SET status = %s WHERE id = %s"
-        db.execute_query(query, (status, user_id))
+        with db.transaction():
+            before = counters.current(db, 'users', user_id)
+            db.execute_query(query, (status, user_id))
+            if before:
+                counters.adjust(db, 'users', removed=[before], added=[dict(before, status=status)])
+        _forget(user_id)
         return True
     
     @classmethod
     def get_all_users(cls, role=None, status=None, limit=None, offset=0):
         """Get all users with optional filters"""
-        db = Database()
-        
-        query = "SELECT * FROM users WHERE 1=1"
-        params = []
-        
-        if role:
-            query += " AND role = %s"
-            params.append(role)
-        
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        
-        query += " ORDER BY created_at DESC"
-        
-        if limit:
-            query += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
-        
-        return db.execute_query(query, params, fetch=True)
+        return listing.USERS.fetch('newest', limit, offset, role=role, status=status)
+    
+    @classmethod
+    def get_users_page(cls, role=None, status=None, cursor=None, limit=20, sort='newest'):
+        """One keyset page of users"""
+        return listing.USERS.page(sort, cursor, limit, role=role, status=status)
     
     @classmethod
     def get_users_count(cls, role=None, status=None):
         """Get count of users with optional filters"""
-        db = Database()
-        
-        query = "SELECT COUNT(*) as count FROM users WHERE 1=1"
-        params = []
-        
-        if role:
-            query += " AND role = %s"
-            params.append(role)
-        
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        
-        result = db.execute_query(query, params, fetch=True, fetchone=True)
-        return result['count'] if result else 0
+        return listing.USERS.count(role=role, status=status)
     
     @classmethod
     def delete(cls, user_id):
         """Delete a user (admin function)"""
         db = Database()
         query = "DELETE FROM users WHERE id = %s"
-        db.execute_query(query, (user_id,))
+        with db.transaction():
+            before = counters.current(db, 'users', user_id)
+            # The user's products, seller requests and reviews go with them (ON DELETE CASCADE)
+            products = db.execute_query(
+                "SELECT id, category_id, seller_id, status FROM products WHERE seller_id = %s FOR UPDATE",
+                (user_id,), fetch=True
+            )
+            requests = db.execute_query(
+                "SELECT status FROM seller_requests WHERE user_id = %s FOR UPDATE", (user_id,), fetch=True
+            )
+            reviews = db.execute_query(
+                "SELECT product_id, rating FROM reviews WHERE user_id = %s ORDER BY product_id FOR UPDATE",
+                (user_id,), fetch=True
+            )
+            db.execute_query(query, (user_id,))
+            counters.adjust(db, 'users', removed=[before])
+            counters.adjust(db, 'products', removed=products)
+            counters.adjust(db, 'seller_requests', removed=requests)
+            for review in reviews:
+                ratings.adjust(db, review['product_id'], removed=[review['rating']])
+        _forget(user_id)
+        if products or reviews:
+            from app.models.product import Product
+            Product.deleted_elsewhere(products)
+            if reviews:
+                Product.ratings_changed()
         return True
     
     @classmethod
@@ -0,0 +1,210 @@
+"""
+Top-k autocomplete over a compressed prefix trie
+
+Every suggestion (a product or a category) is inserted under each word
+suffix of its name, so "kib" and "salmon kib" both reach "Premium Salmon
+Kibble". Edges carry whole substrings (a radix trie), which keeps the node
+count close to the number of keys. Each node also stores the ``k`` best
+suggestions found anywhere beneath it, ranked by weight (units sold), so a
+lookup is a walk down at most ``len(prefix)`` characters with no search
+below the node it ends on.
+
+Changing one suggestion recomputes the top-k lists on the paths of its
+keys only. Each node merges its own entries with its children's top-k
+lists.
+"""
+import re
+import heapq
+import threading
+
+# Only the first words of long names start a key; enough to reach any word users type
+MAX_KEY_WORDS = 8
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def name_keys(name):
+    """The name from each word onward: 'a b c' -> ['a b c', 'b c', 'c']"""
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_KEY_WORDS)) if words[i]]
+
+
+class _Node:
+    __slots__ = ('label', 'children', 'entries', 'top')
+
+    def __init__(self, label=''):
+        self.label = label
+        self.children = {}
+        self.entries = set()
+        self.top = []
+
+
+class SuggestionTrie:
+    """Radix trie keyed by name suffixes; ``lookup`` returns the k heaviest payloads"""
+
+    def __init__(self, k=8):
+        self.k = k
+        self._root = _Node()
+        self._weights = {}
+        self._payloads = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _rank(self, entry):
+        return (-self._weights.get(entry, 0), self._payloads[entry]['name'].lower(), entry)
+
+    def _recompute(self, node):
+        candidates = set(node.entries)
+        for child in node.children.values():
+            candidates.update(child.top)
+        node.top = heapq.nsmallest(self.k, candidates, key=self._rank)
+
+    def _insert_key(self, key, entry):
+        """Add ``entry`` under ``key``; returns the path of nodes from the root"""
+        node = self._root
+        path = [node]
+        rest = key
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None:
+                child = _Node(rest)
+                node.children[rest[0]] = child
+                node = child
+                path.append(node)
+                rest = ''
+                break
+            common = 0
+            limit = min(len(child.label), len(rest))
+            while common < limit and child.label[common] == rest[common]:
+                common += 1
+            if common < len(child.label):
+                # Split the edge: node -> middle -> child
+                middle = _Node(child.label[:common])
+                child.label = child.label[common:]
+                middle.children[child.label[0]] = child
+                middle.top = list(child.top)
+                node.children[rest[0]] = middle
+                child = middle
+            node = child
+            path.append(node)
+            rest = rest[common:]
+        node.entries.add(entry)
+        return path
+
+    def _find_path(self, key):
+        node = self._root
+        path = [node]
+        rest = key
+        while rest:
+            child = node.children.get(rest[0])
+            if child is None or not rest.startswith(child.label):
+                return None
+            rest = rest[len(child.label):]
+            node = child
+            path.append(node)
+        return path
+
+    def _remove_key(self, key, entry):
+        path = self._find_path(key)
+        if path is None:
+            return []
+        path[-1].entries.discard(entry)
+        # Drop nodes left with nothing beneath them
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node.entries or node.children:
+                break
+            del path[depth - 1].children[node.label[0]]
+            path.pop()
+        return path
+
+    def _refresh(self, paths):
+        # Deepest first so every parent merges up-to-date child lists
+        seen = set()
+        nodes = []
+        for path in paths:
+            for depth, node in enumerate(path):
+                if id(node) not in seen:
+                    seen.add(id(node))
+                    nodes.append((depth, node))
+        for depth, node in sorted(nodes, key=lambda item: -item[0]):
+            self._recompute(node)
+
+    def build(self, items):
+        """Bulk load (entry, name, weight, payload) tuples, computing top-k once"""
+        with self._lock:
+            self._root = _Node()
+            self._weights, self._payloads, self._keys = {}, {}, {}
+            for entry, name, weight, payload in items:
+                self._weights[entry] = weight
+                self._payloads[entry] = payload
+                self._keys[entry] = name_keys(name)
+                for key in self._keys[entry]:
+                    self._insert_key(key, entry)
+            self._compute_all(self._root)
+
+    def _compute_all(self, node):
+        # Iterative post-order: deep tries would exceed the recursion limit
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if expanded:
+                self._recompute(current)
+            else:
+                stack.append((current, True))
+                stack.extend((child, False) for child in current.children.values())
+
+    def upsert(self, entry, name, weight, payload):
+        """Add or replace one suggestion"""
+        with self._lock:
+            paths = [self._remove_key(key, entry) for key in self._keys.pop(entry, ())]
+            self._weights[entry] = weight
+            self._payloads[entry] = payload
+            self._keys[entry] = name_keys(name)
+            paths.extend(self._insert_key(key, entry) for key in self._keys[entry])
+            self._refresh(paths)
+
+    def remove(self, entry):
+        with self._lock:
+            paths = [self._remove_key(key, entry) for key in self._keys.pop(entry, ())]
+            self._weights.pop(entry, None)
+            self._refresh(paths)
+            self._payloads.pop(entry, None)
+
+    def add_weight(self, entry, amount):
+        """Raise an entry's weight (a sale) and re-rank it along its keys"""
+        with self._lock:
+            if entry not in self._payloads:
+                return
+            self._weights[entry] = self._weights.get(entry, 0) + amount
+            self._refresh([self._find_path(key) or [] for key in self._keys[entry]])
+
+    def weight(self, entry):
+        return self._weights.get(entry, 0)
+
+    def lookup(self, prefix, limit=None):
+        """Payloads of the heaviest suggestions whose key starts with ``prefix``"""
+        rest = normalize(prefix)
+        if not rest:
+            return []
+        with self._lock:
+            node = self._root
+            while rest:
+                child = node.children.get(rest[0])
+                if child is None:
+                    return []
+                if len(rest) <= len(child.label):
+                    if not child.label.startswith(rest):
+                        return []
+                    node = child
+                    break
+                if not rest.startswith(child.label):
+                    return []
+                rest = rest[len(child.label):]
+                node = child
+            return [self._payloads[entry] for entry in node.top[:limit or self.k]]
+
+    def __len__(self):
+        return len(self._payloads)
@@ -0,0 +1,276 @@
+"""
+In-process caches shared across requests
+
+``TTLCache`` is a thread-safe LRU whose entries also expire. ``RecordCache``
+builds on it to cache table rows by primary key, with secondary unique keys
+(email, username) pointing at the same row. ``TaggedCache`` caches derived
+results (search rankings) that are dropped when any of their tags changes.
+
+Each worker process has its own cache, so a write in one worker must make
+the others drop their copy. ``VersionCounter`` is a small memory-mapped file
+of counters shared by every process on the host: a writer bumps the
+counter for the row it changed, and readers compare it with the value
+stored alongside their cached entry. Checking costs one memory read.
+"""
+import os
+import time
+import mmap
+import zlib
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: counters are still shared, bumps are not locked across processes
+    fcntl = None
+
+_MISSING = object()
+_caches = {}
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._stats['misses'] += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                size=len(self._data),
+                maxsize=self.maxsize,
+                ttl=self.ttl,
+                hit_ratio=(self._stats['hits'] / lookups) if lookups else 0.0,
+            )
+
+
+class VersionCounter:
+    """Striped version counters in a memory-mapped file shared between processes
+
+    Keys hash onto ``slots`` 64-bit counters; two keys sharing a slot only
+    cost an extra cache miss.
+    """
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.slots = slots
+        self._map = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    size = self.slots * 8
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                    self._file = os.fdopen(fd, 'r+b')
+                    self._map = mmap.mmap(self._file.fileno(), size)
+        return self._map
+
+    def _offset(self, key):
+        return (zlib.crc32(str(key).encode()) % self.slots) * 8
+
+    def get(self, key):
+        return struct.unpack_from('<Q', self._open(), self._offset(key))[0]
+
+    def bump(self, key):
+        """Mark ``key`` changed for every process sharing the file"""
+        counters = self._open()
+        offset = self._offset(key)
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                value = (struct.unpack_from('<Q', counters, offset)[0] + 1) % (1 << 64)
+                struct.pack_into('<Q', counters, offset, value)
+            finally:
+                if fcntl:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        return value
+
+
+_versions = None
+_versions_lock = threading.Lock()
+
+
+def shared_versions():
+    """The host-wide VersionCounter configured by CACHE_VERSION_FILE"""
+    global _versions
+    if _versions is None:
+        with _versions_lock:
+            if _versions is None:
+                from config.config import Config
+                path = Config.CACHE_VERSION_FILE or os.path.join(tempfile.gettempdir(), 'pawfect_cache_versions')
+                _versions = VersionCounter(path, Config.CACHE_VERSION_SLOTS)
+    return _versions
+
+
+class RecordCache:
+    """Rows cached by id, findable by secondary unique keys, invalidated across workers
+
+    Callers read ``version(id)`` before fetching a row from the database and
+    pass it to ``put``; a write that lands in between leaves the entry
+    already stale instead of caching the old row.
+    """
+
+    def __init__(self, name, secondary=(), maxsize=2048, ttl=300, versions=None):
+        self.name = name
+        self.secondary = tuple(secondary)
+        self.entries = TTLCache(maxsize, ttl)
+        self._versions = versions
+        _caches[name] = self
+
+    @property
+    def versions(self):
+        return self._versions or shared_versions()
+
+    def _version_key(self, record_id):
+        return f"{self.name}:{record_id}"
+
+    def version(self, record_id):
+        return self.versions.get(self._version_key(record_id))
+
+    def get(self, record_id):
+        entry = self.entries.get(('id', record_id))
+        if entry is None:
+            return None
+        row, version = entry
+        if version != self.version(record_id):
+            # Changed by another worker since we cached it
+            self.entries.delete(('id', record_id))
+            return None
+        # Callers get their own copy; the cached row is shared between threads
+        return dict(row)
+
+    def get_by(self, field, value):
+        """Look a row up by one of the secondary keys (case-insensitive)"""
+        if value is None:
+            return None
+        key = str(value).lower()
+        record_id = self.entries.get((field, key))
+        if record_id is None:
+            return None
+        row = self.get(record_id)
+        if row is None or str(row.get(field, '')).lower() != key:
+            return None
+        return row
+
+    def put(self, row, version=None):
+        if not row:
+            return
+        record_id = row['id']
+        if version is None:
+            version = self.version(record_id)
+        self.entries.set(('id', record_id), (dict(row), version))
+        for field in self.secondary:
+            if row.get(field) is not None:
+                self.entries.set((field, str(row[field]).lower()), record_id)
+
+    def invalidate(self, record_id):
+        """Drop a row here and in every other worker"""
+        self.versions.bump(self._version_key(record_id))
+        self.entries.delete(('id', record_id))
+
+    def stats(self):
+        return dict(self.entries.stats(), name=self.name)
+
+
+class TaggedCache:
+    """Values labelled with tags; invalidating a tag drops them in every worker
+
+    Like ``RecordCache``, callers read ``tag_versions(tags)`` before computing
+    a value and pass it to ``set`` so a concurrent invalidation wins.
+    """
+
+    def __init__(self, name, maxsize=512, ttl=120, versions=None):
+        self.name = name
+        self.entries = TTLCache(maxsize, ttl)
+        self._versions = versions
+        self._stale = 0
+        _caches[name] = self
+
+    @property
+    def versions(self):
+        return self._versions or shared_versions()
+
+    def tag_versions(self, tags):
+        return tuple(self.versions.get(f"{self.name}:tag:{tag}") for tag in tags)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, tags, versions = entry
+        if self.tag_versions(tags) != versions:
+            self.entries.delete(key)
+            self._stale += 1
+            return None
+        return value
+
+    def set(self, key, value, tags, versions=None):
+        tags = tuple(tags)
+        if versions is None:
+            versions = self.tag_versions(tags)
+        self.entries.set(key, (value, tags, versions))
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of ``tags``, here and in other workers"""
+        for tag in tags:
+            self.versions.bump(f"{self.name}:tag:{tag}")
+
+    def stats(self):
+        # Stale entries were found by the LRU (a hit there) but not served
+        return dict(self.entries.stats(), name=self.name, stale=self._stale)
+
+
+def cache_stats():
+    """Statistics for every RecordCache and TaggedCache created in this process"""
+    return [cache.stats() for cache in _caches.values()]
@@ -0,0 +1,292 @@
+"""
+Process-wide connection pooling for the raw MySQL service layer
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection:
+    """A raw DB-API connection plus the bookkeeping the pool needs"""
+
+    def __init__(self, pool, raw):
+        self.pool = pool
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.checked_out_at = None
+        self.statements = None
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created_at
+
+    def close(self):
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class StatementCache:
+    """Per-connection LRU of server-side prepared statements keyed by SQL text
+
+    Each entry is a prepared cursor; re-executing it with new parameters
+    skips the server-side parse. Evicted cursors are closed, which
+    deallocates the statement on the server.
+    """
+
+    def __init__(self, pooled, capacity):
+        self.pooled = pooled
+        self.capacity = capacity
+        self._cursors = OrderedDict()
+
+    def get(self, sql):
+        cursor = self._cursors.get(sql)
+        if cursor is not None:
+            self._cursors.move_to_end(sql)
+            self.pooled.pool._count('statement_hits')
+            return cursor
+        self.pooled.pool._count('statement_misses')
+        cursor = self.pooled.raw.cursor(prepared=True, dictionary=True)
+        self._cursors[sql] = cursor
+        if len(self._cursors) > self.capacity:
+            _, evicted = self._cursors.popitem(last=False)
+            self.pooled.pool._count('statement_evictions')
+            _close_quietly(evicted)
+        return cursor
+
+    def discard(self, sql):
+        """Drop a statement whose cursor hit an error"""
+        cursor = self._cursors.pop(sql, None)
+        if cursor is not None:
+            _close_quietly(cursor)
+
+    def __len__(self):
+        return len(self._cursors)
+
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+def _mysql_ping(raw):
+    """Cheap liveness check for a mysql.connector connection"""
+    raw.ping(reconnect=False)
+
+
+class ConnectionPool:
+    """Bounded connection pool with overflow, recycling and pre-ping
+
+    ``pool_size`` connections are kept idle between requests; up to
+    ``max_overflow`` extra connections may be opened under load and are
+    closed again as soon as they are returned. Connections older than
+    ``recycle`` seconds are replaced on checkout, and with ``pre_ping``
+    enabled a stale connection is detected and replaced before use.
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, recycle=3600,
+                 pre_ping=True, timeout=30, ping=_mysql_ping):
+        self.creator = creator
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self.ping = ping
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._checked_out = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'invalidated': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'statement_hits': 0,
+            'statement_misses': 0,
+            'statement_evictions': 0,
+        }
+
+    @property
+    def capacity(self):
+        return self.pool_size + self.max_overflow
+
+    def _check_fork(self):
+        """Forget connections inherited from a parent process (pre-fork servers)"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._open = 0
+            self._checked_out = 0
+
+    def _discard(self, pooled):
+        """Close a connection and free its slot; caller holds the lock"""
+        pooled.close()
+        self._open -= 1
+        self._stats['closed'] += 1
+
+    def _unusable_reason(self, pooled):
+        """Recycle or pre-ping a connection taken from the idle queue"""
+        if self.recycle is not None and self.recycle >= 0 and pooled.age > self.recycle:
+            return 'recycled'
+        if self.pre_ping:
+            try:
+                self.ping(pooled.raw)
+            except Exception as e:
+                logging.warning(f"Discarding stale pooled connection: {e}")
+                return 'invalidated'
+        return None
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds"""
+        waited_since = None
+        while True:
+            with self._cond:
+                self._check_fork()
+                if self._idle:
+                    pooled = self._idle.pop()
+                    action = 'check'
+                elif self._open < self.capacity:
+                    # Reserve the slot before connecting so concurrent
+                    # callers cannot overshoot the capacity.
+                    self._open += 1
+                    action = 'create'
+                else:
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats['waits'] += 1
+                    remaining = self.timeout - (time.monotonic() - waited_since)
+                    if remaining <= 0:
+                        self._record_wait(waited_since)
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s "
+                            f"(pool_size={self.pool_size}, max_overflow={self.max_overflow})"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            # Network round trips (connect, ping) happen outside the lock.
+            if action == 'check':
+                reason = self._unusable_reason(pooled)
+                if reason is None:
+                    break
+                with self._cond:
+                    self._stats[reason] += 1
+                    self._discard(pooled)
+                continue
+
+            try:
+                pooled = PooledConnection(self, self.creator())
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+            break
+
+        with self._cond:
+            if waited_since is not None:
+                self._record_wait(waited_since)
+            self._checked_out += 1
+            self._stats['checkouts'] += 1
+        pooled.checked_out_at = time.monotonic()
+        return pooled
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self._stats[name] += amount
+
+    def _record_wait(self, waited_since):
+        waited = time.monotonic() - waited_since
+        self._stats['wait_time_total'] += waited
+        self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+    def release(self, pooled, discard=False):
+        """Return a connection; broken or overflow connections are closed"""
+        if pooled.pool is not self:
+            raise ValueError("Connection does not belong to this pool")
+
+        if not discard:
+            try:
+                # Reset-on-return: never hand out a connection with an open transaction
+                if getattr(pooled.raw, 'in_transaction', False):
+                    pooled.raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if self._pid != os.getpid():
+                # Checked out before a fork; not ours to track any more.
+                return
+            self._checked_out -= 1
+            pooled.checked_out_at = None
+            if discard or len(self._idle) >= self.pool_size:
+                self._discard(pooled)
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def dispose(self):
+        """Close every idle connection; checked-out ones close on return"""
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    def stats(self):
+        """Snapshot of pool occupancy and contention counters"""
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            waits = self._stats['waits']
+            lookups = self._stats['statement_hits'] + self._stats['statement_misses']
+            return dict(
+                self._stats,
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                open=self._open,
+                idle=len(self._idle),
+                checked_out=self._checked_out,
+                overflow=max(0, self._open - self.pool_size),
+                wait_ratio=(waits / checkouts) if checkouts else 0.0,
+                wait_time_avg=(self._stats['wait_time_total'] / waits) if waits else 0.0,
+                statement_hit_ratio=(self._stats['statement_hits'] / lookups) if lookups else 0.0,
+            )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """Return the process-wide pool for ``key``, creating it on first use"""
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = factory()
+                _pools[key] = pool
+    return pool
+
+
+def all_pools():
+    """All pools created in this process, keyed by their registry key"""
+    return dict(_pools)
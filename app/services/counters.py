@@ -0,0 +1,205 @@
+"""
+Maintained row counts for listings and dashboards
+
+Listing pages and the admin dashboard show counts like "active products in
+this category" and "users with role admin". Running ``COUNT(*)`` for each of
+them on every render scans the matching rows every time. Instead, the
+``counters`` table holds one count per dimension combination of a table
+(see ``DIMENSIONS``). The model write methods adjust those counts in the
+same transaction as the row change, so a committed count always matches the
+committed rows.
+
+Each count is spread over ``SLOTS`` rows and a write bumps one slot chosen at
+random. Two transactions touching the same count, such as two orders being
+placed, then rarely wait on the same row lock. A read sums the slots with a
+primary-key range lookup.
+
+Writes that bypass the models (manual SQL, cascades the models do not know
+about) make the counts drift. ``reconcile`` recounts every table and corrects
+the difference. It runs every COUNTER_RECONCILE_INTERVAL seconds in each
+worker and from ``flask counters reconcile``.
+"""
+import time
+import random
+import logging
+import threading
+from itertools import combinations
+
+import click
+
+DIMENSIONS = {
+    'users': ('role', 'status'),
+    'products': ('category_id', 'seller_id', 'status'),
+    'orders': ('status',),
+    'seller_requests': ('status',),
+}
+
+SLOTS = 8
+
+_UPSERT = """
+    INSERT INTO counters (name, slot, value) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE value = value + %s
+"""
+# Bumped first by every reconcile run, which also serialises concurrent runs
+_RUNS_KEY = 'counters:reconciled'
+
+_stats_lock = threading.Lock()
+_stats = {'reads': 0, 'adjustments': 0, 'reconcile_runs': 0, 'last_reconcile': None}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def counter_key(table, filters):
+    """Counter name for ``table`` rows matching ``filters``; None values are ignored"""
+    parts = [table]
+    for dimension in DIMENSIONS[table]:
+        value = filters.get(dimension)
+        if value is not None:
+            parts.append(f"{dimension}={value}")
+    return ':'.join(parts)
+
+
+def keys_for(table, row):
+    """Every counter a row with these dimension values belongs to"""
+    dimensions = DIMENSIONS[table]
+    keys = []
+    for size in range(len(dimensions) + 1):
+        for subset in combinations(dimensions, size):
+            keys.append(counter_key(table, {dimension: row[dimension] for dimension in subset}))
+    return keys
+
+
+def current(db, table, row_id):
+    """A row's dimension values, locked until the surrounding transaction ends"""
+    return db.execute_query(
+        f"SELECT {', '.join(DIMENSIONS[table])} FROM {table} WHERE id = %s FOR UPDATE",
+        (row_id,), fetch=True, fetchone=True
+    )
+
+
+def adjust(db, table, removed=(), added=()):
+    """Move counts for rows leaving (``removed``) and entering (``added``) a table or state
+
+    Call inside the transaction that writes the rows themselves.
+    """
+    deltas = {}
+    for rows, step in ((removed, -1), (added, 1)):
+        for row in rows:
+            if row is None:
+                continue
+            for key in keys_for(table, row):
+                deltas[key] = deltas.get(key, 0) + step
+    changes = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not changes:
+        return
+    slot = random.randrange(SLOTS)
+    # Sorted so concurrent writers take the row locks in the same order
+    db.execute_many(_UPSERT, [(key, slot, delta, delta) for key, delta in changes])
+    _count('adjustments')
+
+
+def get(table, db=None, **filters):
+    """Maintained count of ``table`` rows matching ``filters``"""
+    if db is None:
+        from app.services.database import Database
+        db = Database()
+    row = db.execute_query(
+        "SELECT COALESCE(SUM(value), 0) as value FROM counters WHERE name = %s",
+        (counter_key(table, filters),), fetch=True, fetchone=True, prepared=True
+    )
+    _count('reads')
+    return int(row['value']) if row else 0
+
+
+def recount(db):
+    """True counts for every counter, from the base tables"""
+    counts = {}
+    for table, dimensions in DIMENSIONS.items():
+        columns = ', '.join(dimensions)
+        rows = db.execute_query(
+            f"SELECT {columns}, COUNT(*) as row_count FROM {table} GROUP BY {columns}", fetch=True)
+        for row in rows:
+            for key in keys_for(table, row):
+                counts[key] = counts.get(key, 0) + int(row['row_count'])
+    return counts
+
+
+def reconcile(db=None):
+    """Correct drifted counters; returns {counter name: correction applied}"""
+    if db is None:
+        from app.services.database import Database
+        db = Database()
+    started = time.time()
+    with db.transaction():
+        # Taken before the first read: a second run waits here, then reads
+        # a snapshot that already includes the first run's corrections
+        db.execute_query(_UPSERT, (_RUNS_KEY, 0, 1, 1))
+        actual = recount(db)
+        stored = {
+            row['name']: int(row['value'])
+            for row in db.execute_query(
+                "SELECT name, SUM(value) as value FROM counters WHERE name != %s GROUP BY name",
+                (_RUNS_KEY,), fetch=True)
+        }
+        # Both sides come from one snapshot, so the difference is the drift even
+        # while other writers keep adjusting; it is applied as a relative change
+        corrections = {}
+        for key in set(actual) | set(stored):
+            drift = actual.get(key, 0) - stored.get(key, 0)
+            if drift:
+                corrections[key] = drift
+        if corrections:
+            db.execute_many(_UPSERT, [(key, 0, drift, drift) for key, drift in sorted(corrections.items())])
+    with _stats_lock:
+        _stats['reconcile_runs'] += 1
+        _stats['last_reconcile'] = {
+            'at': started,
+            'seconds': round(time.time() - started, 3),
+            'corrected': len(corrections),
+            'drift': sum(abs(drift) for drift in corrections.values()),
+        }
+    if corrections:
+        logging.warning(f"Counter reconcile corrected {len(corrections)} counters: {dict(list(corrections.items())[:10])}")
+    return corrections
+
+
+def _start_reconciler(interval):
+    def run():
+        while True:
+            time.sleep(interval * random.uniform(0.9, 1.1))
+            try:
+                reconcile()
+            except Exception as e:
+                logging.error(f"Counter reconcile failed: {e}")
+
+    thread = threading.Thread(target=run, name='counter-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app):
+    """Register ``flask counters`` and start the periodic reconcile"""
+
+    @app.cli.group('counters')
+    def counters_group():
+        """Maintained listing counts"""
+
+    @counters_group.command('reconcile')
+    def reconcile_command():
+        """Recount every table and correct drifted counters"""
+        corrections = reconcile()
+        for key, drift in sorted(corrections.items()):
+            click.echo(f"{drift:+6d}  {key}")
+        click.echo(f"Counters corrected: {len(corrections)}")
+
+    interval = app.config.get('COUNTER_RECONCILE_INTERVAL', 3600)
+    if interval:
+        _start_reconciler(interval)
+
+
+def counter_stats():
+    with _stats_lock:
+        return dict(_stats)
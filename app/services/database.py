@@ -1,87 +1,398 @@
-import mysql.connector
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, current_app, session
 from mysql.connector import Error
 from config.config import Config
+from app.services.connection_pool import ConnectionPool, PoolTimeout, StatementCache, get_pool, all_pools
+from app.services.dialects import get_dialect
+from app.services.db_instrumentation import record_query
 import logging
 
+_local = threading.local()
+
+
+class _Binding:
+    """A pooled connection bound to the current request or thread"""
+
+    def __init__(self, pooled):
+        self.pooled = pooled
+        self.depth = 0  # nesting level of Database.transaction() blocks
+
+
+def _scope():
+    """Per-request ``g`` once init_app has run, otherwise the current thread"""
+    if has_app_context() and 'database' in current_app.extensions:
+        return g
+    return _local
+
+
+def _bindings(scope):
+    bindings = getattr(scope, '_db_bindings', None)
+    if bindings is None:
+        bindings = {}
+        scope._db_bindings = bindings
+    return bindings
+
+
+def _is_select(query):
+    return query.lstrip()[:6].upper() == 'SELECT'
+
+
+def _release_bindings(exc=None):
+    """Teardown hook: hand every request-bound connection back to its pool"""
+    bindings = g.pop('_db_bindings', None) or {}
+    for pool, binding in bindings.items():
+        pool.release(binding.pooled)
+
+
 class Database:
     """Database service class for MySQL operations"""
     
     def __init__(self):
-        self.config = Config.DATABASE
-        self.connection = None
+        self.dialect = get_dialect(Config.DB_BACKEND)
+        if self.dialect.name == 'sqlite':
+            self.config = {'database': Config.SQLITE_PATH}
+            self.replica_config = None
+        else:
+            self.config = Config.DATABASE
+            self.replica_config = Config.DATABASE_REPLICA
+        self.read_your_writes_window = Config.DB_READ_YOUR_WRITES_WINDOW
+        self.pool_options = {
+            'pool_size': Config.DB_POOL_SIZE,
+            'max_overflow': Config.DB_POOL_MAX_OVERFLOW,
+            'recycle': Config.DB_POOL_RECYCLE,
+            'pre_ping': Config.DB_POOL_PRE_PING,
+            'timeout': Config.DB_POOL_TIMEOUT
+        }
+        self.statement_cache_size = Config.DB_STATEMENT_CACHE_SIZE
     
     def init_app(self, app):
-        """No-op initializer to satisfy legacy app wiring"""
+        """Apply connection and pool settings from the Flask config"""
         # Optionally, override config from app.config if present
         try:
+            backend = app.config.get('DB_BACKEND')
+            if backend and backend != self.dialect.name:
+                self.dialect = get_dialect(backend)
+                if self.dialect.name == 'sqlite':
+                    self.config = {'database': app.config.get('SQLITE_PATH', Config.SQLITE_PATH)}
+                    self.replica_config = None
             host = app.config.get('MYSQL_HOST')
             user = app.config.get('MYSQL_USER')
             password = app.config.get('MYSQL_PASSWORD')
             database = app.config.get('MYSQL_DB')
-            if host and user and database is not None:
+            if self.dialect.name == 'mysql' and host and user and database is not None:
                 self.config = {
                     'host': host,
                     'user': user,
                     'password': password,
                     'database': database
                 }
+            replica_host = app.config.get('MYSQL_REPLICA_HOST')
+            if self.dialect.name == 'mysql' and replica_host:
+                self.replica_config = {
+                    'host': replica_host,
+                    'port': int(app.config.get('MYSQL_REPLICA_PORT') or 3306),
+                    'user': app.config.get('MYSQL_REPLICA_USER') or self.config['user'],
+                    'password': app.config.get('MYSQL_REPLICA_PASSWORD', self.config.get('password')),
+                    'database': self.config['database']
+                }
+            self.read_your_writes_window = app.config.get(
+                'DB_READ_YOUR_WRITES_WINDOW', self.read_your_writes_window)
+            for option in self.pool_options:
+                key = f'DB_POOL_{option.upper()}'
+                if key in app.config:
+                    self.pool_options[option] = app.config[key]
+            self.statement_cache_size = app.config.get('DB_STATEMENT_CACHE_SIZE', self.statement_cache_size)
         except Exception:
             pass
+        
+        # Bind one connection per request to flask.g and return it on teardown
+        app.extensions['database'] = self
+        app.teardown_appcontext(_release_bindings)
+    
+    @property
+    def pool(self):
+        """Process-wide primary pool shared by every Database with the same config"""
+        return self._pool_for(self.config)
+    
+    @property
+    def replica_pool(self):
+        """Process-wide read replica pool, or None when no replica is configured"""
+        if not self.replica_config:
+            return None
+        return self._pool_for(self.replica_config)
+    
+    def _pool_for(self, config):
+        key = tuple(sorted(config.items()))
+        return get_pool(key, lambda: self._create_pool(config))
+    
+    def _create_pool(self, config):
+        config = dict(config)
+        dialect = self.dialect
+        return ConnectionPool(lambda: dialect.connect(config), ping=dialect.ping, **self.pool_options)
+    
+    @classmethod
+    def pool_stats(cls):
+        """Statistics for every pool opened by this process"""
+        return [
+            dict(pool.stats(), database=dict(key).get('database'), host=dict(key).get('host'),
+                 port=dict(key).get('port'))
+            for key, pool in all_pools().items()
+        ]
+    
+    def _acquire(self, pool=None):
+        """Get the connection bound to this request/thread, checking one out if needed"""
+        pool = pool or self.pool
+        bindings = _bindings(_scope())
+        binding = bindings.get(pool)
+        if binding is None:
+            try:
+                binding = _Binding(pool.acquire())
+            except Error as e:
+                logging.error(f"Database connection error: {e}")
+                raise e
+            bindings[pool] = binding
+        return binding
+    
+    def _release(self, binding, discard=False):
+        """Return a thread-bound connection once no transaction needs it
+
+        Request-bound connections stay checked out until teardown so every
+        query in the request reuses the same connection.
+        """
+        scope = _scope()
+        if discard or (scope is _local and binding.depth == 0):
+            bindings = _bindings(scope)
+            if bindings.get(binding.pooled.pool) is binding:
+                del bindings[binding.pooled.pool]
+            binding.pooled.pool.release(binding.pooled, discard=discard)
     
     def connect(self):
-        """Establish database connection"""
-        try:
-            if self.connection is None or not self.connection.is_connected():
-                self.connection = mysql.connector.connect(**self.config)
-                # Set connection timeout and other options
-                self.connection.autocommit = False
-                return self.connection
-            return self.connection
-        except Error as e:
-            logging.error(f"Database connection error: {e}")
-            raise e
+        """Return the connection bound to the current request or thread"""
+        return self._acquire().pooled.raw
     
     def disconnect(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        """Return a thread-bound connection to the pool"""
+        binding = _bindings(_scope()).get(self.pool)
+        if binding is not None:
+            self._release(binding)
+    
+    def _mark_write(self):
+        """Pin this request's and session's reads to the primary for a while"""
+        if not self.replica_config:
+            return
+        now = time.time()
+        _scope()._db_wrote_at = now
+        if has_request_context():
+            session['_db_wrote_at'] = now
+    
+    def _recently_wrote(self):
+        last = getattr(_scope(), '_db_wrote_at', 0)
+        if has_request_context():
+            last = max(last, session.get('_db_wrote_at', 0))
+        return time.time() - last < self.read_your_writes_window
+    
+    def _read_pool(self, query):
+        """Replica for plain SELECTs, unless the caller needs to see its own writes"""
+        replica = self.replica_pool
+        if (replica is None or not _is_select(query) or self.in_transaction()
+                or getattr(_scope(), '_db_primary_reads', 0) or self._recently_wrote()):
+            return self.pool
+        return replica
+    
+    def _acquire_read(self, query):
+        pool = self._read_pool(query)
+        if pool is not self.pool:
+            try:
+                return self._acquire(pool)
+            except (Error, PoolTimeout) as e:
+                logging.warning(f"Read replica unavailable, reading from primary: {e}")
+        return self._acquire()
     
-    def execute_query(self, query, params=None, fetch=False, fetchone=False):
-        """Execute a SQL query"""
-        connection = None
+    @contextmanager
+    def primary_reads(self):
+        """Send every read in the block to the primary (schema checks, read-modify-write)"""
+        scope = _scope()
+        scope._db_primary_reads = getattr(scope, '_db_primary_reads', 0) + 1
+        try:
+            yield self
+        finally:
+            scope._db_primary_reads -= 1
+    
+    def in_transaction(self):
+        """Whether a transaction() block is open on the current connection"""
+        binding = _bindings(_scope()).get(self.pool)
+        return binding is not None and binding.depth > 0
+    
+    @contextmanager
+    def transaction(self):
+        """Run a block of queries as one unit of work
+
+        Connections are in autocommit mode, so a bare execute_query is its
+        own transaction. Inside this block every execute_query on this
+        database (from any model) shares one connection and one transaction
+        that is committed once on success and rolled back on error. Nested
+        blocks join the outermost transaction.
+        """
+        binding = self._acquire()
+        connection = binding.pooled.raw
+        outermost = binding.depth == 0
+        broken = False
+        if outermost:
+            connection.start_transaction()
+        binding.depth += 1
+        try:
+            yield self
+            if outermost:
+                connection.commit()
+        except BaseException:
+            if outermost:
+                try:
+                    connection.rollback()
+                except Error as rollback_error:
+                    logging.error(f"Rollback failed: {rollback_error}")
+                    broken = True
+            raise
+        finally:
+            binding.depth -= 1
+            if outermost:
+                self._release(binding, discard=broken)
+    
+    def _prepared_cursor(self, pooled, query):
+        """Cached server-side prepared statement for ``query`` on this connection"""
+        if pooled.statements is None:
+            pooled.statements = StatementCache(pooled, self.statement_cache_size)
+        return pooled.statements.get(query)
+    
+    def execute_query(self, query, params=None, fetch=False, fetchone=False, prepared=False):
+        """Execute a SQL query
+
+        ``prepared=True`` runs a hot, positional-parameter statement as a
+        server-side prepared statement cached on the pooled connection.
+        With a replica configured, ``fetch=True`` SELECTs are read from it
+        (see _read_pool) and any other statement goes to the primary.
+        """
+        binding = self._acquire_read(query) if fetch else self._acquire()
+        connection = binding.pooled.raw
         cursor = None
+        cached = prepared and self.statement_cache_size > 0 and self.dialect.supports_prepared
+        broken = False
         try:
-            connection = self.connect()
-            cursor = connection.cursor(dictionary=True)
+            if cached:
+                cursor = self._prepared_cursor(binding.pooled, query)
+            else:
+                cursor = connection.cursor(dictionary=True)
 
+            started = time.perf_counter()
             cursor.execute(query, params or ())
 
             if fetch:
                 if fetchone:
                     result = cursor.fetchone()
+                    # Drain any remaining rows so the connection is reusable
+                    cursor.fetchall()
+                    rows = 1 if result else 0
                 else:
                     result = cursor.fetchall()
-                cursor.close()
+                    rows = len(result)
+                record_query(query, time.perf_counter() - started, rows)
                 return result
-            else:
-                connection.commit()
-                last_id = cursor.lastrowid
-                cursor.close()
-                return last_id
+            record_query(query, time.perf_counter() - started, max(cursor.rowcount, 0))
+            if not _is_select(query):
+                self._mark_write()
+            return cursor.lastrowid
 
         except Error as e:
             logging.error(f"Database query error: {e}")
-            if connection:
+            if cached:
+                binding.pooled.statements.discard(query)
+                cursor = None
+            # Inside transaction() the block's exit handles the rollback
+            if binding.depth == 0:
+                try:
+                    connection.rollback()
+                except Error as rollback_error:
+                    logging.error(f"Rollback failed: {rollback_error}")
+                    # Lost connection: drop it from the pool instead of reusing it
+                    broken = True
+            raise e
+        finally:
+            if cursor and not cached:
+                try:
+                    cursor.close()
+                except:
+                    pass
+            self._release(binding, discard=broken)
+    
+    def iter_query(self, query, params=None, batch_size=1000):
+        """Stream result rows as dicts in bounded memory
+
+        Uses an unbuffered (server-side) cursor on a dedicated pooled
+        connection and pulls ``batch_size`` rows at a time, so full-table
+        reports never materialise the whole result set. The connection is
+        busy until the generator is exhausted or closed.
+        """
+        pool = self._read_pool(query)
+        try:
+            pooled = pool.acquire()
+        except (Error, PoolTimeout) as e:
+            if pool is self.pool:
+                raise
+            logging.warning(f"Read replica unavailable, streaming from primary: {e}")
+            pooled = self.pool.acquire()
+        cursor = None
+        exhausted = False
+        rows = 0
+        started = time.perf_counter()
+        try:
+            cursor = pooled.raw.cursor(dictionary=True, buffered=False)
+            cursor.execute(query, params or ())
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                rows += len(batch)
+                yield from batch
+            exhausted = True
+        except Error as e:
+            logging.error(f"Database streaming query error: {e}")
+            raise e
+        finally:
+            if cursor and exhausted:
+                try:
+                    cursor.close()
+                except Error:
+                    exhausted = False
+            record_query(query, time.perf_counter() - started, rows)
+            # A stream abandoned part-way leaves unread rows on the wire;
+            # drop that connection rather than returning it to the pool.
+            pooled.pool.release(pooled, discard=not exhausted)
+    
+    def execute_many(self, query, params_list):
+        """Execute one statement for many parameter sets
+
+        Multi-row INSERTs are sent as a single batched statement.
+        """
+        binding = self._acquire()
+        connection = binding.pooled.raw
+        cursor = None
+        broken = False
+        try:
+            cursor = connection.cursor()
+            started = time.perf_counter()
+            cursor.executemany(query, list(params_list))
+            record_query(query, time.perf_counter() - started, max(cursor.rowcount, 0))
+            self._mark_write()
+            return cursor.rowcount
+        except Error as e:
+            logging.error(f"Database batch query error: {e}")
+            if binding.depth == 0:
                 try:
                     connection.rollback()
                 except Error as rollback_error:
                     logging.error(f"Rollback failed: {rollback_error}")
-                    # Try to reconnect if rollback fails due to lost connection
-                    try:
-                        self.disconnect()
-                        self.connection = None
-                    except:
-                        pass
+                    broken = True
             raise e
         finally:
             if cursor:
@@ -89,21 +400,12 @@ class Database:
                     cursor.close()
                 except:
                     pass
+            self._release(binding, discard=broken)
     
     def create_database(self):
         """Create the database if it doesn't exist"""
         try:
-            # Connect without specifying database
-            temp_config = self.config.copy()
-            del temp_config['database']
-            
-            connection = mysql.connector.connect(**temp_config)
-            cursor = connection.cursor()
-            
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.config['database']}")
-            cursor.close()
-            connection.close()
-            
+            self.dialect.create_database(self.config)
         except Error as e:
             logging.error(f"Database creation error: {e}")
             raise e
@@ -254,6 +556,10 @@ class Database:
         for table in tables:
             self.execute_query(table)
         
+        # Versioned migrations and the declared index set
+        from app.services import migrations
+        migrations.upgrade(self)
+        
         # Insert default categories
         self.insert_default_categories()
         
@@ -303,4 +609,7 @@ class Database:
                 INSERT INTO users (username, email, password_hash, first_name, last_name, phone, address, role)
                 VALUES (%(username)s, %(email)s, %(password_hash)s, %(first_name)s, %(last_name)s, %(phone)s, %(address)s, %(role)s)
             '''
-            self.execute_query(insert_query, admin_data)
+            from app.services import counters
+            with self.transaction():
+                self.execute_query(insert_query, admin_data)
+                counters.adjust(self, 'users', added=[{'role': 'admin', 'status': 'active'}])
@@ -0,0 +1,214 @@
+"""
+Per-request database instrumentation
+
+Every statement run through Database.execute_query (and, for the
+SQLAlchemy app, through the engine) is timed and counted against the
+current request. The totals are reported in a ``Server-Timing`` header,
+and admins can enable an in-page panel listing the slowest statements.
+
+With ``DB_NPLUSONE_MODE`` set to ``log`` or ``raise``, statements are also
+fingerprinted so a SELECT shape repeated ``DB_NPLUSONE_THRESHOLD`` times in
+one request is reported (or raised as NPlusOneError) with its call stack.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import traceback
+from contextlib import contextmanager
+from flask import g, has_request_context, request, session, render_template
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class NPlusOneError(Exception):
+    """Raised in ``raise`` mode when a query shape repeats within a request"""
+
+
+def fingerprint(sql):
+    """Normalise a statement to its shape: literals and IN lists collapsed"""
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip().lower()
+
+
+def _app_stack(limit=8):
+    """Call stack without the service layer, library and interpreter frames"""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if not os.path.abspath(frame.filename).startswith(_SERVICES_DIR)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.startswith('<frozen')
+    ]
+    return ''.join(traceback.format_list(frames[-limit:]))
+
+
+class RequestQueryStats:
+    """Statements executed while serving one request"""
+
+    def __init__(self, capture_sites=False, nplusone_mode='off', nplusone_threshold=5):
+        self.started_at = time.perf_counter()
+        self.capture_sites = capture_sites
+        self.queries = []
+        self.total_time = 0.0
+        self.total_rows = 0
+        self.nplusone_mode = nplusone_mode
+        self.nplusone_threshold = nplusone_threshold
+        self.nplusone_allowed = 0
+        self.shapes = {}
+        self.nplusone = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def record(self, sql, duration, rows, site=None):
+        self.queries.append({
+            'sql': _WHITESPACE.sub(' ', sql).strip(),
+            'duration_ms': duration * 1000.0,
+            'rows': rows,
+            'site': site,
+        })
+        self.total_time += duration
+        self.total_rows += rows or 0
+        if self.nplusone_mode != 'off':
+            self._check_repeats(sql)
+
+    def _check_repeats(self, sql):
+        if not sql.lstrip()[:6].lower() == 'select':
+            return
+        shape = fingerprint(sql)
+        count = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = count
+        if count != self.nplusone_threshold or self.nplusone_allowed:
+            return
+        report = {'shape': shape, 'count': count, 'stack': _app_stack()}
+        self.nplusone.append(report)
+        message = (
+            f"Possible N+1 query: the same statement ran {count} times in one request\n"
+            f"  {shape}\n{report['stack']}"
+        )
+        if self.nplusone_mode == 'raise':
+            raise NPlusOneError(message)
+        logging.warning(message)
+
+    def repeated_shapes(self):
+        """Final count for every shape that crossed the N+1 threshold"""
+        return [dict(report, count=self.shapes[report['shape']]) for report in self.nplusone]
+
+    def slowest(self, limit=10):
+        return sorted(self.queries, key=lambda q: q['duration_ms'], reverse=True)[:limit]
+
+
+def current_stats():
+    """Stats collector for the active request, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('_db_stats')
+
+
+@contextmanager
+def nplusone_allowed():
+    """Suppress N+1 reports for a deliberate per-row loop"""
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    stats.nplusone_allowed += 1
+    try:
+        yield
+    finally:
+        stats.nplusone_allowed -= 1
+
+
+def call_site():
+    """First frame outside the database service layer, as 'file:line in func'"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if not filename.startswith(_SERVICES_DIR) and 'sqlalchemy' not in filename:
+            return f"{os.path.relpath(filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def record_query(sql, duration, rows):
+    """Attribute one executed statement to the current request"""
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.record(sql, duration, rows, call_site() if stats.capture_sites else None)
+
+
+def instrument_sqlalchemy(engine):
+    """Feed statements run through a SQLAlchemy engine into the request stats"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_query_start'].pop()
+        record_query(statement, time.perf_counter() - started, max(cursor.rowcount, 0))
+
+
+def _server_timing(stats):
+    app_ms = (time.perf_counter() - stats.started_at) * 1000.0
+    db_ms = stats.total_time * 1000.0
+    return (
+        f'db;dur={db_ms:.2f};desc="{stats.count} queries, {stats.total_rows} rows", '
+        f'app;dur={max(app_ms - db_ms, 0.0):.2f}, '
+        f'total;dur={app_ms:.2f}'
+    )
+
+
+def _inject_panel(response, stats, app):
+    panel = render_template(
+        'admin/_db_debug_panel.html',
+        stats=stats,
+        slowest=stats.slowest(app.config.get('DB_DEBUG_PANEL_TOP', 10)),
+    )
+    body = response.get_data(as_text=True)
+    for marker in ('</body>', '</html>'):
+        index = body.rfind(marker)
+        if index != -1:
+            body = body[:index] + panel + body[index:]
+            break
+    else:
+        body += panel
+    response.set_data(body)
+
+
+def init_app(app):
+    """Start a collector per request and report it on the response"""
+
+    def panel_enabled():
+        return app.config.get('DB_DEBUG_PANEL') and session.get('user_role') == 'admin'
+
+    @app.before_request
+    def _start_query_stats():
+        g._db_stats = RequestQueryStats(
+            capture_sites=bool(panel_enabled()),
+            nplusone_mode=app.config.get('DB_NPLUSONE_MODE', 'off'),
+            nplusone_threshold=app.config.get('DB_NPLUSONE_THRESHOLD', 5),
+        )
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('_db_stats', None)
+        if stats is None or request.path.startswith('/static/'):
+            return response
+        if app.config.get('DB_SERVER_TIMING', True):
+            response.headers['Server-Timing'] = _server_timing(stats)
+        if (panel_enabled() and response.mimetype == 'text/html'
+                and not response.is_streamed and response.status_code == 200):
+            _inject_panel(response, stats, app)
+        return response
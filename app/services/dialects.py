@@ -0,0 +1,350 @@
+"""
+SQL dialects for the raw service layer
+
+The models are written against MySQL. ``MySQLDialect`` passes statements
+through unchanged; ``SQLiteDialect`` runs the same statements against an
+embedded SQLite database so benchmarks and load tests can run in-process
+without a MySQL server. It wraps sqlite3 connections in the subset of the
+mysql.connector interface the service layer uses (dictionary cursors,
+start_transaction, in_transaction, ping) and translates MySQL-only syntax:
+
+- ``%s`` / ``%(name)s`` placeholders to ``?`` / ``:name``
+- ``ENUM(...)``, ``AUTO_INCREMENT``, ``ON UPDATE CURRENT_TIMESTAMP``,
+  ``UNIQUE KEY name (...)`` in DDL
+- ``DATE_SUB/DATE_ADD(x, INTERVAL n UNIT)``, ``INSERT IGNORE``, ``FOR UPDATE``
+- ``ON DUPLICATE KEY UPDATE col = col + 1`` (``VALUES(col)`` is not translated)
+- ``NOW()``, ``CURDATE()``, ``DATE_FORMAT()``, ``YEAR()``, ``MONTH()`` and
+  ``CONCAT()`` as registered functions
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime, date
+from decimal import Decimal
+
+import mysql.connector
+from mysql.connector import Error
+
+
+class MySQLDialect:
+    name = 'mysql'
+    supports_prepared = True
+    supports_fulltext = True
+    # Exceptions a failed statement can raise
+    errors = (Error,)
+
+    TABLE_EXISTS_SQL = """
+        SELECT COUNT(*) as count FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """
+    COLUMN_EXISTS_SQL = """
+        SELECT COUNT(*) as count FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """
+    INDEX_EXISTS_SQL = """
+        SELECT COUNT(*) as count FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """
+
+    def connect(self, config):
+        return mysql.connector.connect(autocommit=True, **config)
+
+    def ping(self, raw):
+        raw.ping(reconnect=False)
+
+    def create_database(self, config):
+        """Create the configured database if it doesn't exist"""
+        temp_config = dict(config)
+        database = temp_config.pop('database')
+        connection = mysql.connector.connect(**temp_config)
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+        cursor.close()
+        connection.close()
+
+    def full_scans(self, db, sql, params):
+        """Tables a statement's plan reads in full, per EXPLAIN"""
+        return [
+            (row.get('table'), f"rows={row.get('rows')} key={row.get('key')}")
+            for row in db.execute_query(f"EXPLAIN {sql}", params, fetch=True)
+            if row.get('type') == 'ALL'
+        ]
+
+
+# --- SQLite -----------------------------------------------------------------
+
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+_ENUM = re.compile(r"\bENUM\s*\((?:\s*'[^']*'\s*,?)+\)", re.IGNORECASE)
+_INTERVAL = re.compile(
+    r"\bDATE_(SUB|ADD)\s*\(\s*(NOW\(\)|CURDATE\(\)|CURRENT_TIMESTAMP|[\w.]+)\s*,"
+    r"\s*INTERVAL\s+(\d+)\s+(SECOND|MINUTE|HOUR|DAY|MONTH|YEAR)\s*\)",
+    re.IGNORECASE
+)
+_REWRITES = [
+    (re.compile(r"\bINT(?:EGER)?\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.IGNORECASE),
+     'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", re.IGNORECASE), ''),
+    (re.compile(r"\bUNIQUE\s+KEY\s+\w+\s*\(", re.IGNORECASE), 'UNIQUE ('),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE), ''),
+    # Upserts that only use the existing row's columns (no VALUES(col) references)
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE), 'ON CONFLICT DO UPDATE SET'),
+]
+# MySQL DATE_FORMAT specifiers that differ from strftime
+_DATE_FORMAT_CODES = {'%i': '%M', '%s': '%S', '%M': '%B', '%h': '%I', '%e': '%d', '%c': '%m'}
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _interval(match):
+    func, value, amount, unit = match.groups()
+    if value.upper() in ('NOW()', 'CURRENT_TIMESTAMP'):
+        value = "'now'"
+    elif value.upper() == 'CURDATE()':
+        value = "'now', 'start of day'"
+    sign = '-' if func.upper() == 'SUB' else '+'
+    return f"datetime({value}, '{sign}{amount} {unit.lower()}')"
+
+
+def translate(sql, has_params=True):
+    """Rewrite a MySQL statement for SQLite"""
+    sql = _ENUM.sub('TEXT', sql)
+    parts = []
+    last = 0
+    for match in _LITERAL.finditer(sql):
+        parts.append(_translate_code(sql[last:match.start()], has_params))
+        literal = match.group(0)
+        # mysql.connector only collapses %% when it interpolates parameters
+        parts.append(literal.replace('%%', '%') if has_params else literal)
+        last = match.end()
+    parts.append(_translate_code(sql[last:], has_params))
+    return ''.join(parts)
+
+
+def _translate_code(code, has_params):
+    if has_params:
+        code = _PLACEHOLDER.sub(
+            lambda m: f":{m.group(1)}" if m.group(1) else ('?' if m.group(0) == '%s' else '%'),
+            code
+        )
+    code = _INTERVAL.sub(_interval, code)
+    for pattern, replacement in _REWRITES:
+        code = pattern.sub(replacement, code)
+    return code
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value
+    text = str(value)
+    for fmt in (_TIMESTAMP_FORMAT, '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _date_format(value, fmt):
+    moment = _parse_timestamp(value)
+    if moment is None or fmt is None:
+        return None
+    out = []
+    i = 0
+    while i < len(fmt):
+        code = fmt[i:i + 2]
+        if code[:1] == '%' and len(code) == 2:
+            out.append(moment.strftime(_DATE_FORMAT_CODES.get(code, code)))
+            i += 2
+        else:
+            out.append(fmt[i])
+            i += 1
+    return ''.join(out)
+
+
+def _part(attribute):
+    def extract(value):
+        moment = _parse_timestamp(value)
+        return getattr(moment, attribute) if moment else None
+    return extract
+
+
+def _now():
+    # CURRENT_TIMESTAMP in SQLite is UTC; keep NOW() consistent with it
+    return datetime.utcnow().strftime(_TIMESTAMP_FORMAT)
+
+
+def _register_types():
+    sqlite3.register_adapter(Decimal, str)
+    sqlite3.register_adapter(datetime, lambda value: value.strftime(_TIMESTAMP_FORMAT))
+    sqlite3.register_adapter(date, lambda value: value.isoformat())
+    sqlite3.register_converter('TIMESTAMP', lambda raw: _parse_timestamp(raw.decode()))
+    sqlite3.register_converter('DATETIME', lambda raw: _parse_timestamp(raw.decode()))
+    sqlite3.register_converter('DECIMAL', lambda raw: Decimal(raw.decode()))
+
+
+_register_types()
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over a sqlite3 cursor"""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self.dictionary = dictionary
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=None):
+        try:
+            self._cursor.execute(translate(query, bool(params)), params or ())
+        except sqlite3.Error as e:
+            raise Error(msg=str(e)) from e
+
+    def executemany(self, query, params_list):
+        try:
+            self._cursor.executemany(translate(query), params_list)
+        except sqlite3.Error as e:
+            raise Error(msg=str(e)) from e
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        if self._cursor.description is None:
+            return []
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """mysql.connector-style connection over sqlite3, in autocommit mode"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @property
+    def in_transaction(self):
+        return self.raw.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None, prepared=False):
+        # sqlite3 keeps its own per-connection statement cache
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def start_transaction(self):
+        self.raw.execute('BEGIN')
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self, reconnect=False):
+        self.raw.execute('SELECT 1')
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+    supports_prepared = False
+    # No MATCH ... AGAINST; product search falls back to LIKE
+    supports_fulltext = False
+    # Cursor calls are wrapped, but fetches and translation can still raise sqlite3's own
+    errors = (Error, sqlite3.Error)
+
+    TABLE_EXISTS_SQL = "SELECT COUNT(*) as count FROM sqlite_master WHERE type = 'table' AND name = %s"
+    COLUMN_EXISTS_SQL = "SELECT COUNT(*) as count FROM pragma_table_info(%s) WHERE name = %s"
+    INDEX_EXISTS_SQL = """
+        SELECT COUNT(*) as count FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = %s AND name = %s
+    """
+
+    def __init__(self):
+        # An in-memory database lives only while a connection to it is open
+        self._keepalive = {}
+        self._lock = threading.Lock()
+
+    def _target(self, config):
+        path = config.get('database') or ':memory:'
+        if path == ':memory:' or path.startswith('memory:'):
+            name = path.split(':', 1)[1] if path.startswith('memory:') else 'pawfect'
+            return f"file:{name}?mode=memory&cache=shared", True
+        return path, False
+
+    def connect(self, config):
+        target, memory = self._target(config)
+        raw = sqlite3.connect(
+            target, uri=memory, check_same_thread=False, isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES, timeout=config.get('timeout', 30)
+        )
+        raw.execute('PRAGMA foreign_keys = ON')
+        if not memory:
+            raw.execute('PRAGMA journal_mode = WAL')
+        raw.create_function('NOW', 0, _now)
+        raw.create_function('CURDATE', 0, lambda: _now()[:10])
+        raw.create_function('DATE_FORMAT', 2, _date_format, deterministic=True)
+        raw.create_function('YEAR', 1, _part('year'), deterministic=True)
+        raw.create_function('MONTH', 1, _part('month'), deterministic=True)
+        raw.create_function('CONCAT', -1, lambda *parts: None if None in parts else ''.join(map(str, parts)))
+        if memory:
+            with self._lock:
+                if target not in self._keepalive:
+                    self._keepalive[target] = sqlite3.connect(target, uri=True, check_same_thread=False)
+        return SQLiteConnection(raw)
+
+    def ping(self, raw):
+        raw.ping()
+
+    def create_database(self, config):
+        """SQLite creates the database file on first connect"""
+
+    def drop(self, config):
+        """Forget an in-memory database (benchmarks start from a clean store)"""
+        target, memory = self._target(config)
+        if memory:
+            with self._lock:
+                keeper = self._keepalive.pop(target, None)
+            if keeper is not None:
+                keeper.close()
+
+    def full_scans(self, db, sql, params):
+        """Tables a statement's plan reads in full, per EXPLAIN QUERY PLAN"""
+        scans = []
+        for row in db.execute_query(f"EXPLAIN QUERY PLAN {sql}", params, fetch=True):
+            detail = row.get('detail', '')
+            if detail.startswith('SCAN ') and 'USING' not in detail:
+                scans.append((detail.split()[1], detail))
+        return scans
+
+
+_DIALECTS = {'mysql': MySQLDialect(), 'sqlite': SQLiteDialect()}
+
+
+def get_dialect(name):
+    """Dialect for a DB_BACKEND setting ('mysql' or 'sqlite')"""
+    try:
+        return _DIALECTS[(name or 'mysql').lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported DB_BACKEND: {name}")
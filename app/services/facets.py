@@ -0,0 +1,122 @@
+"""
+Filter-sidebar facet counts in one grouped pass over the matching products
+
+Each facet is counted with every active filter except its own, so picking a
+category still shows how many results the other categories would give.
+Price and rating facets work the same way. All of it comes from one
+``GROUP BY category`` query of conditional sums; the per-category rows are
+then folded into the other facets in Python.
+
+Counts are computed in SQL, not from the in-process search index, because
+stock and ratings change outside the product write hooks and the sidebar
+must be exact.
+"""
+
+# (low, high) in pesos: low <= price < high; None is open-ended
+PRICE_BUCKETS = [(None, 100), (100, 250), (250, 500), (500, 1000), (1000, None)]
+
+# "N stars & up"
+RATING_THRESHOLDS = (4, 3, 2, 1)
+
+
+def _all(*conditions):
+    """AND the (sql, params) conditions together, skipping empty ones"""
+    parts = [(sql, params) for sql, params in conditions if sql]
+    if not parts:
+        return '1=1', []
+    return ' AND '.join(f"({sql})" for sql, _ in parts), [value for _, params in parts for value in params]
+
+
+def _count_if(condition):
+    sql, params = condition
+    return f"SUM(CASE WHEN {sql} THEN 1 ELSE 0 END)", params
+
+
+def _bucket_condition(low, high):
+    parts = []
+    params = []
+    if low is not None:
+        parts.append("p.price >= %s")
+        params.append(low)
+    if high is not None:
+        parts.append("p.price < %s")
+        params.append(high)
+    return ' AND '.join(parts), params
+
+
+def facet_counts(db, match=None, match_params=(), category_id=None, min_price=None, max_price=None,
+                 min_rating=None, source='products p', source_params=()):
+    """Category, price, rating and stock counts for a search, plus its price range
+
+    ``match``/``match_params`` is the text-search condition (or None for the
+    whole catalog); ``source``/``source_params`` the FROM clause it reads.
+    """
+    category_ok = ("p.category_id = %s", [category_id]) if category_id else ('', [])
+    price_ok = _all(
+        ("p.price >= %s", [min_price]) if min_price is not None else ('', []),
+        ("p.price <= %s", [max_price]) if max_price is not None else ('', []),
+    )
+    rating_ok = ("p.avg_rating >= %s", [min_rating]) if min_rating is not None else ('', [])
+    everything = _all(category_ok, price_ok, rating_ok)
+
+    columns = []
+    params = []
+
+    def add(alias, expression):
+        sql, values = expression
+        columns.append(f"{sql} as {alias}")
+        params.extend(values)
+
+    add('category_count', _count_if(_all(price_ok, rating_ok)))
+    add('total', _count_if(everything))
+    add('in_stock', _count_if(_all(everything, ("p.stock_quantity > 0", []))))
+    for position, (low, high) in enumerate(PRICE_BUCKETS):
+        add(f"price_{position}", _count_if(_all(category_ok, rating_ok, _bucket_condition(low, high))))
+    for threshold in RATING_THRESHOLDS:
+        add(f"rating_{threshold}", _count_if(_all(category_ok, price_ok, ("p.avg_rating >= %s", [threshold]))))
+    # Range of the results with the price filter itself left out, for the slider
+    unpriced = _all(category_ok, rating_ok)
+    add('min_price', (f"MIN(CASE WHEN {unpriced[0]} THEN p.price END)", unpriced[1]))
+    add('max_price', (f"MAX(CASE WHEN {unpriced[0]} THEN p.price END)", unpriced[1]))
+
+    params.extend(source_params)
+    where = "p.status = 'active'"
+    if match:
+        where += f" AND {match}"
+        params.extend(match_params)
+    rows = db.execute_query(f'''
+        SELECT p.category_id, c.name as category_name, {', '.join(columns)}
+        FROM {source}
+        JOIN categories c ON p.category_id = c.id
+        WHERE {where}
+        GROUP BY p.category_id, c.name
+    ''', params, fetch=True)
+
+    facets = {
+        'total': 0,
+        'in_stock': 0,
+        'categories': [],
+        'price_buckets': [{'min': low, 'max': high, 'count': 0} for low, high in PRICE_BUCKETS],
+        'ratings': [{'min': threshold, 'count': 0} for threshold in RATING_THRESHOLDS],
+        'price_range': {'min_price': None, 'max_price': None},
+    }
+    price_range = facets['price_range']
+    for row in rows:
+        facets['total'] += int(row['total'] or 0)
+        facets['in_stock'] += int(row['in_stock'] or 0)
+        if row['category_count']:
+            facets['categories'].append({
+                'id': row['category_id'],
+                'name': row['category_name'],
+                'count': int(row['category_count']),
+            })
+        for position, bucket in enumerate(facets['price_buckets']):
+            bucket['count'] += int(row[f"price_{position}"] or 0)
+        for bucket in facets['ratings']:
+            bucket['count'] += int(row[f"rating_{bucket['min']}"] or 0)
+        for key, better in (('min_price', min), ('max_price', max)):
+            if row[key] is not None:
+                value = float(row[key])
+                price_range[key] = value if price_range[key] is None else better(price_range[key], value)
+    facets['categories'].sort(key=lambda category: (-category['count'], category['name']))
+    return facets
@@ -0,0 +1,144 @@
+"""
+One query builder for the catalog and admin listings
+
+A ``Listing`` describes a table once: the SELECT that hydrates its rows,
+the filters it accepts and the orderings it offers. Every controller listing
+goes through it, so all filters and sorts run in SQL across the whole table,
+never over a page already fetched.
+
+Each listing only offers sorts that an index in ``migrations.INDEXES``
+serves, in the keyset column order (see ``app.utils.pagination``). Any other
+sort name falls back to the listing's default. Pages are keyset pages.
+Counts come from ``app.services.counters`` when only counted dimensions are
+filtered, otherwise from a ``COUNT(*)`` without the joins.
+"""
+from app.services.database import Database
+from app.services import counters
+from app.utils.pagination import KEYSETS, fetch_page, order_by
+
+
+def _like(*columns):
+    """Substring match on any of ``columns``"""
+    def condition(value):
+        sql = ' OR '.join(f"{column} LIKE %s" for column in columns)
+        return f"({sql})", [f"%{value}%"] * len(columns)
+    return condition
+
+
+class Listing:
+    """Filtered, sorted and paged reads of one table"""
+
+    def __init__(self, select, source, alias, filters, sorts, default_sort='newest', counter=None):
+        self.select = select
+        self.source = source
+        self.alias = alias
+        self.filters = filters
+        self.sorts = sorts
+        self.default_sort = default_sort
+        self.counter = counter
+
+    def sort(self, name):
+        """``name`` if this listing offers it, else the default"""
+        return name if name in self.sorts else self.default_sort
+
+    def where(self, filters):
+        """(`` WHERE ...`` clause, params) for the filters that have a value"""
+        conditions = ['1=1']
+        params = []
+        for name, value in filters.items():
+            if value is None or value == '':
+                continue
+            if name not in self.filters:
+                raise ValueError(f"Unknown filter {name!r}")
+            condition = self.filters[name]
+            if callable(condition):
+                sql, values = condition(value)
+            else:
+                sql, values = condition, [value]
+            conditions.append(sql)
+            params.extend(values)
+        return " WHERE " + ' AND '.join(conditions), params
+
+    def fetch(self, sort=None, limit=None, offset=0, db=None, **filters):
+        """Rows in ``sort`` order; ``limit``/``offset`` for short fixed lists only"""
+        db = db or Database()
+        where, params = self.where(filters)
+        query = f"{self.select}{where} ORDER BY {order_by(self.sort(sort), self.alias)}"
+        if limit:
+            query += " LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
+        return db.execute_query(query, params, fetch=True)
+
+    def page(self, sort=None, cursor=None, limit=20, with_total=False, db=None, **filters):
+        """One keyset Page; ``with_total`` also counts every matching row"""
+        db = db or Database()
+        sort = self.sort(sort)
+        where, params = self.where(filters)
+        total = self.count(db=db, **filters) if with_total else None
+        return fetch_page(db, self.select + where, params, sort, cursor, limit, self.alias, total=total)
+
+    def count(self, db=None, **filters):
+        """Matching rows, from the maintained counters where they cover the filters"""
+        active = {name: value for name, value in filters.items() if value is not None and value != ''}
+        if self.counter and all(name in counters.DIMENSIONS[self.counter] for name in active):
+            return counters.get(self.counter, db=db, **active)
+        row = self.aggregate("COUNT(*) as count", db=db, **filters)
+        return row['count'] if row else 0
+
+    def aggregate(self, columns, db=None, **filters):
+        """One row of aggregate ``columns`` over the filtered table, without the joins"""
+        db = db or Database()
+        where, params = self.where(filters)
+        return db.execute_query(f"SELECT {columns} FROM {self.source}{where}", params, fetch=True, fetchone=True)
+
+
+PRODUCTS = Listing(
+    select='''
+        SELECT p.*, c.name as category_name, u.username as seller_username
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        JOIN users u ON p.seller_id = u.id
+    ''',
+    source="products p",
+    alias='p.',
+    filters={
+        'status': "p.status = %s",
+        'category_id': "p.category_id = %s",
+        'seller_id': "p.seller_id = %s",
+        'min_price': "p.price >= %s",
+        'max_price': "p.price <= %s",
+        'search': _like('p.name', 'p.description'),
+    },
+    sorts=tuple(KEYSETS),
+    counter='products',
+)
+
+USERS = Listing(
+    select="SELECT * FROM users",
+    source="users",
+    alias='',
+    filters={
+        'role': "role = %s",
+        'status': "status = %s",
+    },
+    sorts=('newest', 'oldest'),
+    counter='users',
+)
+
+ORDERS = Listing(
+    select='''
+        SELECT o.*, u.username as customer_username, s.username as seller_username
+        FROM orders o
+        JOIN users u ON o.user_id = u.id
+        JOIN users s ON o.seller_id = s.id
+    ''',
+    source="orders o",
+    alias='o.',
+    filters={
+        'status': "o.status = %s",
+        'user_id': "o.user_id = %s",
+        'seller_id': "o.seller_id = %s",
+    },
+    sorts=('newest', 'oldest'),
+    counter='orders',
+)
@@ -0,0 +1,84 @@
+"""
+Batched, request-memoised lookups by id (DataLoader style)
+
+A loader turns "one query per id" loops into a single ``IN (...)`` query.
+Rows already loaded during the current request are served from ``g``
+so repeated lookups of the same ids cost nothing.
+"""
+from flask import g, has_app_context
+
+# Keep IN lists well below max_allowed_packet and the optimizer's range limits
+MAX_BATCH = 500
+
+
+def in_clause(ids):
+    """Placeholder list for an ``IN (...)`` filter over ``ids``"""
+    return ', '.join(['%s'] * len(ids))
+
+
+def unique_ids(ids):
+    """Drop None and duplicates while keeping first-seen order"""
+    seen = set()
+    result = []
+    for value in ids:
+        if value is not None and value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+class BatchLoader:
+    """Resolve many keys with one query per batch and memoise per request
+
+    ``fetch_many`` receives a list of keys and returns a dict mapping each
+    found key to its value; keys it leaves out are remembered as missing.
+    """
+
+    def __init__(self, name, fetch_many):
+        self.name = name
+        self.fetch_many = fetch_many
+
+    def _memo(self):
+        if not has_app_context():
+            return None
+        caches = g.get('_loader_cache')
+        if caches is None:
+            caches = {}
+            g._loader_cache = caches
+        return caches.setdefault(self.name, {})
+
+    def load_many(self, keys):
+        """Mapping of key -> value for every key that exists"""
+        keys = unique_ids(keys)
+        memo = self._memo()
+        missing = keys if memo is None else [key for key in keys if key not in memo]
+
+        fetched = {}
+        for start in range(0, len(missing), MAX_BATCH):
+            fetched.update(self.fetch_many(missing[start:start + MAX_BATCH]))
+
+        if memo is None:
+            return fetched
+        for key in missing:
+            memo[key] = fetched.get(key)
+        return {key: memo[key] for key in keys if memo[key] is not None}
+
+    def load(self, key):
+        """Single-key convenience wrapper around load_many"""
+        return self.load_many([key]).get(key)
+
+    def prime(self, key, value):
+        """Seed the request memo with a row loaded some other way"""
+        memo = self._memo()
+        if memo is not None:
+            memo[key] = value
+
+    def clear(self, key=None):
+        """Forget one key (after a write) or the whole memo"""
+        memo = self._memo()
+        if memo is None:
+            return
+        if key is None:
+            memo.clear()
+        else:
+            memo.pop(key, None)
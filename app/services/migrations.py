@@ -0,0 +1,373 @@
+"""
+Versioned schema migrations and the declared index set
+
+``upgrade(db)`` applies every pending migration in version order, records
+it in ``schema_migrations`` and then makes sure every index in ``INDEXES``
+exists. Every step checks the live schema first, so running it again (or
+against a database that was changed by hand) is a no-op.
+
+``explain_hot_queries(db)`` runs EXPLAIN over the registered hot queries
+and reports any that would scan a whole table.
+"""
+import logging
+import click
+
+
+class Index:
+    """An index the application's queries depend on"""
+
+    def __init__(self, table, name, columns, kind=''):
+        self.table = table
+        self.name = name
+        self.columns = columns
+        self.kind = kind  # '' for BTREE, or 'UNIQUE' / 'FULLTEXT'
+
+    def ddl(self):
+        kind = f"{self.kind} " if self.kind else ''
+        return f"CREATE {kind}INDEX {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+
+INDEXES = [
+    # Seller order lists: WHERE seller_id = ? ORDER BY created_at DESC
+    Index('orders', 'idx_orders_seller_created', ['seller_id', 'created_at']),
+    # Customer order history: WHERE user_id = ? ORDER BY created_at DESC
+    Index('orders', 'idx_orders_user_created', ['user_id', 'created_at']),
+    # Admin order list and status counts
+    Index('orders', 'idx_orders_status_created', ['status', 'created_at']),
+    # Unfiltered admin order list: keyset pages over (created_at, id)
+    Index('orders', 'idx_orders_created', ['created_at', 'id']),
+    # Catalog listings: WHERE status = ? ORDER BY created_at DESC, id DESC.
+    # InnoDB appends the primary key to secondary indexes, so the existing
+    # (..., created_at) indexes already serve (created_at, id) keysets
+    Index('products', 'idx_products_status_created', ['status', 'created_at']),
+    # Category pages: WHERE category_id = ? AND status = ? ORDER BY created_at DESC
+    Index('products', 'idx_products_category_status_created', ['category_id', 'status', 'created_at']),
+    # Keyset pages sorted by price or name, catalog-wide and per category
+    Index('products', 'idx_products_status_price', ['status', 'price', 'id']),
+    Index('products', 'idx_products_status_name', ['status', 'name', 'id']),
+    Index('products', 'idx_products_category_status_price', ['category_id', 'status', 'price', 'id']),
+    Index('products', 'idx_products_category_status_name', ['category_id', 'status', 'name', 'id']),
+    # Product search relevance: MATCH(name) and MATCH(name, description)
+    Index('products', 'ft_products_name', ['name'], kind='FULLTEXT'),
+    Index('products', 'ft_products_name_description', ['name', 'description'], kind='FULLTEXT'),
+    # Search sorted by rating and top-rated lists:
+    # WHERE status = ? ORDER BY avg_rating DESC, review_count DESC, id DESC
+    Index('products', 'idx_products_status_rating', ['status', 'avg_rating', 'review_count', 'id']),
+    # Seller product lists
+    Index('products', 'idx_products_seller_status', ['seller_id', 'status']),
+    # Product page reviews and rating aggregates
+    Index('reviews', 'idx_reviews_product_created', ['product_id', 'created_at']),
+    # Rider dashboards: WHERE rider_id = ? AND status = ?
+    Index('deliveries', 'idx_deliveries_rider_status', ['rider_id', 'status']),
+    # OTP issue/verify: WHERE email = ?
+    Index('otp_codes', 'idx_otp_codes_email', ['email']),
+    Index('otp_codes', 'idx_otp_codes_expires', ['expires_at']),
+    # OTP store range sweep: WHERE expires_at <= ?
+    Index('otp_store', 'idx_otp_store_expires', ['expires_at']),
+    # Session sweeper: WHERE expires_at <= ?
+    Index('sessions', 'idx_sessions_expires', ['expires_at']),
+    # Admin user lists filtered by role/status
+    Index('users', 'idx_users_role_status', ['role', 'status']),
+    # Admin user list: keyset pages over (created_at, id)
+    Index('users', 'idx_users_created', ['created_at', 'id']),
+]
+
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a schema migration; versions must be unique and increasing"""
+    def decorator(func):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return decorator
+
+
+def table_exists(db, table):
+    result = db.execute_query(db.dialect.TABLE_EXISTS_SQL, (table,), fetch=True, fetchone=True)
+    return bool(result and result['count'])
+
+
+def column_exists(db, table, column):
+    result = db.execute_query(db.dialect.COLUMN_EXISTS_SQL, (table, column), fetch=True, fetchone=True)
+    return bool(result and result['count'])
+
+
+def index_exists(db, table, name):
+    result = db.execute_query(db.dialect.INDEX_EXISTS_SQL, (table, name), fetch=True, fetchone=True)
+    return bool(result and result['count'])
+
+
+def ensure_column(db, table, column, definition):
+    """Add a column unless it already exists"""
+    if not column_exists(db, table, column):
+        db.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
+
+def ensure_indexes(db, indexes=None):
+    """Create any declared index that is missing; returns the names created"""
+    created = []
+    for index in indexes or INDEXES:
+        if not table_exists(db, index.table):
+            logging.warning(f"Skipping index {index.name}: table {index.table} does not exist")
+            continue
+        if index.kind == 'FULLTEXT' and not db.dialect.supports_fulltext:
+            continue
+        if not index_exists(db, index.table, index.name):
+            db.execute_query(index.ddl())
+            created.append(index.name)
+    return created
+
+
+@migration(1, 'Create otp_codes table')
+def _create_otp_codes(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS otp_codes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            email VARCHAR(100) NOT NULL,
+            otp_code VARCHAR(10) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            is_used BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+
+@migration(2, 'Create rate_limits table')
+def _create_rate_limits(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            bucket_key VARCHAR(191) NOT NULL,
+            window_start BIGINT NOT NULL,
+            hits INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_key, window_start)
+        )
+    ''')
+
+
+@migration(3, 'Create otp_store table')
+def _create_otp_store(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS otp_store (
+            email VARCHAR(191) NOT NULL PRIMARY KEY,
+            code_hash CHAR(64) NOT NULL,
+            expires_at DOUBLE NOT NULL,
+            attempts INT NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+@migration(4, 'Create sessions table')
+def _create_sessions(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid VARCHAR(64) NOT NULL PRIMARY KEY,
+            data MEDIUMTEXT NOT NULL,
+            expires_at DOUBLE NOT NULL
+        )
+    ''')
+
+
+@migration(5, 'Create counters table and backfill it')
+def _create_counters(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name VARCHAR(191) NOT NULL,
+            slot TINYINT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, slot)
+        )
+    ''')
+    from app.services.counters import reconcile
+    reconcile(db)
+
+
+@migration(6, 'Add review aggregates to products and backfill them')
+def _add_product_ratings(db):
+    ensure_column(db, 'products', 'rating_sum', "INT NOT NULL DEFAULT 0")
+    ensure_column(db, 'products', 'review_count', "INT NOT NULL DEFAULT 0")
+    ensure_column(db, 'products', 'avg_rating', "DECIMAL(3,2) NULL")
+    from app.services.ratings import backfill
+    backfill(db)
+
+
+@migration(7, 'Create search index change log')
+def _create_search_index_changes(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS search_index_changes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            units INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _ensure_migrations_table(db):
+    db.execute_query('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def applied_versions(db):
+    _ensure_migrations_table(db)
+    rows = db.execute_query("SELECT version FROM schema_migrations", fetch=True)
+    return {row['version'] for row in rows}
+
+
+def upgrade(db):
+    """Apply pending migrations, then reconcile the declared index set"""
+    # Schema checks must not see a lagging replica
+    with db.primary_reads():
+        applied = applied_versions(db)
+        ran = []
+        for version, description, func in MIGRATIONS:
+            if version in applied:
+                continue
+            logging.info(f"Applying migration {version}: {description}")
+            func(db)
+            db.execute_query(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            ran.append(version)
+        created = ensure_indexes(db)
+    return ran, created
+
+
+HOT_QUERIES = {}
+
+
+def register_hot_query(name, sql, params=(), allow_scan=(), fulltext=False):
+    """Declare a query that must be served by an index
+
+    ``allow_scan`` lists small lookup tables (e.g. categories) that may be
+    scanned as part of the plan. ``fulltext`` queries are only checked on
+    dialects with FULLTEXT support.
+    """
+    HOT_QUERIES[name] = (sql, tuple(params), set(allow_scan), fulltext)
+
+
+register_hot_query(
+    'seller_orders',
+    "SELECT * FROM orders WHERE seller_id = %s ORDER BY created_at DESC LIMIT 20", (1,))
+register_hot_query(
+    'customer_orders',
+    "SELECT * FROM orders WHERE user_id = %s ORDER BY created_at DESC LIMIT 10", (1,))
+register_hot_query(
+    'active_products_newest',
+    "SELECT * FROM products WHERE status = %s ORDER BY created_at DESC LIMIT 12", ('active',))
+register_hot_query(
+    'category_products_newest',
+    "SELECT * FROM products WHERE category_id = %s AND status = %s ORDER BY created_at DESC LIMIT 12",
+    (1, 'active'))
+register_hot_query(
+    'category_products_by_price',
+    "SELECT * FROM products WHERE category_id = %s AND status = %s"
+    " AND (price > %s OR (price = %s AND id > %s)) ORDER BY price, id LIMIT 21",
+    (1, 'active', 100, 100, 1))
+register_hot_query(
+    'active_products_by_name',
+    "SELECT * FROM products WHERE status = %s"
+    " AND (name > %s OR (name = %s AND id > %s)) ORDER BY name, id LIMIT 21",
+    ('active', 'M', 'M', 1))
+register_hot_query(
+    'admin_orders_newest',
+    "SELECT * FROM orders WHERE (created_at < %s OR (created_at = %s AND id < %s))"
+    " ORDER BY created_at DESC, id DESC LIMIT 21",
+    ('2030-01-01 00:00:00', '2030-01-01 00:00:00', 1))
+register_hot_query(
+    'top_rated_products',
+    "SELECT * FROM products WHERE status = %s AND review_count >= %s"
+    " ORDER BY avg_rating DESC, review_count DESC, id DESC LIMIT 12", ('active', 3))
+register_hot_query(
+    'product_reviews',
+    "SELECT * FROM reviews WHERE product_id = %s ORDER BY created_at DESC", (1,))
+register_hot_query(
+    'rider_deliveries',
+    "SELECT * FROM deliveries WHERE rider_id = %s AND status = %s", (1, 'assigned'))
+register_hot_query(
+    'otp_by_email',
+    "SELECT code_hash, expires_at, attempts FROM otp_store WHERE email = %s", ('someone@example.com',))
+register_hot_query(
+    'counter_value',
+    "SELECT COALESCE(SUM(value), 0) as value FROM counters WHERE name = %s", ('products:status=active',))
+
+
+def explain_hot_queries(db):
+    """EXPLAIN every registered hot query
+
+    Returns (full scans as (name, table, detail), queries that could not be
+    explained as (name, error)).
+    """
+    failures = []
+    skipped = []
+    for name, (sql, params, allow_scan, fulltext) in sorted(HOT_QUERIES.items()):
+        if fulltext and not db.dialect.supports_fulltext:
+            continue
+        try:
+            scans = db.dialect.full_scans(db, sql, params)
+        except db.dialect.errors as e:
+            logging.warning(f"Could not explain hot query {name}: {e}")
+            skipped.append((name, str(e)))
+            continue
+        for table, detail in scans:
+            if table not in allow_scan:
+                failures.append((name, table, detail))
+    return failures, skipped
+
+
+def init_app(app):
+    """Register the ``flask schema`` CLI commands"""
+    from app.services.database import Database
+
+    @app.cli.group('schema')
+    def schema():
+        """Schema migrations and index checks"""
+
+    @schema.command('upgrade')
+    def upgrade_command():
+        """Apply pending migrations and create missing indexes"""
+        ran, created = upgrade(Database())
+        click.echo(f"Migrations applied: {ran or 'none'}")
+        click.echo(f"Indexes created: {created or 'none'}")
+
+    @schema.command('status')
+    def status_command():
+        """List migrations and whether they have been applied"""
+        db = Database()
+        with db.primary_reads():
+            applied = applied_versions(db)
+            for version, description, _ in MIGRATIONS:
+                mark = 'applied' if version in applied else 'pending'
+                click.echo(f"{version:>4}  {mark:<8} {description}")
+            for index in INDEXES:
+                if table_exists(db, index.table):
+                    mark = 'present' if index_exists(db, index.table, index.name) else 'missing'
+                else:
+                    mark = 'no table'
+                click.echo(f"      {mark:<8} {index.table}.{index.name}")
+
+    @schema.command('explain')
+    def explain_command():
+        """Fail if any registered hot query does a full table scan or cannot be explained"""
+        db = Database()
+        failures, skipped = explain_hot_queries(db)
+        for name, table, detail in failures:
+            click.echo(f"FULL SCAN  {name}: table={table} {detail}")
+        for name, error in skipped:
+            click.echo(f"NOT CHECKED  {name}: {error}")
+        if failures or skipped:
+            raise SystemExit(1)
+        checked = [name for name, query in HOT_QUERIES.items() if db.dialect.supports_fulltext or not query[3]]
+        click.echo(f"All {len(checked)} hot queries use an index")
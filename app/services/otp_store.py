@@ -0,0 +1,272 @@
+"""
+One-time passcodes with O(1) issue/verify and timing-wheel expiry
+
+Codes are kept per email (a new code replaces the previous one), stored as
+an HMAC of the code rather than the code itself, and burnt after
+``max_attempts`` wrong guesses. Issuing or verifying touches one key.
+
+Expiry is driven by a hashed timing wheel: each issued code is dropped into
+the slot for its deadline, and advancing the wheel only visits the slots
+whose tick has passed since the last advance. The memory backend deletes
+expired entries directly; the database backend deletes them in batches
+with one ``DELETE ... WHERE email IN (...)`` and also runs an occasional
+indexed range sweep for rows issued by workers that have since exited.
+"""
+import hmac
+import time
+import secrets
+import hashlib
+import logging
+import threading
+
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+# Keep IN lists for batched cleanup small
+CLEANUP_BATCH = 500
+
+
+class TimingWheel:
+    """Hashed timing wheel; ``advance`` returns the keys whose deadline passed"""
+
+    def __init__(self, tick=1.0, slots=4096, now=None):
+        self.tick = tick
+        self.slots = slots
+        self._buckets = [{} for _ in range(slots)]
+        self._processed = int((now if now is not None else time.time()) // tick) - 1
+        self._lock = threading.Lock()
+
+    def schedule(self, key, deadline):
+        with self._lock:
+            self._buckets[int(deadline // self.tick) % self.slots][key] = deadline
+
+    def advance(self, now):
+        """Pop every key due by ``now``, visiting only the ticks that fully elapsed"""
+        expired = []
+        with self._lock:
+            target = int(now // self.tick) - 1
+            if target <= self._processed:
+                return expired
+            # After a long idle gap one revolution covers every slot
+            start = max(self._processed + 1, target - self.slots + 1)
+            for tick in range(start, target + 1):
+                bucket = self._buckets[tick % self.slots]
+                for key, deadline in list(bucket.items()):
+                    # Deadlines more than one revolution out stay for a later pass
+                    if deadline <= now:
+                        expired.append(key)
+                        del bucket[key]
+            self._processed = target
+        return expired
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+
+class MemoryBackend:
+    """Single-process store: a dict of email -> [code_hash, expires_at, attempts]"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def put(self, email, code_hash, expires_at):
+        with self._lock:
+            self._entries[email] = [code_hash, expires_at, 0]
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            return tuple(entry) if entry else None
+
+    def record_failure(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return 0
+            entry[2] += 1
+            return entry[2]
+
+    def delete(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def expire(self, emails, now):
+        with self._lock:
+            for email in emails:
+                entry = self._entries.get(email)
+                # A re-issued code has a later deadline and must survive
+                if entry and entry[1] <= now:
+                    del self._entries[email]
+
+    def sweep(self, now):
+        with self._lock:
+            for email in [email for email, entry in self._entries.items() if entry[1] <= now]:
+                del self._entries[email]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatabaseBackend:
+    """Shared store in the ``otp_store`` table, keyed by email"""
+
+    def __init__(self, db=None):
+        from app.services.database import Database
+        self.db = db or Database()
+
+    def put(self, email, code_hash, expires_at):
+        self.db.execute_query(
+            """
+            INSERT INTO otp_store (email, code_hash, expires_at, attempts) VALUES (%s, %s, %s, 0)
+            ON DUPLICATE KEY UPDATE code_hash = %s, expires_at = %s, attempts = 0
+            """,
+            (email, code_hash, expires_at, code_hash, expires_at)
+        )
+
+    def get(self, email):
+        # The code may have been issued a moment ago by another worker
+        with self.db.primary_reads():
+            row = self.db.execute_query(
+                "SELECT code_hash, expires_at, attempts FROM otp_store WHERE email = %s",
+                (email,), fetch=True, fetchone=True, prepared=True
+            )
+        return (row['code_hash'], row['expires_at'], row['attempts']) if row else None
+
+    def record_failure(self, email):
+        self.db.execute_query("UPDATE otp_store SET attempts = attempts + 1 WHERE email = %s", (email,))
+        entry = self.get(email)
+        return entry[2] if entry else 0
+
+    def delete(self, email):
+        self.db.execute_query("DELETE FROM otp_store WHERE email = %s", (email,))
+
+    def expire(self, emails, now):
+        for start in range(0, len(emails), CLEANUP_BATCH):
+            batch = emails[start:start + CLEANUP_BATCH]
+            placeholders = ', '.join(['%s'] * len(batch))
+            self.db.execute_query(
+                f"DELETE FROM otp_store WHERE email IN ({placeholders}) AND expires_at <= %s",
+                (*batch, now)
+            )
+
+    def sweep(self, now):
+        self.db.execute_query("DELETE FROM otp_store WHERE expires_at <= %s", (now,))
+
+    def __len__(self):
+        row = self.db.execute_query("SELECT COUNT(*) as count FROM otp_store", fetch=True, fetchone=True)
+        return row['count'] if row else 0
+
+
+class OTPStore:
+    """Issue and verify numeric codes per email"""
+
+    def __init__(self, backend, secret, ttl=600, max_attempts=5, length=6, sweep_interval=3600):
+        self.backend = backend
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.length = length
+        self.sweep_interval = sweep_interval
+        self.wheel = TimingWheel(tick=1.0, slots=max(64, int(ttl) + 64))
+        self._next_sweep = time.time() + sweep_interval
+        self._lock = threading.Lock()
+        self._stats = {'issued': 0, 'verified': 0, 'invalid': 0, 'expired': 0, 'locked': 0, 'wheel_expired': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _digest(self, email, code):
+        return hmac.new(self.secret, f"{email}:{code}".encode(), hashlib.sha256).hexdigest()
+
+    def _expire_due(self, now):
+        expired = self.wheel.advance(now)
+        try:
+            if expired:
+                self.backend.expire(expired, now)
+                self._count('wheel_expired', len(expired))
+            with self._lock:
+                sweep = now >= self._next_sweep
+                if sweep:
+                    self._next_sweep = now + self.sweep_interval
+            if sweep:
+                self.backend.sweep(now)
+        except Exception as e:
+            logging.warning(f"OTP cleanup failed: {e}")
+
+    def issue(self, email):
+        """Create a new code for ``email`` (replacing any previous one) and return it"""
+        email = email.strip().lower()
+        now = time.time()
+        self._expire_due(now)
+        code = ''.join(secrets.choice('0123456789') for _ in range(self.length))
+        expires_at = now + self.ttl
+        self.backend.put(email, self._digest(email, code), expires_at)
+        self.wheel.schedule(email, expires_at)
+        self._count('issued')
+        return code
+
+    def verify(self, email, code):
+        """VALID (and the code is consumed), INVALID, EXPIRED or LOCKED"""
+        result = self._verify(email.strip().lower(), str(code or '').strip(), time.time())
+        self._count(result if result != VALID else 'verified')
+        return result
+
+    def _verify(self, email, code, now):
+        self._expire_due(now)
+        entry = self.backend.get(email)
+        if entry is None:
+            return EXPIRED
+        code_hash, expires_at, attempts = entry
+        if expires_at <= now:
+            self.backend.delete(email)
+            return EXPIRED
+        if attempts >= self.max_attempts:
+            return LOCKED
+        if hmac.compare_digest(code_hash, self._digest(email, code)):
+            self.backend.delete(email)
+            return VALID
+        if self.backend.record_failure(email) >= self.max_attempts:
+            return LOCKED
+        return INVALID
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(
+            stats,
+            backend=type(self.backend).__name__,
+            pending_expiries=len(self.wheel),
+            ttl=self.ttl,
+            max_attempts=self.max_attempts,
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """Process-wide OTP store configured by OTP_*"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from config.config import Config
+                backend = DatabaseBackend() if Config.OTP_BACKEND == 'database' else MemoryBackend()
+                _store = OTPStore(
+                    backend,
+                    secret=Config.SECRET_KEY,
+                    ttl=Config.OTP_TTL,
+                    max_attempts=Config.OTP_MAX_ATTEMPTS,
+                    length=Config.OTP_LENGTH,
+                )
+    return _store
+
+
+def otp_stats():
+    """OTP issue/verify metrics, or None before the first code is issued"""
+    return _store.stats() if _store is not None else None
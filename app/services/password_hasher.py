@@ -0,0 +1,112 @@
+"""
+Password hashing on a bounded worker pool
+
+Hashing is deliberately expensive. Running it on the request thread lets a
+login burst occupy every worker thread and CPU core; here at most
+``workers`` hashes run at once, at most ``max_queue`` more wait, and
+anything beyond that fails fast with HashingOverloaded (served as 503 with
+Retry-After) instead of piling up.
+
+hashlib's pbkdf2 and scrypt release the GIL, so a thread pool gives real
+parallelism up to the number of cores.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full or a hash waited too long"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Concurrency-limited generate/check of werkzeug password hashes"""
+
+    def __init__(self, method='scrypt:32768:8:1', workers=None, max_queue=32, timeout=10):
+        self.method = method
+        # The prefix werkzeug stores, with its defaults filled in ("scrypt" -> "scrypt:32768:8:1")
+        self.prefix = generate_password_hash('x', method).split('$', 1)[0]
+        self.workers = workers or os.cpu_count() or 2
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'timeouts': 0, 'in_flight': 0}
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingOverloaded(
+                f"Password hashing queue full ({self.workers} running, {self.max_queue} queued)"
+            )
+        self._count('in_flight')
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._count('timeouts')
+            raise HashingOverloaded(f"Password hashing took longer than {self.timeout}s")
+
+    def _release(self, future):
+        self._count('in_flight', -1)
+        self._slots.release()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def hash(self, password):
+        """Hash a password with the configured method and cost"""
+        result = self._run(generate_password_hash, password, self.method)
+        self._count('hashed')
+        return result
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        result = self._run(check_password_hash, pwhash, password)
+        self._count('verified')
+        return result
+
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash uses a different method or cost than configured"""
+        return bool(pwhash) and pwhash.split('$', 1)[0] != self.prefix
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, workers=self.workers, max_queue=self.max_queue, method=self.method)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Process-wide hasher configured by PASSWORD_HASH_*"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                from config.config import Config
+                _hasher = PasswordHasher(
+                    method=Config.PASSWORD_HASH_METHOD,
+                    workers=Config.PASSWORD_HASH_WORKERS,
+                    max_queue=Config.PASSWORD_HASH_MAX_QUEUE,
+                    timeout=Config.PASSWORD_HASH_TIMEOUT,
+                )
+    return _hasher
+
+
+def hasher_stats():
+    """Hashing pool metrics, or None before the first hash"""
+    return _hasher.stats() if _hasher is not None else None
@@ -0,0 +1,225 @@
+"""
+Rate limiting with O(1) checks and bounded memory
+
+Two algorithms are available:
+
+- ``token_bucket``: each client has ``limit`` tokens refilled continuously
+  at ``limit / window`` per second; a request spends one token. Allows
+  short bursts up to ``limit`` and a steady rate after that.
+- ``sliding_window``: counts requests in the current fixed window and
+  weights the previous window's count by how much of it still overlaps,
+  approximating a true sliding window with two integers.
+
+``MemoryBackend`` keeps per-process state in an LRU capped at ``max_keys``
+so idle clients are evicted. ``DatabaseBackend`` shares sliding-window
+counters between workers (and hosts) through the ``rate_limits`` table.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+RateLimitResult = namedtuple('RateLimitResult', 'allowed remaining retry_after')
+
+ALGORITHMS = ('token_bucket', 'sliding_window')
+
+
+def _sliding_estimate(previous, current, elapsed, window):
+    """Requests counted in the sliding window ending now"""
+    return previous * (1.0 - elapsed / window) + current
+
+
+def _sliding_retry_after(previous, current, elapsed, window, limit):
+    """Seconds until one more request would fit in the sliding window"""
+    if current + 1 > limit:
+        # Not before the next window, where this window becomes "previous"
+        remaining = window - elapsed
+        if current == 0:
+            return remaining
+        fraction = max(0.0, 1.0 - (limit - 1) / current)
+        return remaining + fraction * window
+    if previous <= 0:
+        return 0.0
+    # previous * (1 - t / window) + current <= limit - 1
+    needed = 1.0 - (limit - 1 - current) / previous
+    return max(0.0, needed * window - elapsed)
+
+
+class MemoryBackend:
+    """Per-process buckets in an LRU of at most ``max_keys`` clients"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, key, limit, window, algorithm, now):
+        with self._lock:
+            state = self._buckets.get(key)
+            if algorithm == 'token_bucket':
+                state, result = self._token_bucket(state, limit, window, now)
+            else:
+                state, result = self._sliding_window(state, limit, window, now)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def _token_bucket(self, state, limit, window, now):
+        tokens, updated_at = state or (float(limit), now)
+        rate = limit / window
+        tokens = min(float(limit), tokens + (now - updated_at) * rate)
+        if tokens >= 1.0:
+            tokens -= 1.0
+            return (tokens, now), RateLimitResult(True, int(tokens), 0.0)
+        return (tokens, now), RateLimitResult(False, 0, (1.0 - tokens) / rate)
+
+    def _sliding_window(self, state, limit, window, now):
+        window_start = now - (now % window)
+        started, current, previous = state or (window_start, 0, 0)
+        if started != window_start:
+            previous = current if window_start - started == window else 0
+            current = 0
+        elapsed = now - window_start
+        estimate = _sliding_estimate(previous, current, elapsed, window)
+        if estimate + 1 <= limit:
+            current += 1
+            return (window_start, current, previous), RateLimitResult(True, int(limit - estimate - 1), 0.0)
+        retry_after = _sliding_retry_after(previous, current, elapsed, window, limit)
+        return (window_start, current, previous), RateLimitResult(False, 0, retry_after)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class DatabaseBackend:
+    """Sliding-window counters in the ``rate_limits`` table, shared by all workers
+
+    Each check counts itself first and decides from the count it added to,
+    all in one transaction: the upsert holds the window's row lock, so checks
+    of one key from any number of workers are decided one after another.
+    Costs one upsert and one read per check, plus one update to take the hit
+    back when throttled; expired windows are swept every ``cleanup_every``
+    checks.
+    """
+
+    def __init__(self, db=None, cleanup_every=1000):
+        from app.services.database import Database
+        self.db = db or Database()
+        self.cleanup_every = cleanup_every
+        self._checks = 0
+        self._longest_window = 0
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, algorithm, now):
+        window = int(window)
+        window_start = int(now // window * window)
+        previous_start = window_start - window
+        with self.db.transaction():
+            self.db.execute_query(
+                """
+                INSERT INTO rate_limits (bucket_key, window_start, hits) VALUES (%s, %s, 1)
+                ON DUPLICATE KEY UPDATE hits = hits + 1
+                """,
+                (key, window_start)
+            )
+            rows = self.db.execute_query(
+                "SELECT window_start, hits FROM rate_limits WHERE bucket_key = %s AND window_start IN (%s, %s)",
+                (key, window_start, previous_start), fetch=True
+            )
+            counts = {row['window_start']: row['hits'] for row in rows}
+            # Requests counted before this one
+            current = counts.get(window_start, 1) - 1
+            previous = counts.get(previous_start, 0)
+            elapsed = now - window_start
+            estimate = _sliding_estimate(previous, current, elapsed, window)
+            if estimate + 1 <= limit:
+                result = RateLimitResult(True, int(limit - estimate - 1), 0.0)
+            else:
+                # Throttled requests are not counted, as in MemoryBackend
+                self.db.execute_query(
+                    "UPDATE rate_limits SET hits = hits - 1 WHERE bucket_key = %s AND window_start = %s",
+                    (key, window_start)
+                )
+                result = RateLimitResult(False, 0, _sliding_retry_after(previous, current, elapsed, window, limit))
+        self._maybe_cleanup(now, window)
+        return result
+
+    def _maybe_cleanup(self, now, window):
+        with self._lock:
+            self._checks += 1
+            self._longest_window = max(self._longest_window, window)
+            if self._checks % self.cleanup_every:
+                return
+            cutoff = int(now - 2 * self._longest_window)
+        try:
+            self.db.execute_query("DELETE FROM rate_limits WHERE window_start < %s", (cutoff,))
+        except Exception as e:
+            logging.warning(f"Rate limit cleanup failed: {e}")
+
+    def __len__(self):
+        return 0
+
+
+class RateLimiter:
+    """Applies one algorithm over a backend and counts allowed/throttled checks per scope"""
+
+    def __init__(self, backend, algorithm='token_bucket'):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        self.backend = backend
+        self.algorithm = algorithm
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def check(self, scope, client_id, limit, window):
+        """Count one request from ``client_id`` against ``scope``'s limit"""
+        result = self.backend.hit(f"{scope}:{client_id}", limit, window, self.algorithm, time.time())
+        with self._lock:
+            metrics = self._metrics.setdefault(scope, {'allowed': 0, 'throttled': 0, 'last_throttled_at': None})
+            if result.allowed:
+                metrics['allowed'] += 1
+            else:
+                metrics['throttled'] += 1
+                metrics['last_throttled_at'] = time.time()
+        return result
+
+    def stats(self):
+        with self._lock:
+            scopes = {scope: dict(metrics) for scope, metrics in self._metrics.items()}
+        return {
+            'algorithm': self.algorithm,
+            'backend': type(self.backend).__name__,
+            'tracked_keys': len(self.backend),
+            'evictions': getattr(self.backend, 'evictions', 0),
+            'scopes': scopes,
+        }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Process-wide limiter configured by RATE_LIMIT_BACKEND / RATE_LIMIT_ALGORITHM"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                from config.config import Config
+                if Config.RATE_LIMIT_BACKEND == 'database':
+                    backend = DatabaseBackend()
+                    algorithm = 'sliding_window'
+                else:
+                    backend = MemoryBackend(Config.RATE_LIMIT_MAX_KEYS)
+                    algorithm = Config.RATE_LIMIT_ALGORITHM
+                _limiter = RateLimiter(backend, algorithm)
+    return _limiter
+
+
+def limiter_stats():
+    """Throttling metrics, or None before the first rate-limited request"""
+    return _limiter.stats() if _limiter is not None else None
@@ -0,0 +1,82 @@
+"""
+Review aggregates stored on each product
+
+``products.rating_sum`` and ``products.review_count`` follow the product's
+``reviews`` rows. ``Review.create``, ``update`` and ``delete`` adjust them in
+the same transaction as the review write. ``avg_rating`` is set from them in
+the same UPDATE and stays NULL while a product has no reviews.
+
+Search, trending, top-rated and the admin reports read these columns. They
+no longer group ``reviews`` per product, a join that also multiplied
+against ``order_items``. Sorting by rating is then a read of
+``idx_products_status_rating``.
+
+Reviews written outside the model (manual SQL, imports, cascades) leave the
+columns stale. ``backfill`` recomputes them; run it with
+``flask ratings backfill``.
+"""
+import logging
+
+import click
+
+# The average is assigned first: MySQL applies SET assignments left to right,
+# so it still sees the old sums there, as SQLite always does
+_ADJUST = """
+    UPDATE products
+    SET avg_rating = (rating_sum + %s) * 1.0 / NULLIF(review_count + %s, 0),
+        rating_sum = rating_sum + %s,
+        review_count = review_count + %s
+    WHERE id = %s
+"""
+
+
+def adjust(db, product_id, removed=(), added=()):
+    """Move a product's aggregates for ratings leaving (``removed``) and joining (``added``) it
+
+    Call inside the transaction that writes the reviews themselves.
+    """
+    total = sum(added) - sum(removed)
+    count = len(added) - len(removed)
+    if total or count:
+        db.execute_query(_ADJUST, (total, count, total, count, product_id))
+
+
+def backfill(db=None):
+    """Recompute every product's aggregates from ``reviews``; returns the number corrected"""
+    if db is None:
+        from app.services.database import Database
+        db = Database()
+    with db.transaction():
+        rows = db.execute_query("""
+            SELECT p.id, p.rating_sum, p.review_count,
+                   COALESCE(r.rating_sum, 0) as actual_sum, COALESCE(r.review_count, 0) as actual_count
+            FROM products p
+            LEFT JOIN (SELECT product_id, SUM(rating) as rating_sum, COUNT(*) as review_count
+                       FROM reviews GROUP BY product_id) r ON r.product_id = p.id
+        """, fetch=True)
+        # Both sides come from one snapshot; applied as relative changes so
+        # reviews written meanwhile are not lost
+        corrections = []
+        for row in rows:
+            total = int(row['actual_sum']) - int(row['rating_sum'] or 0)
+            count = int(row['actual_count']) - int(row['review_count'] or 0)
+            if total or count:
+                corrections.append((total, count, total, count, row['id']))
+        if corrections:
+            db.execute_many(_ADJUST, corrections)
+    if corrections:
+        logging.warning(f"Rating backfill corrected {len(corrections)} products")
+    return len(corrections)
+
+
+def init_app(app):
+    """Register ``flask ratings``"""
+
+    @app.cli.group('ratings')
+    def ratings_group():
+        """Review aggregates on products"""
+
+    @ratings_group.command('backfill')
+    def backfill_command():
+        """Recompute avg_rating, review_count and rating_sum from reviews"""
+        click.echo(f"Products corrected: {backfill()}")
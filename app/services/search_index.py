@@ -0,0 +1,539 @@
+"""
+In-process inverted index over the active product catalog
+
+Each worker builds the index once at start, from a single scan of
+``products``, and then keeps it current through hooks in
+``Product.create``, ``Product.update`` and ``Product.delete``. Product
+search and name suggestions are answered from memory. Only the returned
+page is hydrated from the database.
+
+Tokens come from the product name (weight 3), the description (2) and the
+category name (1). A query matches when every one of its words is a prefix
+of some token in the product, the same as a boolean-mode FULLTEXT search
+for ``+word*``. Prefixes are expanded with a binary search over the sorted
+vocabulary.
+
+Suggestions come from two ``SuggestionTrie``s (see
+``app.services.autocomplete``), one over product names and one over active
+category names, both ranked by units sold. Sales are logged like product
+writes, so every worker's weights follow them. Category writes bump
+``search_index:categories`` and each worker reloads the (small) category
+list on its next category suggestion.
+
+A write in any worker appends the product id to ``search_index_changes``
+and bumps the ``search_index:products`` counter in the host-wide
+``VersionCounter``. The next search in every other worker sees the new value
+and re-indexes only the products logged since its last sync. Only a worker
+that has fallen behind the pruned end of the log rebuilds from scratch, in
+the background, serving the current index until the rebuild finishes.
+"""
+import re
+import bisect
+import logging
+import threading
+
+from app.services.cache import shared_versions
+from app.services.autocomplete import SuggestionTrie
+
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+CATEGORY_WEIGHT = 1
+
+# Fields whose change requires re-indexing a product
+INDEXED_FIELDS = ('name', 'description', 'category_id', 'price', 'status', 'image_url')
+
+SORT_KEYS = {
+    'price_low': (lambda doc, score: (doc['price'], doc['id']), False),
+    'price_high': (lambda doc, score: (doc['price'], doc['id']), True),
+    'newest': (lambda doc, score: (doc['created_at'], doc['id']), True),
+    'name': (lambda doc, score: (doc['name_key'], doc['id']), False),
+    'relevance': (lambda doc, score: (score, doc['created_at'], doc['id']), True),
+}
+
+_SELECT_SQL = """
+    SELECT p.id, p.name, p.description, p.price, p.category_id, p.image_url, p.created_at,
+           p.status, c.name as category_name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+"""
+_PRODUCTS_SQL = _SELECT_SQL + " WHERE p.status = 'active'"
+_PRODUCT_SQL = _SELECT_SQL + " WHERE p.id = %s"
+_SALES_SQL = """
+    SELECT oi.product_id, SUM(oi.quantity) as units
+    FROM order_items oi
+    JOIN orders o ON oi.order_id = o.id
+    WHERE o.status != 'cancelled'
+    GROUP BY oi.product_id
+"""
+_CATEGORIES_SQL = "SELECT id, name FROM categories WHERE is_active = 1"
+_LOG_SQL = "INSERT INTO search_index_changes (product_id, units) VALUES (%s, %s)"
+_LOG_HEAD_SQL = "SELECT COALESCE(MAX(id), 0) as head FROM search_index_changes"
+_LOG_FIRST_SQL = "SELECT MIN(id) as first FROM search_index_changes"
+_LOG_CHANGES_SQL = "SELECT id, product_id, units FROM search_index_changes WHERE id > %s ORDER BY id"
+_LOG_PRUNE_SQL = "DELETE FROM search_index_changes WHERE id <= %s"
+
+# Change ids are taken at insert but seen at commit, so a reader re-reads
+# this far behind its position for writes that committed out of order
+LOG_OVERLAP = 64
+# Changes kept in the log; a worker further behind than this rebuilds
+LOG_KEEP = 10000
+LOG_PRUNE_EVERY = 1000
+# Products re-read per query when catching up
+CATCH_UP_BATCH = 500
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class SearchIndex:
+    """Postings of token -> {product id: weight} with prefix expansion"""
+
+    def __init__(self, versions=None):
+        self._docs = {}
+        self._postings = {}
+        self._vocab = []
+        self._doc_tokens = {}
+        self._product_suggestions = SuggestionTrie(k=8)
+        self._category_suggestions = SuggestionTrie(k=3)
+        self._category_sales = {}
+        self._categories_synced = None
+        self._lock = threading.RLock()
+        self._versions = versions
+        self._synced = None
+        self._position = 0
+        self._applied = set()
+        self._refresh_lock = threading.Lock()
+        self._rebuilding = False
+        self.ready = False
+
+    @property
+    def versions(self):
+        return self._versions or shared_versions()
+
+    # Building and updating
+
+    def build(self, db=None):
+        """Load every active product; swaps in the new index when done"""
+        if db is None:
+            from app.services.database import Database
+            db = Database()
+        version = self.versions.get('search_index:products')
+        categories_version = self.versions.get('search_index:categories')
+        # Read before the scan: changes logged after it are caught up later
+        position = db.execute_query(_LOG_HEAD_SQL, fetch=True, fetchone=True)['head']
+        fresh = SearchIndex(self._versions)
+        for row in db.iter_query(_PRODUCTS_SQL):
+            fresh._add(row)
+        fresh._vocab = sorted(fresh._postings)
+        fresh._build_suggestions(db)
+        with self._lock:
+            self._docs, self._postings = fresh._docs, fresh._postings
+            self._vocab, self._doc_tokens = fresh._vocab, fresh._doc_tokens
+            self._product_suggestions = fresh._product_suggestions
+            self._category_suggestions = fresh._category_suggestions
+            self._category_sales = fresh._category_sales
+            self._categories_synced = categories_version
+            self._synced = version
+            self._position = position
+            self._applied = set()
+            self.ready = True
+        return len(self._docs)
+
+    def _build_suggestions(self, db):
+        sales = {row['product_id']: int(row['units'] or 0) for row in db.execute_query(_SALES_SQL, fetch=True)}
+        for product_id, doc in self._docs.items():
+            self._category_sales[doc['category_id']] = (
+                self._category_sales.get(doc['category_id'], 0) + sales.get(product_id, 0))
+        self._product_suggestions.build(
+            (('product', product_id), doc['name'], sales.get(product_id, 0), self._suggestion(doc))
+            for product_id, doc in self._docs.items()
+        )
+        self._category_suggestions.build(self._category_items(db.execute_query(_CATEGORIES_SQL, fetch=True)))
+
+    def _category_items(self, rows):
+        return ((('category', row['id']), row['name'], self._category_sales.get(row['id'], 0),
+                 {'id': row['id'], 'name': row['name']})
+                for row in rows)
+
+    def refresh_categories(self, db=None):
+        """Reload category suggestions after a category was added or toggled"""
+        if db is None:
+            from app.services.database import Database
+            db = Database()
+        version = self.versions.get('search_index:categories')
+        with db.primary_reads():
+            rows = db.execute_query(_CATEGORIES_SQL, fetch=True)
+        suggestions = SuggestionTrie(k=3)
+        with self._lock:
+            suggestions.build(self._category_items(rows))
+            self._category_suggestions = suggestions
+            self._categories_synced = version
+
+    def _suggestion(self, doc):
+        return {'id': doc['id'], 'name': doc['name'], 'image_url': doc['image_url'], 'price': doc['price']}
+
+    def _add(self, row):
+        weights = {}
+        for weight, text in ((CATEGORY_WEIGHT, row.get('category_name')),
+                             (DESCRIPTION_WEIGHT, row.get('description')),
+                             (NAME_WEIGHT, row.get('name'))):
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0), weight)
+        product_id = row['id']
+        self._docs[product_id] = {
+            'id': product_id,
+            'name': row['name'],
+            'name_key': (row['name'] or '').lower(),
+            'price': float(row['price'] or 0),
+            'category_id': row['category_id'],
+            'image_url': row.get('image_url'),
+            'created_at': row['created_at'],
+        }
+        self._doc_tokens[product_id] = set(weights)
+        new_tokens = []
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                new_tokens.append(token)
+            postings[product_id] = weight
+        return new_tokens
+
+    def _remove(self, product_id):
+        self._docs.pop(product_id, None)
+        for token in self._doc_tokens.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocab, token)
+                if position < len(self._vocab) and self._vocab[position] == token:
+                    del self._vocab[position]
+
+    def _changed(self, change_id=None):
+        """Tell other workers; ``change_id`` is already applied here, so catching up skips it"""
+        if change_id is not None:
+            self._applied.add(change_id)
+        try:
+            self.versions.bump('search_index:products')
+        except Exception as e:
+            logging.warning(f"Search index version bump failed: {e}")
+
+    def _apply(self, row):
+        entry = ('product', row['id'])
+        self._remove(row['id'])
+        if row.get('status', 'active') == 'active':
+            for token in self._add(row):
+                bisect.insort(self._vocab, token)
+            doc = self._docs[row['id']]
+            self._product_suggestions.upsert(
+                entry, doc['name'], self._product_suggestions.weight(entry), self._suggestion(doc))
+        else:
+            self._product_suggestions.remove(entry)
+
+    def _discard(self, product_id):
+        self._remove(product_id)
+        self._product_suggestions.remove(('product', product_id))
+
+    def upsert(self, row, change_id=None):
+        """Index (or re-index) a product row; inactive products are dropped"""
+        with self._lock:
+            self._apply(row)
+            self._changed(change_id)
+
+    def remove(self, product_id, change_id=None):
+        with self._lock:
+            self._discard(product_id)
+            self._changed(change_id)
+
+    def _sold(self, product_id, quantity):
+        doc = self._docs.get(product_id)
+        if doc is None:
+            return
+        category_id = doc['category_id']
+        self._category_sales[category_id] = self._category_sales.get(category_id, 0) + quantity
+        self._product_suggestions.add_weight(('product', product_id), quantity)
+        self._category_suggestions.add_weight(('category', category_id), quantity)
+
+    def record_sale(self, product_id, quantity, change_id=None):
+        """Move a product (and its category) up the suggestion ranking"""
+        with self._lock:
+            self._sold(product_id, quantity)
+            self._changed(change_id)
+
+    def catch_up(self, db=None):
+        """Re-index the products logged since the last sync
+
+        Returns False, leaving the index as it is, when the log has been
+        pruned past this index's position.
+        """
+        if db is None:
+            from app.services.database import Database
+            db = Database()
+        version = self.versions.get('search_index:products')
+        with db.primary_reads():
+            first = db.execute_query(_LOG_FIRST_SQL, fetch=True, fetchone=True)['first']
+            if first is not None and first > self._position + 1:
+                return False
+            changes = db.execute_query(_LOG_CHANGES_SQL, (max(self._position - LOG_OVERLAP, 0),), fetch=True)
+            with self._lock:
+                fresh = [change for change in changes if change['id'] not in self._applied]
+            # Sales only move suggestion weights; other changes re-read the product
+            product_ids = sorted({change['product_id'] for change in fresh if not change['units']})
+            rows = {}
+            for start in range(0, len(product_ids), CATCH_UP_BATCH):
+                batch = product_ids[start:start + CATCH_UP_BATCH]
+                placeholders = ', '.join(['%s'] * len(batch))
+                for row in db.execute_query(f"{_SELECT_SQL} WHERE p.id IN ({placeholders})", batch, fetch=True):
+                    rows[row['id']] = row
+        with self._lock:
+            for product_id in product_ids:
+                if product_id in rows:
+                    self._apply(rows[product_id])
+                else:
+                    self._discard(product_id)
+            for change in fresh:
+                if change['units']:
+                    self._sold(change['product_id'], change['units'])
+            if changes:
+                self._position = max(self._position, changes[-1]['id'])
+            self._applied.update(change['id'] for change in fresh)
+            self._applied = {change_id for change_id in self._applied
+                             if change_id > self._position - LOG_OVERLAP}
+            self._synced = version
+        return True
+
+    def current(self):
+        """Whether every product write announced so far is applied here"""
+        return not self._rebuilding and self.versions.get('search_index:products') == self._synced
+
+    def _refresh_if_stale(self):
+        if self._rebuilding or self.versions.get('search_index:products') == self._synced:
+            return
+        # One thread catches up; the others keep serving the current index
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if self._rebuilding:
+                return
+            try:
+                if self.catch_up():
+                    return
+            except Exception as e:
+                logging.warning(f"Search index catch-up failed: {e}")
+                return
+            self._rebuilding = True
+        finally:
+            self._refresh_lock.release()
+
+        def rebuild():
+            try:
+                self.build()
+            except Exception as e:
+                logging.error(f"Search index rebuild failed: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._rebuilding = False
+
+        threading.Thread(target=rebuild, name='search-index-rebuild', daemon=True).start()
+
+    # Queries
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_left(self._vocab, prefix + '\uffff')
+        return self._vocab[start:end]
+
+    def _match(self, words):
+        """Product id -> relevance for products matching every word"""
+        scores = None
+        for word in words:
+            best = {}
+            for token in self._expand(word):
+                for product_id, weight in self._postings[token].items():
+                    if weight > best.get(product_id, 0):
+                        best[product_id] = weight
+            if scores is None:
+                scores = best
+            else:
+                scores = {product_id: score + best[product_id]
+                          for product_id, score in scores.items() if product_id in best}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, query='', category_id=None, min_price=None, max_price=None,
+               sort_by='relevance', limit=20, offset=0):
+        """(page of (product id, relevance) pairs, total matches)"""
+        self._refresh_if_stale()
+        words = tokenize(query)
+        with self._lock:
+            scores = self._match(words) if words else dict.fromkeys(self._docs, 0)
+            matches = []
+            for product_id, score in scores.items():
+                doc = self._docs[product_id]
+                if category_id and doc['category_id'] != category_id:
+                    continue
+                if min_price is not None and doc['price'] < min_price:
+                    continue
+                if max_price is not None and doc['price'] > max_price:
+                    continue
+                matches.append((doc, score))
+        key, reverse = SORT_KEYS.get(sort_by, SORT_KEYS['relevance'])
+        matches.sort(key=lambda match: key(*match), reverse=reverse)
+        page = matches[offset:offset + limit]
+        return [(doc['id'], score) for doc, score in page], len(matches)
+
+    def suggest(self, query, limit=8):
+        """Best-selling products with a name word (or run of words) starting with ``query``"""
+        self._refresh_if_stale()
+        return self._product_suggestions.lookup(query, limit)
+
+    def suggest_categories(self, query, limit=3):
+        if self.versions.get('search_index:categories') != self._categories_synced:
+            try:
+                self.refresh_categories()
+            except Exception as e:
+                logging.warning(f"Category suggestions refresh failed: {e}")
+        return self._category_suggestions.lookup(query, limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'products': len(self._docs),
+                'tokens': len(self._postings),
+                'postings': sum(len(postings) for postings in self._postings.values()),
+                'rebuilding': self._rebuilding,
+                'suggestions': len(self._product_suggestions) + len(self._category_suggestions),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """This worker's index, or None when SEARCH_INDEX_ENABLED is off"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from config.config import Config
+                if not Config.SEARCH_INDEX_ENABLED:
+                    return None
+                _index = SearchIndex()
+    return _index
+
+
+def ready_index():
+    """The index if it has finished building, else None (callers fall back to SQL)"""
+    index = get_index()
+    return index if index is not None and index.ready else None
+
+
+def is_current():
+    """False while the index may answer from before the latest product writes"""
+    index = ready_index()
+    return index is None or index.current()
+
+
+def init_app(app):
+    """Build the index in the background so worker start is not delayed"""
+    index = get_index()
+    if index is None:
+        return None
+
+    def build():
+        try:
+            with app.app_context():
+                count = index.build()
+            logging.info(f"Search index built: {count} products")
+        except Exception as e:
+            logging.error(f"Search index build failed: {e}")
+
+    threading.Thread(target=build, name='search-index-build', daemon=True).start()
+    return index
+
+
+def _log_change(db, product_id, units=0):
+    """Append a product (or a sale of ``units`` of it) to the change log; returns the change id, or None if that failed"""
+    try:
+        change_id = db.execute_query(_LOG_SQL, (product_id, units))
+        if change_id and change_id % LOG_PRUNE_EVERY == 0:
+            db.execute_query(_LOG_PRUNE_SQL, (change_id - LOG_KEEP,))
+        return change_id
+    except Exception as e:
+        logging.warning(f"Search index change log for product {product_id} failed: {e}")
+        return None
+
+
+def product_saved(product_id, fields=None):
+    """Hook for Product.create/update: re-index one product"""
+    index = get_index()
+    if index is None:
+        return
+    if fields is not None and not any(field in INDEXED_FIELDS for field in fields):
+        return
+    from app.services.database import Database
+    db = Database()
+    change_id = _log_change(db, product_id)
+    if not index.ready:
+        # Still building: the finished build catches up from the log
+        index._changed()
+        return
+    try:
+        row = db.execute_query(_PRODUCT_SQL, (product_id,), fetch=True, fetchone=True)
+        if row is None:
+            index.remove(product_id, change_id)
+        else:
+            index.upsert(row, change_id)
+    except Exception as e:
+        logging.warning(f"Search index update for product {product_id} failed: {e}")
+        # Not marked applied, so the next catch-up here retries it
+        index._changed()
+
+
+def product_deleted(product_id):
+    """Hook for Product.delete"""
+    index = get_index()
+    if index is None:
+        return
+    from app.services.database import Database
+    change_id = _log_change(Database(), product_id)
+    if index.ready:
+        index.remove(product_id, change_id)
+    else:
+        index._changed()
+
+
+def product_sold(product_id, quantity):
+    """Hook for order placement: weight suggestions by units sold"""
+    index = get_index()
+    if index is None:
+        return
+    from app.services.database import Database
+    change_id = _log_change(Database(), product_id, quantity)
+    if index.ready:
+        index.record_sale(product_id, quantity, change_id)
+    else:
+        index._changed()
+
+
+def categories_changed():
+    """Hook for category writes: every worker reloads its category suggestions"""
+    index = get_index()
+    if index is None:
+        return
+    try:
+        index.versions.bump('search_index:categories')
+    except Exception as e:
+        logging.warning(f"Search index version bump failed: {e}")
+
+
+def index_stats():
+    """Index size, or None when the index is disabled"""
+    return _index.stats() if _index is not None else None
@@ -0,0 +1,371 @@
+"""
+Server-side sessions with an in-process front cache and lazy writes
+
+The browser only holds a random session id. Session data lives in a
+backing store, either files sharded into subdirectories by id prefix or the
+``sessions`` table. Each worker also keeps recently used sessions in a
+``TTLCache``. A page view that neither changes the session nor brings it
+close to expiry is served from memory and writes nothing.
+
+Writes bump the session's counter in a host-wide ``VersionCounter`` (see
+``app.services.cache``), so another worker holding an older copy re-reads
+it on the next request. That check costs one memory read. Sessions get their
+own counter file (SESSION_VERSION_FILE): there are far more sessions than
+cached records, and sharing slots with the caches would make page views
+invalidate search and user caches. With the database store across several
+hosts, the front cache only helps within a host, so set SESSION_FRONT_TTL
+short there.
+
+On login the session moves to a new id (``regenerate_session``), so an id
+planted in a visitor's browser before they sign in is never authenticated.
+
+Expired sessions are removed by a daemon sweeper thread. The file store
+records each session's expiry in the file's mtime, so a sweep only stats
+files and never reads them.
+"""
+import os
+import re
+import copy
+import time
+import secrets
+import logging
+import tempfile
+import threading
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+from app.services.cache import TTLCache, VersionCounter
+
+# Ids come from the cookie and name files on disk: token_urlsafe output only
+_SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that records whether it was changed during the request"""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.previous_sid = None
+        self.modified = False
+        self.accessed = False
+
+    def regenerate(self):
+        """Move to a fresh id; the old one is deleted when the response is saved"""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class FileSessionStore:
+    """One file per session under ``directory/<first two id chars>/``"""
+
+    def __init__(self, directory, shards=256):
+        self.directory = directory
+        self.shards = shards
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid[:2], sid)
+
+    def load(self, sid):
+        path = self._path(sid)
+        try:
+            expires_at = os.stat(path).st_mtime
+            if expires_at <= time.time():
+                return None
+            with open(path, 'r', encoding='utf-8') as handle:
+                return handle.read(), expires_at
+        except FileNotFoundError:
+            return None
+
+    def save(self, sid, payload, expires_at):
+        path = self._path(sid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial session
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write(payload)
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def touch(self, sid, expires_at):
+        try:
+            os.utime(self._path(sid), (expires_at, expires_at))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, sid):
+        try:
+            os.unlink(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, now):
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    # Leftover temp files from a crashed write also age out here
+                    if entry.stat().st_mtime <= now or (
+                            entry.name.startswith('.tmp-') and entry.stat().st_ctime < now - 3600):
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class DatabaseSessionStore:
+    """Sessions in the ``sessions`` table, shared by every host"""
+
+    def __init__(self, db=None):
+        from app.services.database import Database
+        self.db = db or Database()
+
+    def load(self, sid):
+        # The session may have been written a moment ago through another worker
+        with self.db.primary_reads():
+            row = self.db.execute_query(
+                "SELECT data, expires_at FROM sessions WHERE sid = %s",
+                (sid,), fetch=True, fetchone=True, prepared=True
+            )
+        if not row or row['expires_at'] <= time.time():
+            return None
+        return row['data'], row['expires_at']
+
+    def save(self, sid, payload, expires_at):
+        self.db.execute_query(
+            """
+            INSERT INTO sessions (sid, data, expires_at) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE data = %s, expires_at = %s
+            """,
+            (sid, payload, expires_at, payload, expires_at)
+        )
+
+    def touch(self, sid, expires_at):
+        self.db.execute_query("UPDATE sessions SET expires_at = %s WHERE sid = %s", (expires_at, sid))
+
+    def delete(self, sid):
+        self.db.execute_query("DELETE FROM sessions WHERE sid = %s", (sid,))
+
+    def sweep(self, now):
+        self.db.execute_query("DELETE FROM sessions WHERE expires_at <= %s", (now,))
+        return None
+
+
+class TieredSessionInterface(SessionInterface):
+    """Flask session interface over a backing store with a per-worker LRU in front"""
+
+    session_class = ServerSession
+    serializer = session_json_serializer
+
+    def __init__(self, store, front_size=4096, front_ttl=300, versions=None):
+        self.store = store
+        self.front = TTLCache(front_size, front_ttl)
+        self._versions = versions
+        self._lock = threading.Lock()
+        self._stats = {'store_reads': 0, 'writes': 0, 'touches': 0, 'skipped_writes': 0,
+                       'deletes': 0, 'swept': 0}
+
+    @property
+    def versions(self):
+        if self._versions is None:
+            self._versions = session_versions()
+        return self._versions
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _drop(self, sid):
+        self.store.delete(sid)
+        self.versions.bump(self._version_key(sid))
+        self.front.delete(sid)
+        self._count('deletes')
+
+    def _version_key(self, sid):
+        return f"session:{sid}"
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def _load(self, sid):
+        version = self.versions.get(self._version_key(sid))
+        entry = self.front.get(sid)
+        if entry is not None:
+            data, expires_at, cached_version = entry
+            if cached_version == version and expires_at > time.time():
+                return data, expires_at
+            self.front.delete(sid)
+        self._count('store_reads')
+        stored = self.store.load(sid)
+        if stored is None:
+            return None
+        payload, expires_at = stored
+        try:
+            data = self.serializer.loads(payload)
+        except (ValueError, TypeError):
+            logging.warning(f"Discarding unreadable session {sid[:8]}...")
+            return None
+        self.front.set(sid, (data, expires_at, version))
+        return data, expires_at
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID_PATTERN.match(sid):
+            try:
+                loaded = self._load(sid)
+            except Exception as e:
+                logging.error(f"Session store read failed: {e}")
+                loaded = None
+            if loaded is not None:
+                data, expires_at = loaded
+                # Copy so request-local changes never leak into the shared front entry
+                return self.session_class(copy.deepcopy(data), sid=sid, expires_at=expires_at)
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+
+        if session.previous_sid:
+            # Regenerated during this request (login): the old id stops working
+            self._drop(session.previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self._drop(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = self._lifetime(app)
+        expires_at = now + lifetime
+        if session.modified or session.new:
+            payload = self.serializer.dumps(dict(session))
+            self.store.save(session.sid, payload, expires_at)
+            version = self.versions.bump(self._version_key(session.sid))
+            self.front.set(session.sid, (self.serializer.loads(payload), expires_at, version))
+            self._count('writes')
+        elif session.expires_at is not None and session.expires_at - now < lifetime / 2:
+            # Extend idle expiry at most twice per lifetime instead of on every view
+            self.store.touch(session.sid, expires_at)
+            version = self.versions.bump(self._version_key(session.sid))
+            self.front.set(session.sid, (dict(session), expires_at, version))
+            self._count('touches')
+        else:
+            # The cookie set with the last write or touch is still current
+            self._count('skipped_writes')
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+    def sweep(self):
+        """Remove expired sessions from the backing store"""
+        try:
+            removed = self.store.sweep(time.time())
+            if removed:
+                self._count('swept', removed)
+        except Exception as e:
+            logging.warning(f"Session sweep failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(stats, store=type(self.store).__name__, front=self.front.stats())
+
+
+_interface = None
+
+
+def session_versions(path=None, slots=65536):
+    """The host-wide VersionCounter for sessions, kept apart from the cache's"""
+    return VersionCounter(path or os.path.join(tempfile.gettempdir(), 'pawfect_session_versions'), slots)
+
+
+def regenerate_session(session):
+    """Give the current session a new id (call on login)
+
+    Flask's cookie sessions need nothing: the cookie is the session.
+    """
+    regenerate = getattr(session, 'regenerate', None)
+    if regenerate is not None:
+        regenerate()
+
+
+def _start_sweeper(interface, interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            interface.sweep()
+
+    thread = threading.Thread(target=run, name='session-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app):
+    """Install the tiered session interface unless SESSION_TYPE is 'cookie'"""
+    global _interface
+    session_type = app.config.get('SESSION_TYPE', 'filesystem')
+    if session_type == 'cookie':
+        return None
+    if session_type == 'database':
+        store = DatabaseSessionStore()
+    else:
+        directory = app.config.get('SESSION_FILE_DIR') or os.path.join(app.instance_path, 'sessions')
+        store = FileSessionStore(directory)
+    interface = TieredSessionInterface(
+        store,
+        front_size=app.config.get('SESSION_FRONT_SIZE', 4096),
+        front_ttl=app.config.get('SESSION_FRONT_TTL', 300),
+        versions=session_versions(app.config.get('SESSION_VERSION_FILE'),
+                                  app.config.get('SESSION_VERSION_SLOTS', 65536)),
+    )
+    app.session_interface = interface
+    interval = app.config.get('SESSION_SWEEP_INTERVAL', 600)
+    if interval:
+        _start_sweeper(interface, interval)
+    _interface = interface
+    return interface
+
+
+def session_stats():
+    """Session store metrics, or None when cookie sessions are in use"""
+    return _interface.stats() if _interface is not None else None
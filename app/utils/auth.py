@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import session, redirect, url_for, flash, request
 from app.models.models import User
+from app.services.session_store import regenerate_session
 
 def login_required(f):
     """Decorator to require user authentication"""
@@ -44,6 +45,7 @@ def is_authenticated():
 
 def login_user(user):
     """Log in a user"""
+    regenerate_session(session)
     session['user_id'] = user.id
     session['user_role'] = user.role
     session['username'] = user.username
@@ -2,37 +2,36 @@
 Simple MySQL Database Utility
 Direct MySQL connection without SQLAlchemy to avoid schema conflicts
 """
-import mysql.connector
 from mysql.connector import Error
 from contextlib import contextmanager
-import os
+from app.services.database import Database as PooledDatabase
 
 class Database:
     def __init__(self):
-        self.config = {
-            'host': 'localhost',
-            'database': 'pawfect_findsdatabase',
-            'user': 'root',
-            'password': '',  # Add password if needed
-            'charset': 'utf8mb4',
-            'autocommit': False
-        }
+        # Borrow connections from the same process-wide pool as the models
+        self.service = PooledDatabase()
     
     @contextmanager
     def get_connection(self):
         """Get database connection with context manager"""
-        connection = None
+        pooled = None
+        broken = False
         try:
-            connection = mysql.connector.connect(**self.config)
+            pooled = self.service.pool.acquire()
+            connection = pooled.raw
+            connection.start_transaction()
             yield connection
         except Error as e:
-            if connection:
-                connection.rollback()
+            if pooled:
+                try:
+                    pooled.raw.rollback()
+                except Error:
+                    broken = True
             print(f"Database error: {e}")
             raise
         finally:
-            if connection and connection.is_connected():
-                connection.close()
+            if pooled:
+                pooled.pool.release(pooled, discard=broken)
     
     @contextmanager
     def get_cursor(self, dictionary=True):
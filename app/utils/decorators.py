@@ -1,14 +1,49 @@
 from functools import wraps
-from flask import session, redirect, url_for, flash, request, abort, jsonify, g
+from flask import session, redirect, url_for, flash, request, abort, jsonify, g, current_app
+from werkzeug.exceptions import TooManyRequests
 from app.models.user import User
+from app.services.rate_limiter import get_limiter
+import math
 import time
-from collections import defaultdict
 from datetime import datetime, timedelta
 import hashlib
 import hmac
 
-# Rate limiting storage (in production, use Redis or similar)
-rate_limit_storage = defaultdict(list)
+# Session key holding the signed id/role/status snapshot of the logged-in user
+SESSION_SNAPSHOT_KEY = '_auth'
+
+def current_user():
+    """The logged-in user's row, loaded at most once per request"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    return User.get_cached(user_id)
+
+def remember_user(user):
+    """Snapshot id/role/status into the session so checks can skip the users table"""
+    session['user_role'] = user['role']
+    session[SESSION_SNAPSHOT_KEY] = {
+        'id': user['id'],
+        'role': user['role'],
+        'status': user['status'],
+        'checked_at': time.time()
+    }
+
+def session_user():
+    """id/role/status of the logged-in user, re-read every SESSION_REVALIDATE_SECONDS"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    snapshot = session.get(SESSION_SNAPSHOT_KEY)
+    max_age = current_app.config.get('SESSION_REVALIDATE_SECONDS', 60)
+    if snapshot and snapshot.get('id') == user_id and time.time() - snapshot.get('checked_at', 0) < max_age:
+        return snapshot
+    user = current_user()
+    if not user:
+        session.pop(SESSION_SNAPSHOT_KEY, None)
+        return None
+    remember_user(user)
+    return session[SESSION_SNAPSHOT_KEY]
 
 # CSRF token management
 def generate_csrf_token():
@@ -21,9 +56,10 @@ def validate_csrf_token(token):
     """Validate CSRF token"""
     return token and session.get('csrf_token') == token
 
-def rate_limit(max_requests=60, window=60):
-    """Rate limiting decorator"""
+def rate_limit(max_requests=60, window=60, scope=None):
+    """Rate limiting decorator (per endpoint unless ``scope`` is shared)"""
     def decorator(f):
+        bucket = scope or f"{f.__module__}.{f.__name__}"
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Get client identifier (IP + User ID if logged in)
@@ -31,22 +67,16 @@ def rate_limit(max_requests=60, window=60):
             if 'user_id' in session:
                 client_id += f"_user_{session['user_id']}"
             
-            now = time.time()
-            # Clean old entries
-            rate_limit_storage[client_id] = [
-                timestamp for timestamp in rate_limit_storage[client_id]
-                if now - timestamp < window
-            ]
-            
-            # Check rate limit
-            if len(rate_limit_storage[client_id]) >= max_requests:
+            result = get_limiter().check(bucket, client_id, max_requests, window)
+            if not result.allowed:
+                retry_after = max(1, math.ceil(result.retry_after))
                 if request.is_json:
-                    return jsonify({'error': 'Rate limit exceeded'}), 429
+                    response = jsonify({'error': 'Rate limit exceeded', 'retry_after': retry_after})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
                 flash('Too many requests. Please try again later.', 'error')
-                return abort(429)
-            
-            # Add current request
-            rate_limit_storage[client_id].append(now)
+                raise TooManyRequests(retry_after=retry_after)
             
             return f(*args, **kwargs)
         return decorated_function
@@ -64,8 +94,8 @@ def validate_session():
             session.clear()
             return False
     
-    # Validate user still exists and is active
-    user = User.get_by_id(session['user_id'])
+    # Validate user still exists and is active (from the snapshot while it is fresh)
+    user = session_user()
     if not user or user['status'] != 'active':
         session.clear()
         return False
@@ -105,7 +135,7 @@ def role_required(required_role):
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('auth.login', next=request.url))
             
-            user = User.get_by_id(session['user_id'])
+            user = session_user()
             if not user or user['role'] != required_role:
                 flash('You do not have permission to access this page.', 'danger')
                 return redirect(url_for('public.landing'))
@@ -131,7 +161,7 @@ def anonymous_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' in session:
-            user = User.get_by_id(session['user_id'])
+            user = session_user()
             if user:
                 if user['role'] == 'admin':
                     return redirect(url_for('admin.dashboard'))
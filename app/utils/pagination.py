@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination
+
+A page is read as ``WHERE <sort key> beyond the last row seen ORDER BY
+<sort key> LIMIT n + 1``, not ``LIMIT n OFFSET k``. Page 5000 then costs the
+same short index range read as page 1. Every ordering ends in the primary
+key, so the key is unique and pages do not shift or repeat while rows are
+added.
+
+Clients only see the boundary row's key as an opaque token signed with
+SECRET_KEY. A tampered or foreign token, or one minted for another sort, is
+ignored and the first page is served. A "prev" token reads the same index
+backwards, and the rows are flipped before they are returned.
+"""
+from datetime import datetime
+from decimal import Decimal
+from itsdangerous import URLSafeSerializer, BadSignature
+
+from config.config import Config
+
+# sort -> (key columns, descending); listing indexes cover these column orders
+KEYSETS = {
+    'newest': (('created_at', 'id'), True),
+    'oldest': (('created_at', 'id'), False),
+    'price_low': (('price', 'id'), False),
+    'price_high': (('price', 'id'), True),
+    'name': (('name', 'id'), False),
+}
+
+# Key values travel as JSON; these columns are turned back into their SQL types
+_DECODERS = {
+    'created_at': datetime.fromisoformat,
+    'price': Decimal,
+    'id': int,
+}
+
+_serializer = URLSafeSerializer(Config.SECRET_KEY, salt='cursor')
+
+
+class Page:
+    """One page of rows and the cursors of the pages either side of it"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None, sort=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.sort = sort
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort, row, direction='next'):
+    """Token for the page after (or before, ``direction='prev'``) ``row``"""
+    columns, _ = KEYSETS[sort]
+    return _serializer.dumps([sort, direction, [_json_value(row[column]) for column in columns]])
+
+
+def decode_cursor(token, sort):
+    """(direction, key values) from a token, or None to start from the first page"""
+    if not token or sort not in KEYSETS:
+        return None
+    try:
+        token_sort, direction, values = _serializer.loads(token)
+        columns, _ = KEYSETS[sort]
+        if token_sort != sort or direction not in ('next', 'prev') or len(values) != len(columns):
+            return None
+        return direction, [_DECODERS.get(column, str)(value) for column, value in zip(columns, values)]
+    except (BadSignature, TypeError, ValueError, ArithmeticError):
+        return None
+
+
+def encode_offset(sort, offset):
+    """Token for a position in an already ranked result list (cached searches)"""
+    return _serializer.dumps([sort, 'offset', [offset]])
+
+
+def decode_offset(token, sort):
+    """The position an ``encode_offset`` token points at, or 0"""
+    if not token:
+        return 0
+    try:
+        token_sort, direction, values = _serializer.loads(token)
+        if token_sort != sort or direction != 'offset':
+            return 0
+        return max(int(values[0]), 0)
+    except (BadSignature, TypeError, ValueError, IndexError):
+        return 0
+
+
+def order_by(sort, alias='', backwards=False):
+    columns, descending = KEYSETS[sort]
+    direction = 'DESC' if descending != backwards else 'ASC'
+    return ', '.join(f"{alias}{column} {direction}" for column in columns)
+
+
+def seek(sort, decoded, alias=''):
+    """(condition, params) selecting the rows past a decoded cursor's key
+
+    Written out as ``a > x OR (a = x AND id > y)`` rather than a row
+    comparison, which MySQL can turn into an index range.
+    """
+    if decoded is None:
+        return '', []
+    direction, values = decoded
+    columns, descending = KEYSETS[sort]
+    operator = '<' if descending != (direction == 'prev') else '>'
+    alternatives = []
+    params = []
+    for position, column in enumerate(columns):
+        terms = [f"{alias}{earlier} = %s" for earlier in columns[:position]]
+        terms.append(f"{alias}{column} {operator} %s")
+        alternatives.append(' AND '.join(terms))
+        params.extend(values[:position + 1])
+    return '(' + ' OR '.join(f"({alternative})" for alternative in alternatives) + ')', params
+
+
+def to_page(rows, sort, decoded, limit, total=None):
+    """Trim a ``limit + 1`` fetch to a Page, restoring order on backward reads"""
+    more = len(rows) > limit
+    rows = list(rows[:limit])
+    if decoded is not None and decoded[0] == 'prev':
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = decoded is not None, more
+    if not rows:
+        return Page([], total=total, sort=sort)
+    return Page(
+        rows,
+        next_cursor=encode_cursor(sort, rows[-1], 'next') if has_next else None,
+        prev_cursor=encode_cursor(sort, rows[0], 'prev') if has_prev else None,
+        total=total,
+        sort=sort,
+    )
+
+
+def fetch_page(db, sql, params, sort, cursor, limit, alias='', total=None):
+    """One keyset page of ``sql``, a SELECT that ends with its WHERE clause"""
+    if sort not in KEYSETS:
+        sort = 'newest'
+    decoded = decode_cursor(cursor, sort)
+    condition, seek_params = seek(sort, decoded, alias)
+    if condition:
+        sql += f" AND {condition}"
+    backwards = decoded is not None and decoded[0] == 'prev'
+    sql += f" ORDER BY {order_by(sort, alias, backwards)} LIMIT %s"
+    rows = db.execute_query(sql, list(params) + seek_params + [limit + 1], fetch=True)
+    return to_page(rows or [], sort, decoded, limit, total)
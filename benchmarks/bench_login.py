@@ -0,0 +1,94 @@
+"""
+Login throughput for candidate password hash costs
+
+For each method, times a single hash, then runs User.authenticate from
+many threads against a seeded local store (as a login burst would) and
+reports logins/s, latency percentiles and how many attempts were shed with
+HashingOverloaded. Pick the highest cost whose single-hash latency and
+burst throughput are acceptable, then set PASSWORD_HASH_METHOD.
+
+    python -m benchmarks.bench_login [--threads 32] [--logins 200] [--method pbkdf2:sha256:600000 ...]
+"""
+import sys
+import time
+import argparse
+import threading
+import statistics
+
+from benchmarks.local_store import create_local_store
+from app.services import password_hasher
+from app.services.password_hasher import PasswordHasher, HashingOverloaded
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+]
+
+
+def _burst(User, email, threads, logins):
+    latencies, shed, failed = [], [], []
+    lock = threading.Lock()
+    per_thread = max(1, logins // threads)
+
+    def worker():
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            try:
+                ok = User.authenticate(email, 'password123')
+            except HashingOverloaded:
+                with lock:
+                    shed.append(1)
+                continue
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with lock:
+                (latencies if ok else failed).append(elapsed)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, len(shed), len(failed), time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help='concurrent login requests')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None, help='hashing pool size (default: CPU count)')
+    parser.add_argument('--max-queue', type=int, default=32)
+    parser.add_argument('--method', action='append', dest='methods')
+    args = parser.parse_args(argv)
+
+    db = create_local_store(users=5, sellers=1, products=5, orders=5, reviews=5)
+    from app.models.user import User
+
+    for method in args.methods or DEFAULT_METHODS:
+        hasher = PasswordHasher(method=method, workers=args.workers, max_queue=args.max_queue, timeout=60)
+        password_hasher._hasher = hasher
+        username = f"bench-{method.replace(':', '-')}"
+        email = f"{username}@example.com"
+        db.execute_query(
+            "INSERT INTO users (username, email, password_hash, first_name, last_name) VALUES (%s, %s, %s, %s, %s)",
+            (username, email, hasher.hash('password123'), 'Bench', 'User')
+        )
+
+        started = time.perf_counter()
+        hasher.hash('password123')
+        single = (time.perf_counter() - started) * 1000.0
+
+        latencies, shed, failed, wall = _burst(User, email, args.threads, args.logins)
+        latencies.sort()
+        line = f"{method:<24} hash {single:7.1f} ms   {len(latencies) / wall:7.1f} logins/s"
+        if latencies:
+            line += (f"   p50 {latencies[len(latencies) // 2]:7.1f} ms"
+                     f"   p95 {latencies[int(len(latencies) * 0.95)]:7.1f} ms")
+        print(f"{line}   shed {shed}   failed {failed}   (workers={hasher.workers})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
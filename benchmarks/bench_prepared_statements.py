@@ -0,0 +1,56 @@
+"""
+Latency of hot primary-key lookups with and without prepared statements
+
+Runs User.get_by_id and Product.get_by_id against the configured MySQL
+database, first with the per-connection statement cache disabled (text
+protocol, parsed on every call) and then enabled.
+
+    python -m benchmarks.bench_prepared_statements [iterations]
+"""
+import sys
+import time
+import statistics
+
+from config.config import Config
+from app.services.database import Database
+from app.models.user import User
+from app.models.product import Product
+
+
+def _measure(label, func, key, iterations):
+    # Warm up the pool (and the statement cache when enabled)
+    for _ in range(20):
+        func(key)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(key)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    print(
+        f"  {label:<22} mean {statistics.mean(samples):8.1f} us"
+        f"   p50 {samples[len(samples) // 2]:8.1f} us"
+        f"   p95 {samples[int(len(samples) * 0.95)]:8.1f} us"
+    )
+
+
+def main(iterations=2000):
+    db = Database()
+    user = db.execute_query("SELECT id FROM users ORDER BY id LIMIT 1", fetch=True, fetchone=True)
+    product = db.execute_query("SELECT id FROM products ORDER BY id LIMIT 1", fetch=True, fetchone=True)
+    if not user or not product:
+        sys.exit("Need at least one user and one product in the database")
+
+    for label, cache_size in (('text protocol', 0), ('prepared (cached)', Config.DB_STATEMENT_CACHE_SIZE or 32)):
+        Config.DB_STATEMENT_CACHE_SIZE = cache_size
+        print(f"{label} (DB_STATEMENT_CACHE_SIZE={cache_size}, {iterations} iterations)")
+        _measure('User.get_by_id', User.get_by_id, user['id'], iterations)
+        _measure('Product.get_by_id', Product.get_by_id, product['id'], iterations)
+
+    stats = Database.pool_stats()[0]
+    print(f"statement cache: {stats['statement_hits']} hits, {stats['statement_misses']} misses, "
+          f"{stats['statement_evictions']} evictions")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,110 @@
+"""
+Product search: in-process index vs the SQL path
+
+Seeds a local store, builds the search index from it, then runs the same
+queries through the SQL matcher (``sql_search``) and the index plus page
+hydration (``indexed_search``), and through both suggestion paths. Reports
+per-query latency percentiles and checks that both paths agree on the match
+count.
+
+On the local store the SQL path is the LIKE fallback; point DB_BACKEND at
+MySQL with a seeded catalog to compare against FULLTEXT instead.
+
+    python -m benchmarks.bench_search [--products 5000] [--repeat 50] [--query salmon ...]
+"""
+import sys
+import time
+import argparse
+
+from flask import Flask
+
+from benchmarks.local_store import create_local_store
+
+DEFAULT_QUERIES = ['salmon', 'dental chew', 'org', 'puppy toy', 'grain-free kitten', '']
+
+
+def _time(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)], result
+
+
+def sql_search(query, limit=20):
+    """First page and total from the SQL matcher Product uses for rating filters and deep pages"""
+    from app.models.product import Product, SEARCH_SORTS
+    from app.services.database import Database
+    db = Database()
+    score, params, source, where, where_params = Product._search_filters(db, query, None, None, None, None)
+    rows = db.execute_query(f'''
+        SELECT p.*, c.name as category_name, {score} as relevance_score
+        FROM {source}
+        JOIN categories c ON p.category_id = c.id
+        WHERE {' AND '.join(where)}
+        ORDER BY {SEARCH_SORTS['relevance']}
+        LIMIT %s
+    ''', params + where_params + [limit], fetch=True)
+    return rows, Product._search_count(db, source, where, where_params)
+
+
+def indexed_search(index, query, limit=20):
+    """First page and total from the in-process index, hydrated like search_cached"""
+    from app.models.product import Product
+    page, total = index.search(query, limit=limit)
+    found = Product.get_many([product_id for product_id, score in page])
+    return [dict(found[product_id], relevance_score=score) for product_id, score in page if product_id in found], total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--query', action='append', dest='queries')
+    args = parser.parse_args(argv)
+
+    print(f"Seeding local store ({args.products} products)...")
+    db = create_local_store(products=args.products)
+    from app.services import search_index
+
+    index = search_index.get_index()
+    started = time.perf_counter()
+    count = index.build(db)
+    print(f"Index built: {count} products in {(time.perf_counter() - started) * 1000.0:.1f} ms  {index.stats()}")
+
+    # A fresh app context per call, as each request gets, so the loader memo does not carry over
+    app = Flask(__name__)
+
+    def in_request(func):
+        def call():
+            with app.app_context():
+                return func()
+        return call
+
+    print(f"{'query':<22} {'sql p50':>9} {'p95':>9} {'index p50':>10} {'p95':>9}   matches")
+    for query in args.queries or DEFAULT_QUERIES:
+        sql_p50, sql_p95, (_, sql_total) = _time(in_request(lambda: sql_search(query)), args.repeat)
+        idx_p50, idx_p95, (_, idx_total) = _time(in_request(lambda: indexed_search(index, query)), args.repeat)
+        agree = '' if sql_total == idx_total else '  (MISMATCH)'
+        print(f"{query!r:<22} {sql_p50:7.2f}ms {sql_p95:7.2f}ms {idx_p50:8.2f}ms {idx_p95:7.2f}ms"
+              f"   {sql_total} / {idx_total}{agree}")
+
+    print()
+    print(f"{'suggest':<22} {'sql p50':>9} {'p95':>9} {'index p50':>10} {'p95':>9}")
+    for query in ('sa', 'sal', 'chew', 'pre'):
+        def sql():
+            return db.execute_query(
+                "SELECT DISTINCT p.name, p.id, p.image_url, p.price FROM products p"
+                " WHERE p.status = 'active' AND p.name LIKE %s ORDER BY p.name LIMIT 8",
+                (f"%{query}%",), fetch=True)
+        sql_p50, sql_p95, _ = _time(sql, args.repeat)
+        idx_p50, idx_p95, _ = _time(lambda: index.suggest(query), args.repeat)
+        print(f"{query!r:<22} {sql_p50:7.2f}ms {sql_p95:7.2f}ms {idx_p50:8.2f}ms {idx_p95:7.2f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+In-process load test against a seeded local store
+
+Builds the real Flask app on the embedded SQLite backend, then drives the
+catalog and search pages from several threads through the test client.
+Reports latency percentiles and how much of each request was spent in the
+database (from the Server-Timing header), so app-side overhead can be
+compared between commits without a MySQL server.
+
+    python -m benchmarks.loadtest [--threads 4] [--requests 500] [--path /search/?q=dog ...]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import statistics
+import importlib.util
+
+from benchmarks.local_store import create_local_store
+
+DEFAULT_PATHS = [
+    '/',
+    '/products',
+    '/products?search=salmon',
+    '/product/1',
+    '/category/1',
+    '/search/suggestions?q=sal',
+    '/search/filters/price-range',
+]
+_DB_TIMING = re.compile(r'db;dur=([\d.]+)')
+
+
+def _load_app():
+    # app.py is shadowed by the app/ package, so load it by path
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+    spec = importlib.util.spec_from_file_location('pawfect_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.create_app()
+
+
+def _worker(app, paths, count, samples, errors):
+    client = app.test_client()
+    for i in range(count):
+        path = paths[i % len(paths)]
+        started = time.perf_counter()
+        try:
+            response = client.get(path)
+        except Exception as e:
+            errors.append((path, type(e).__name__))
+            continue
+        elapsed = (time.perf_counter() - started) * 1000.0
+        if response.status_code >= 400:
+            errors.append((path, response.status_code))
+            continue
+        match = _DB_TIMING.search(response.headers.get('Server-Timing', ''))
+        samples.setdefault(path, []).append((elapsed, float(match.group(1)) if match else 0.0))
+
+
+def _report(path, rows):
+    total = sorted(row[0] for row in rows)
+    db_ms = statistics.mean(row[1] for row in rows)
+    print(
+        f"  {path:<30} n={len(total):<5} p50 {total[len(total) // 2]:7.2f} ms"
+        f"   p95 {total[int(len(total) * 0.95)]:7.2f} ms"
+        f"   db {db_ms:6.2f} ms   app {statistics.mean(total) - db_ms:6.2f} ms"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400, help='requests per thread')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--path', action='append', dest='paths')
+    args = parser.parse_args(argv)
+
+    print(f"Seeding local store ({args.products} products)...")
+    create_local_store(products=args.products)
+
+    app = _load_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    paths = args.paths or DEFAULT_PATHS
+    samples, errors = {}, []
+    threads = [
+        threading.Thread(target=_worker, args=(app, paths, args.requests, samples, errors))
+        for _ in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    done = sum(len(rows) for rows in samples.values())
+    print(f"{done} requests in {wall:.2f}s ({done / wall:.1f} req/s), {len(errors)} errors, {args.threads} threads")
+    for path in paths:
+        if samples.get(path):
+            _report(path, samples[path])
+    for path, status in sorted(set(errors)):
+        print(f"  ERROR {status} {path}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
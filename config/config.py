@@ -12,6 +12,11 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or ''  # Empty password
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'pawfect_findsdatabase'
     
+    # 'mysql', or 'sqlite' to run the same queries against an embedded
+    # database (benchmarks, load tests). SQLITE_PATH ':memory:' keeps it in-process.
+    DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', ':memory:')
+    
     # Mapping for app.services.database.Database
     DATABASE = {
         'host': MYSQL_HOST,
@@ -20,14 +25,108 @@ class Config:
         'database': MYSQL_DB
     }
     
+    # Optional read replica. When MYSQL_REPLICA_HOST is set, SELECTs run with
+    # fetch=True go to the replica; writes, transactions and reads made soon
+    # after the same session wrote stay on the primary. For a local setup run
+    # a second instance and set MYSQL_REPLICA_HOST=127.0.0.1 MYSQL_REPLICA_PORT=3307.
+    MYSQL_REPLICA_HOST = os.environ.get('MYSQL_REPLICA_HOST')
+    MYSQL_REPLICA_PORT = int(os.environ.get('MYSQL_REPLICA_PORT', 3306))
+    MYSQL_REPLICA_USER = os.environ.get('MYSQL_REPLICA_USER') or MYSQL_USER
+    MYSQL_REPLICA_PASSWORD = os.environ.get('MYSQL_REPLICA_PASSWORD', MYSQL_PASSWORD)
+    DATABASE_REPLICA = {
+        'host': MYSQL_REPLICA_HOST,
+        'port': MYSQL_REPLICA_PORT,
+        'user': MYSQL_REPLICA_USER,
+        'password': MYSQL_REPLICA_PASSWORD,
+        'database': MYSQL_DB
+    } if MYSQL_REPLICA_HOST else None
+    # Seconds after a write during which that session reads from the primary
+    DB_READ_YOUR_WRITES_WINDOW = float(os.environ.get('DB_READ_YOUR_WRITES_WINDOW', 5))
+    
+    # Connection pool shared by every Database() in the process.
+    # Size it so that workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) stays
+    # below the server's max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 280))  # seconds, below MySQL wait_timeout
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    # Server-side prepared statements kept per pooled connection (LRU); 0 disables
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 32))
+    
+    # Per-request query instrumentation
+    DB_SERVER_TIMING = os.environ.get('DB_SERVER_TIMING', 'true').lower() in ['true', 'on', '1']
+    DB_DEBUG_PANEL = os.environ.get('DB_DEBUG_PANEL', 'false').lower() in ['true', 'on', '1']  # admins only
+    DB_DEBUG_PANEL_TOP = 10
+    # N+1 detection: 'off', 'log' (warn with call stack) or 'raise' (NPlusOneError)
+    DB_NPLUSONE_MODE = os.environ.get('DB_NPLUSONE_MODE', 'log' if DEBUG else 'off')
+    DB_NPLUSONE_THRESHOLD = int(os.environ.get('DB_NPLUSONE_THRESHOLD', 5))  # repeats of one SELECT shape
+    
+    # Process-wide user cache (by id, email and username); 0 disables
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 2048))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))  # seconds
+    # Memory-mapped counters that tell other workers on this host a cached row changed
+    CACHE_VERSION_FILE = os.environ.get('CACHE_VERSION_FILE')  # default: <tmp>/pawfect_cache_versions
+    CACHE_VERSION_SLOTS = int(os.environ.get('CACHE_VERSION_SLOTS', 4096))
+    
+    # Rate limiting: 'memory' (per worker) or 'database' (shared rate_limits table,
+    # always sliding_window); algorithm 'token_bucket' or 'sliding_window'
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_ALGORITHM = os.environ.get('RATE_LIMIT_ALGORITHM', 'token_bucket')
+    RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 10000))  # idle clients evicted LRU
+    
+    # Password hashing: werkzeug method string including its cost, e.g.
+    # 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000' (pick with benchmarks/bench_login.py).
+    # Hashes run on PASSWORD_HASH_WORKERS threads (default: CPU count); beyond
+    # PASSWORD_HASH_MAX_QUEUE waiting requests, logins fail fast with 503.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))  # seconds
+    
+    # Seconds a session's id/role/status snapshot is trusted before the
+    # user row is re-read (bans and role changes take effect within this window)
+    SESSION_REVALIDATE_SECONDS = int(os.environ.get('SESSION_REVALIDATE_SECONDS', 60))
+    
+    # One-time passcodes: 'database' (shared otp_store table) or 'memory'
+    # (single process only). Codes expire after OTP_TTL seconds and are
+    # burnt after OTP_MAX_ATTEMPTS wrong guesses.
+    OTP_BACKEND = os.environ.get('OTP_BACKEND', 'database')
+    OTP_TTL = int(os.environ.get('OTP_TTL', 600))
+    OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))
+    OTP_LENGTH = int(os.environ.get('OTP_LENGTH', 6))
+    
+    # Answer /search and suggestions from an in-process index built at worker start
+    SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'true').lower() in ['true', 'on', '1']
+    
+    # Search result cache: ranked ids (the first SEARCH_CACHE_MAX_IDS) per query + filters,
+    # dropped on product/review writes or after SEARCH_CACHE_TTL seconds
+    SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 512))
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 120))
+    SEARCH_CACHE_MAX_IDS = int(os.environ.get('SEARCH_CACHE_MAX_IDS', 1000))
+    
+    # Listing counts come from the counters table; every worker recounts and
+    # corrects drift this often (seconds, 0 to disable; see app.services.counters)
+    COUNTER_RECONCILE_INTERVAL = int(os.environ.get('COUNTER_RECONCILE_INTERVAL', 3600))
+    
     # SQLAlchemy configuration (unused in legacy path, kept for compatibility)
     SQLALCHEMY_DATABASE_URI = f'mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False  # Set to True for SQL debugging
     
-    # Session configuration
+    # Session configuration: 'filesystem' (sharded files under SESSION_FILE_DIR,
+    # default instance/sessions), 'database' (sessions table) or 'cookie'
+    # (Flask's signed cookie). Server-side sessions are cached per worker and
+    # only written when changed; expired ones are swept every SESSION_SWEEP_INTERVAL seconds.
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
-    SESSION_TYPE = 'filesystem'
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'filesystem')
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR')
+    SESSION_FRONT_SIZE = int(os.environ.get('SESSION_FRONT_SIZE', 4096))
+    SESSION_FRONT_TTL = int(os.environ.get('SESSION_FRONT_TTL', 300))
+    SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', 600))
+    # Cross-worker session versions; separate from CACHE_VERSION_FILE (default: <tmp>/pawfect_session_versions)
+    SESSION_VERSION_FILE = os.environ.get('SESSION_VERSION_FILE')
+    SESSION_VERSION_SLOTS = int(os.environ.get('SESSION_VERSION_SLOTS', 65536))
     
     # File upload configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -63,11 +162,13 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     SQLALCHEMY_ECHO = False
+    DB_NPLUSONE_MODE = 'off'
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    DB_NPLUSONE_MODE = 'raise'
 
 config = {
     'development': DevelopmentConfig,